@@ -0,0 +1,123 @@
+"""
+Compare the conversion of coala's JSON output to diagnostics with the
+straightforward conversion of each affected range on its own.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.bench_diagnostic
+"""
+import argparse
+import json
+import timeit
+
+from coala_langserver.diagnostic import output_to_diagnostics
+
+
+def synthetic_output(count, ranges=3):
+    """
+    Build a coala JSON output with the number of results, each affecting
+    the number of ranges.
+    """
+    problems = []
+    for index in range(count):
+        line = index % 1000 + 1
+        column = None if index % 4 == 0 else index % 80 + 1
+        problems.append({
+            'affected_code': [{
+                'start': {'line': line + offset, 'column': column},
+                'end': {'line': line + offset, 'column': column},
+            } for offset in range(ranges)],
+            'message': 'E501 line too long ({} > 79 characters)'.format(
+                80 + index % 40),
+            'origin': 'PycodestyleBear (E501)',
+            'severity': index % 3,
+        })
+    return json.dumps({'results': {'python': problems}})
+
+
+def make_diagnostic(section, origin, message, severity,
+                    start_line, start_char, end_line, end_char):
+    """
+    Make a diagnostic of LSP from the values of a coala result, like the
+    conversion did before.
+    """
+    def convert_offset(x): return x - 1 if x else x
+    start_line = convert_offset(start_line)
+    start_char = convert_offset(start_char)
+    end_line = convert_offset(end_line)
+    end_char = convert_offset(end_char)
+    if start_char is None or end_char is None:
+        start_char = 0
+        end_line = start_line + 1
+        end_char = 0
+    return {
+        'severity': 3 - severity,
+        'range': {
+            'start': {
+                'line': start_line,
+                'character': start_char
+            },
+            'end': {
+                'line': end_line,
+                'character': end_char
+            }
+        },
+        'source': 'coala',
+        'message': '[{}] {}: {}'.format(section, origin, message)
+    }
+
+
+def reference_output_to_diagnostics(output):
+    """
+    Convert the output one affected range at a time, like
+    ``output_to_diagnostics`` did before.
+    """
+    res = []
+    for section, problems in json.loads(output)['results'].items():
+        for problem in problems:
+            for code in problem['affected_code']:
+                res.append(make_diagnostic(section,
+                                           problem['origin'],
+                                           problem['message'],
+                                           problem['severity'],
+                                           code['start']['line'],
+                                           code['start']['column'],
+                                           code['end']['line'],
+                                           code['end']['column']))
+    return res
+
+
+def best_of(function, output, repeat):
+    return min(timeit.repeat(lambda: function(output), number=1,
+                             repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--results', default=10000, type=int,
+                        help='number of results in the output')
+    parser.add_argument('--repeat', default=5, type=int,
+                        help='number of timed conversions')
+    args = parser.parse_args()
+
+    output = synthetic_output(args.results)
+    assert (output_to_diagnostics(output) ==
+            reference_output_to_diagnostics(output))
+
+    reference = best_of(reference_output_to_diagnostics, output,
+                        args.repeat)
+    optimised = best_of(output_to_diagnostics, output, args.repeat)
+    # Both parse the same JSON, the conversion is what differs.
+    parse = best_of(json.loads, output, args.repeat)
+    print(json.dumps({
+        'results': args.results,
+        'parse_seconds': parse,
+        'reference_seconds': reference,
+        'optimised_seconds': optimised,
+        'speedup': reference / optimised,
+        'conversion_speedup': (reference - parse) / (optimised - parse),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+from coalib.bears.GlobalBear import GlobalBear
+from coalib.results.Result import Result
+
+
+class BenchDuplicateLineBear(GlobalBear):
+    """
+    Report the non-blank lines that appear in several files.
+    """
+
+    def run(self):
+        seen = {}
+        for filename in sorted(self.file_dict):
+            for line_number, line in enumerate(self.file_dict[filename], 1):
+                if not line.strip():
+                    continue
+                if line in seen and seen[line][0] != filename:
+                    yield Result.from_values(self, 'Duplicated line',
+                                             filename, line_number)
+                seen.setdefault(line, (filename, line_number))
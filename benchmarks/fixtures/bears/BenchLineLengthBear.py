@@ -0,0 +1,20 @@
+from coalib.bears.LocalBear import LocalBear
+from coalib.results.Result import Result
+
+
+class BenchLineLengthBear(LocalBear):
+    """
+    Report the lines longer than the maximum line length.
+    """
+
+    LINE_LOCAL = True
+
+    def run(self, filename, file, max_line_length: int = 79):
+        for line_number, line in enumerate(file, 1):
+            length = len(line.rstrip('\n'))
+            if length > max_line_length:
+                yield Result.from_values(
+                    self, 'Line is longer than {} characters'.format(
+                        max_line_length),
+                    filename, line_number, max_line_length + 1,
+                    line_number, length + 1)
@@ -0,0 +1,18 @@
+from coalib.bears.LocalBear import LocalBear
+from coalib.results.Result import Result
+
+
+class BenchTodoBear(LocalBear):
+    """
+    Report the lines containing a TODO.
+    """
+
+    LINE_LOCAL = True
+
+    def run(self, filename, file):
+        for line_number, line in enumerate(file, 1):
+            column = line.find('TODO')
+            if column >= 0:
+                yield Result.from_values(self, 'TODO found', filename,
+                                         line_number, column + 1,
+                                         line_number, column + 5)
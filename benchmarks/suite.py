@@ -0,0 +1,429 @@
+"""
+Measure the startup time of the server, the latency of the coala shim,
+the throughput of the diagnostic conversion and the didSave to
+publishDiagnostics latency of the server, also while it lints the
+workspace.
+
+Run it from the root of the repository::
+
+    python -m benchmarks.suite --output results.json
+
+Every measurement reports the p50, p95 and p99 of its samples in seconds,
+the results are printed or written as JSON so they can be compared across
+runs.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from pyls.jsonrpc.streams import JsonRpcStreamReader, JsonRpcStreamWriter
+
+from benchmarks.bench_diagnostic import synthetic_output
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+PROJECTS = ('single', 'multiple')
+BACKGROUND_FILES = 200
+CONVERSION_SIZES = (10, 1000, 100000)
+
+COLD_RUN = '''
+import sys, time
+start = time.perf_counter()
+from coala_langserver.coalashim import run_coala_with_specific_file
+run_coala_with_specific_file(sys.argv[1], sys.argv[2])
+print(time.perf_counter() - start, file=sys.stderr)
+'''
+
+IMPORT_RUN = '''
+import sys, time
+start = time.perf_counter()
+import {}
+print(time.perf_counter() - start, file=sys.stderr)
+'''
+IMPORTED_MODULES = ('coala_langserver.langserver',
+                    'coala_langserver.coalashim')
+
+
+def percentiles(samples):
+    """
+    Summarise the samples with the nearest rank percentiles.
+    """
+    ordered = sorted(samples)
+
+    def rank(percent):
+        index = max(0, -(-len(ordered) * percent // 100) - 1)
+        return ordered[int(index)]
+
+    return {
+        'samples': len(ordered),
+        'min': ordered[0],
+        'p50': rank(50),
+        'p95': rank(95),
+        'p99': rank(99),
+        'max': ordered[-1],
+    }
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def sample_source(lines=500, variant=0):
+    """
+    Generate a Python file with some issues for the fixture bears.
+    """
+    source = []
+    for index in range(lines):
+        if index % 50 == variant % 50:
+            source.append('# TODO: revisit block {}\n'.format(index))
+        elif index % 40 == 0:
+            source.append('value_{} = {!r}\n'.format(index, 'x' * 90))
+        else:
+            source.append('value_{0} = {0} * 2\n'.format(index))
+    return ''.join(source)
+
+
+@contextmanager
+def fixture_workspace():
+    """
+    Copy the fixture projects and bears to a temporary directory.
+
+    The copy is shared by all benchmarks of a run, coala keeps the bear
+    modules it imported from there.
+    """
+    directory = tempfile.mkdtemp(prefix='coala-bench-')
+    try:
+        shutil.copytree(FIXTURES, os.path.join(directory, 'fixtures'))
+        yield os.path.join(directory, 'fixtures')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def fixture_project(workspace, name):
+    """
+    Reset the fixture project to a generated ``sample.py`` and a second
+    file for the global bears.
+    """
+    project = os.path.join(workspace, name)
+    with open(os.path.join(project, 'sample.py'), 'w') as file:
+        file.write(sample_source())
+    with open(os.path.join(project, 'other.py'), 'w') as file:
+        file.write(sample_source(100))
+    return project
+
+
+def subprocess_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [path for path in [env.get('PYTHONPATH')] if path])
+    return env
+
+
+def run_timed(code, *args):
+    """
+    Run the code in a fresh interpreter, it prints its time last to stderr.
+    """
+    process = subprocess.run([sys.executable, '-c', code] + list(args),
+                             env=subprocess_env(), stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, check=True)
+    return float(process.stderr.decode().strip().splitlines()[-1])
+
+
+def cold_sample(project, file):
+    """
+    Run the shim once in a fresh interpreter, including its imports.
+    """
+    return run_timed(COLD_RUN, project, file)
+
+
+def initialize_sample(project):
+    """
+    Start the server in a fresh interpreter and time until it answers the
+    initialize request.
+    """
+    body = json.dumps({
+        'jsonrpc': '2.0', 'id': 1, 'method': 'initialize',
+        'params': {'rootUri': 'file://' + project, 'capabilities': {}},
+    }).encode()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'coala_langserver.langserver'],
+        env=subprocess_env(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL)
+    try:
+        process.stdin.write(b'Content-Length: ' + str(len(body)).encode() +
+                            b'\r\n\r\n' + body)
+        process.stdin.flush()
+        length = 0
+        for line in iter(process.stdout.readline, b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.lower() == b'content-length':
+                length = int(value)
+        process.stdout.read(length)
+        elapsed = time.perf_counter() - start
+    finally:
+        process.stdin.close()
+        process.wait(60)
+        process.stdout.close()
+    return elapsed
+
+
+def bench_startup(workspace, samples):
+    project = fixture_project(workspace, 'single')
+    return {
+        'import': {module: percentiles([run_timed(IMPORT_RUN.format(module))
+                                        for _ in range(samples)])
+                   for module in IMPORTED_MODULES},
+        'initialize': percentiles([initialize_sample(project)
+                                   for _ in range(samples)]),
+    }
+
+
+def bench_shim(workspace, samples, cold_samples):
+    from coala_langserver.coalashim import (
+        analyse_file, run_coala_with_specific_file)
+
+    results = {}
+    cwd = os.getcwd()
+    argv = list(sys.argv)
+    try:
+        for name in PROJECTS:
+            project = fixture_project(workspace, name)
+            file = os.path.join(project, 'sample.py')
+            cold = [cold_sample(project, file) for _ in range(cold_samples)]
+            run_coala_with_specific_file(project, file)
+            warm = [timed(run_coala_with_specific_file, project, file)
+                    for _ in range(samples)]
+            analyse_file(file, project)
+            in_process = [timed(analyse_file, file, project)
+                          for _ in range(samples)]
+            results[name] = {
+                'run_coala_with_specific_file': {
+                    'cold': percentiles(cold),
+                    'warm': percentiles(warm),
+                },
+                'analyse_file': {'warm': percentiles(in_process)},
+            }
+    finally:
+        os.chdir(cwd)
+        sys.argv = argv
+    return results
+
+
+def bench_conversion(samples):
+    from coala_langserver.diagnostic import output_to_diagnostics
+
+    results = {}
+    for size in CONVERSION_SIZES:
+        output = synthetic_output(size)
+        size_samples = samples if size < 100000 else max(3, samples // 10)
+        latency = percentiles([timed(output_to_diagnostics, output)
+                               for _ in range(size_samples)])
+        latency['results_per_second'] = size / latency['p50']
+        results[str(size)] = latency
+    return results
+
+
+class PipeClient:
+    """
+    A client talking to a ``LangServer`` over in-memory pipes.
+    """
+
+    def __init__(self, server_class, **server_kwargs):
+        server_read, client_write = os.pipe()
+        client_read, server_write = os.pipe()
+        self._server_wfile = os.fdopen(server_write, 'wb')
+        self.server = server_class(os.fdopen(server_read, 'rb'),
+                                   self._server_wfile, **server_kwargs)
+        self._wfile = os.fdopen(client_write, 'wb')
+        self._rfile = os.fdopen(client_read, 'rb')
+        self._writer = JsonRpcStreamWriter(self._wfile)
+        self._published = {}
+        self._condition = threading.Condition()
+        self._threads = [threading.Thread(target=self.server.start),
+                         threading.Thread(target=self._listen)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def _listen(self):
+        JsonRpcStreamReader(self._rfile).listen(self._received)
+
+    def _received(self, message):
+        if message.get('method') == 'textDocument/publishDiagnostics':
+            with self._condition:
+                uri = message['params']['uri']
+                self._published[uri] = self._published.get(uri, 0) + 1
+                self._condition.notify_all()
+
+    def send(self, method, params, request_id=None):
+        message = {'jsonrpc': '2.0', 'method': method, 'params': params}
+        if request_id is not None:
+            message['id'] = request_id
+        self._writer.write(message)
+
+    def published(self, uri):
+        with self._condition:
+            return self._published.get(uri, 0)
+
+    def wait_published(self, uri, count, timeout=60):
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._published.get(uri, 0) >= count, timeout):
+                raise RuntimeError('No diagnostics published for ' + uri)
+
+    def close(self):
+        self._wfile.close()
+        server, listener = self._threads
+        server.join(10)
+        # The server doesn't close its output, end the listener with it.
+        self._server_wfile.close()
+        listener.join(10)
+        self._rfile.close()
+
+
+def bench_lsp(workspace, samples):
+    from coala_langserver.cache import DiagnosticsCache
+    from coala_langserver.langserver import LangServer
+
+    results = {}
+    for name in PROJECTS:
+        project = fixture_project(workspace, name)
+        file = os.path.join(project, 'sample.py')
+        uri = 'file://' + file
+        for cached in (False, True):
+            client = PipeClient(
+                LangServer, debounce=0,
+                diagnostics_cache=DiagnosticsCache(
+                    max_entries=512 if cached else 0))
+            client.send('initialize', {'rootUri': 'file://' + project,
+                                       'capabilities': {}}, 1)
+            latencies = []
+            for index in range(samples + 1):
+                # Alternate the content, unchanged diagnostics aren't
+                # published again.
+                with open(file, 'w') as sample:
+                    sample.write(sample_source(variant=index % 2))
+                count = client.published(uri) + 1
+                start = time.perf_counter()
+                client.send('textDocument/didSave',
+                            {'textDocument': {'uri': uri}})
+                client.wait_published(uri, count)
+                if index:
+                    latencies.append(time.perf_counter() - start)
+            client.close()
+            results.setdefault(name, {})[
+                'cached' if cached else 'uncached'] = percentiles(
+                    latencies)
+    return results
+
+
+def bench_priority(workspace, samples):
+    """
+    Measure the didSave latency of a file while the server lints a workspace
+    of many files in the background.
+    """
+    from coala_langserver.cache import DiagnosticsCache
+    from coala_langserver.langserver import LINT_WORKSPACE_COMMAND, LangServer
+
+    project = fixture_project(workspace, 'single')
+    background = os.path.join(project, 'background')
+    os.mkdir(background)
+    try:
+        for index in range(BACKGROUND_FILES):
+            with open(os.path.join(background,
+                                   'file_{}.py'.format(index)), 'w') as file:
+                file.write(sample_source(variant=index))
+        file = os.path.join(project, 'sample.py')
+        uri = 'file://' + file
+        results = {}
+        for linting in (False, True):
+            client = PipeClient(
+                LangServer, debounce=0,
+                diagnostics_cache=DiagnosticsCache(max_entries=0))
+            client.send('initialize', {'rootUri': 'file://' + project,
+                                       'capabilities': {}}, 1)
+            latencies = []
+            for index in range(samples + 1):
+                if linting:
+                    # Merged into the running lint if there is one.
+                    client.send('workspace/executeCommand',
+                                {'command': LINT_WORKSPACE_COMMAND}, 2)
+                with open(file, 'w') as sample:
+                    sample.write(sample_source(variant=index % 2))
+                count = client.published(uri) + 1
+                start = time.perf_counter()
+                client.send('textDocument/didSave',
+                            {'textDocument': {'uri': uri}})
+                client.wait_published(uri, count)
+                if index:
+                    latencies.append(time.perf_counter() - start)
+            client.close()
+            results['linting' if linting else 'idle'] = percentiles(
+                latencies)
+        return results
+    finally:
+        shutil.rmtree(background)
+
+
+BENCHMARKS = ('startup', 'shim', 'conversion', 'lsp', 'priority')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--samples', default=20, type=int,
+                        help='number of samples per measurement')
+    parser.add_argument('--cold-samples', default=3, type=int,
+                        help='number of fresh interpreters per project')
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help='comma separated benchmarks to run')
+    parser.add_argument('--output', default=None,
+                        help='file to write the JSON results to')
+    args = parser.parse_args()
+
+    from coalib import VERSION as COALA_VERSION
+    report = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'coala': COALA_VERSION,
+        'benchmarks': {},
+    }
+    with fixture_workspace() as workspace:
+        for benchmark in args.only.split(','):
+            if benchmark == 'startup':
+                result = bench_startup(workspace, args.cold_samples)
+            elif benchmark == 'shim':
+                result = bench_shim(workspace, args.samples,
+                                    args.cold_samples)
+            elif benchmark == 'conversion':
+                result = bench_conversion(args.samples)
+            elif benchmark == 'lsp':
+                result = bench_lsp(workspace, args.samples)
+            elif benchmark == 'priority':
+                result = bench_priority(workspace, args.samples)
+            else:
+                parser.error('Unknown benchmark: {}'.format(benchmark))
+            report['benchmarks'][benchmark] = result
+
+    dump = json.dumps(report, indent=2, sort_keys=True)
+    if args.output is None:
+        print(dump)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(dump + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,9 @@
 #!/usr/local/bin/python3
 
-import traceback
 from coala_langserver import langserver
 
-while True:
-    try:
-        langserver.main()
-    except Exception as e:
-        tb = traceback.format_exc()
-        print('FATAL ERROR: {} {}'.format(e, tb))
+# Crashing analyses are contained by the supervised worker processes, with
+# the thread executor main() serves again after a fatal error. Worker
+# processes import this module too, so only the main process serves.
+if __name__ == '__main__':
+    langserver.main()
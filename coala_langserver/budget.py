@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+import weakref
+from collections import namedtuple
+
+from .log import INFO, WARNING, log
+
+
+class Budget(namedtuple('Budget', 'bear run strikes cool_down')):
+    """
+    The time budgets of the analyses.
+
+    :param bear:      The seconds a bear may run on a file, unbounded if
+                      None.
+    :param run:       The seconds all bears may run on a file, unbounded if
+                      None.
+    :param strikes:   The number of timeouts in a row after which a bear is
+                      disabled for the pattern of the file.
+    :param cool_down: The seconds a bear stays disabled.
+    """
+
+    __slots__ = ()
+
+
+def file_pattern(path):
+    """
+    Get the pattern of the files a bear is disabled for along with the
+    file, the ones of its directory with its extension.
+    """
+    directory, name = os.path.split(path)
+    return os.path.join(directory, '*' + os.path.splitext(name)[1])
+
+
+class _Strikes:
+
+    __slots__ = ('count', 'signature', 'until')
+
+    def __init__(self, signature):
+        self.count = 0
+        self.signature = signature
+        self.until = None
+
+
+class Quarantine:
+    """
+    A thread safe record of the bears that keep exceeding their budget on
+    the files of a pattern.
+
+    Bears are disabled for a pattern until their cool-down passed or the
+    configuration they timed out with changed. Worker processes keep their
+    own records.
+    """
+
+    def __init__(self):
+        self._strikes = {}
+        self._lock = threading.Lock()
+
+    def timed_out(self, bear, file, signature, budget):
+        """
+        Record that the bear exceeded its budget on the file.
+
+        :param signature: Identifies the configuration the bear ran with.
+        :return:          True if the bear is disabled for the pattern of
+                          the file now.
+        """
+        key = bear, file_pattern(file)
+        with self._lock:
+            strikes = self._strikes.get(key)
+            if strikes is None or strikes.signature != signature:
+                strikes = self._strikes[key] = _Strikes(signature)
+            strikes.count += 1
+            if strikes.count < budget.strikes or strikes.until is not None:
+                return False
+            strikes.until = time.monotonic() + budget.cool_down
+        log(bear, 'timed out', strikes.count, 'times in a row, disabling it',
+            'for', key[1], 'for', budget.cool_down, 'seconds',
+            level=WARNING)
+        return True
+
+    def finished(self, bear, file):
+        """
+        Record that the bear finished on the file within its budget.
+        """
+        if not self._strikes:
+            return
+        with self._lock:
+            strikes = self._strikes.get((bear, file_pattern(file)))
+            if strikes is not None and strikes.until is None:
+                strikes.count = 0
+
+    def disabled(self, bear, file, signature):
+        """
+        Get the seconds the bear stays disabled for the file, None if it is
+        enabled.
+        """
+        if not self._strikes:
+            return None
+        key = bear, file_pattern(file)
+        with self._lock:
+            strikes = self._strikes.get(key)
+            if strikes is None or strikes.until is None:
+                return None
+            remaining = strikes.until - time.monotonic()
+            if strikes.signature == signature and remaining > 0:
+                return remaining
+            del self._strikes[key]
+        log('Enabling', bear, 'for', key[1], 'again', level=INFO)
+        return None
+
+    def stats(self):
+        """
+        Get the disabled bears with the patterns they are disabled for.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return sorted('{} {}'.format(*key)
+                          for key, strikes in self._strikes.items()
+                          if strikes.until is not None and
+                          strikes.until > now)
+
+    def clear(self):
+        with self._lock:
+            self._strikes.clear()
+
+
+class RunBudget:
+    """
+    Tracks the budget of the analysis of one file.
+    """
+
+    def __init__(self, budget, signature, registry=None):
+        """
+        :param budget:    The ``Budget`` of the analysis.
+        :param signature: Identifies the configuration of the analysis.
+        :param registry:  The quarantine of the process if None.
+        """
+        self.budget = budget
+        self.signature = signature
+        self.quarantine = quarantine if registry is None else registry
+        self.deadline = (None if budget.run is None
+                         else time.monotonic() + budget.run)
+
+    def skip(self, bear, file=None):
+        """
+        Check whether the bear instance can't run on the file, global bears
+        running on several files aren't disabled for a pattern.
+
+        :return: Why the bear is skipped or None if it can run.
+        """
+        if bear in _running:
+            return 'Skipped as it still runs on another file.'
+        remaining = (None if file is None else
+                     self.quarantine.disabled(bear.name, file,
+                                              self.signature))
+        if remaining is not None:
+            return ('Disabled for {} after timing out repeatedly, it is '
+                    'enabled again in {:.0f} seconds or once the '
+                    'configuration changes.'.format(file_pattern(file),
+                                                    remaining))
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return ('Skipped as the analysis took more than {:g} '
+                    'seconds.'.format(self.budget.run))
+        return None
+
+    def call(self, bear, file, function, *args):
+        """
+        Call the function running the bear instance on the file within the
+        budget. A bear exceeding it keeps running in the background and its
+        results are dropped.
+
+        :return: A tuple telling whether the bear finished along with its
+                 results or why it was stopped.
+        """
+        timeout = self.budget.bear
+        run_limited = False
+        if self.deadline is not None:
+            remaining = max(0, self.deadline - time.monotonic())
+            if timeout is None or remaining < timeout:
+                timeout, run_limited = remaining, True
+        if timeout is None:
+            return True, function(*args)
+
+        outcome = []
+
+        def run():
+            try:
+                outcome.append(function(*args))
+            finally:
+                _running.discard(bear)
+
+        _running.add(bear)
+        thread = threading.Thread(target=run, name='coala-bear')
+        thread.daemon = True
+        thread.start()
+        thread.join(timeout)
+        if not thread.is_alive():
+            if file is not None:
+                self.quarantine.finished(bear.name, file)
+            # An exception of the bear is left to its thread to report.
+            return True, outcome[0] if outcome else None
+
+        log(bear.name, 'exceeded its budget of', timeout, 'seconds',
+            level=WARNING)
+        if run_limited:
+            return False, ('Skipped as the analysis took more than {:g} '
+                           'seconds.'.format(self.budget.run))
+        message = 'Skipped after running for more than {:g} seconds.'.format(
+            timeout)
+        if file is not None and self.quarantine.timed_out(
+                bear.name, file, self.signature, self.budget):
+            message += ' It is disabled for {} for {:g} seconds.'.format(
+                file_pattern(file), self.budget.cool_down)
+        return False, message
+
+
+# The bear instances still running after exceeding their budget.
+_running = weakref.WeakSet()
+
+quarantine = Quarantine()
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from coalib import VERSION as COALA_VERSION
+from coalib.misc import Constants
+
+from .diagnostic import diagnostics_size
+
+
+CONFIG_FILENAMES = ('.coafile', '.coarc')
+
+
+def file_digest(path):
+    """
+    Hash the content of the file, None if it can't be read.
+    """
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha1(file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def bear_versions():
+    """
+    Get the versions of coala and coala-bears the results depend on.
+    """
+    try:
+        from bears import VERSION as BEARS_VERSION
+    except ImportError:
+        BEARS_VERSION = None
+    return COALA_VERSION, BEARS_VERSION
+
+
+def is_config_file(path):
+    """
+    Check whether changing the file may change the sections coala loads.
+    """
+    return os.path.basename(path) in CONFIG_FILENAMES
+
+
+def config_fingerprint(config):
+    """
+    Hash the configuration files coala merges into the sections of a file.
+    """
+    digest = hashlib.sha1(config.encode())
+    for path in (Constants.system_coafile, Constants.user_coafile, config):
+        try:
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+        except OSError:
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def content_digest(lines):
+    """
+    Hash the lines of an unsaved document.
+    """
+    return hashlib.sha1(''.join(lines).encode()).hexdigest()
+
+
+def analysis_key(path, project_dir=None, content=None):
+    """
+    Build the key identifying an analysis of the file or of its unsaved
+    content, None if the file can't be read.
+    """
+    # coala is imported by the first analysis, not by the server.
+    from .coalashim import find_config
+
+    if content is None:
+        content = file_digest(path)
+        if content is None:
+            return None
+    else:
+        content = content_digest(content)
+    config = config_fingerprint(find_config(path, project_dir))
+    return path, content, config, bear_versions()
+
+
+class DiagnosticsCache:
+    """
+    A thread safe LRU cache of the diagnostics of analysed files.
+
+    It is bounded by the number of entries and by the estimated size of the
+    cached diagnostics; the least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Get the diagnostics cached for the key or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, diagnostics):
+        """
+        Cache the diagnostics for the key.
+        """
+        diagnostics = list(diagnostics or [])
+        size = diagnostics_size(diagnostics)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (diagnostics, size)
+            self.size += size
+            while (len(self._entries) > self.max_entries or
+                   self.size > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def discard(self, path):
+        """
+        Drop the diagnostics cached for any version of the file.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self.size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Get the counters of the cache.
+        """
+        with self._lock:
+            return {'entries': len(self._entries),
+                    'bytes': self.size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
@@ -1,11 +1,30 @@
 import sys
 import os
 import io
+import json
+import queue
+from collections import OrderedDict
 from contextlib import redirect_stdout
 
 from coalib import coala
+from coalib.collecting.Collectors import collect_files
+from coalib.output.JSONEncoder import create_json_encoder
+from coalib.output.printers.ListLogPrinter import ListLogPrinter
+from coalib.processes.BearRunning import (
+    get_global_dependency_results, run_global_bear, run_local_bear)
+from coalib.processes.Processing import (
+    check_result_ignore, get_file_dict, instantiate_bears,
+    yield_ignore_ranges)
+from coalib.results.Result import Result
+from coalib.results.RESULT_SEVERITY import RESULT_SEVERITY
+from coalib.settings.ConfigurationGathering import find_user_config
+from coalib.settings.Setting import glob_list
 
-from .log import log
+from .log import DEBUG, ERROR, WARNING, log
+from .budget import RunBudget
+from .config import config_cache, config_signature, section_matches
+from .registry import bear_registry
+from .stats import stats
 
 
 def run_coala_with_specific_file(working_dir, file):
@@ -20,11 +39,451 @@ def run_coala_with_specific_file(working_dir, file):
     if retval == 1:
         output = f.getvalue()
         if output:
-            log('Output =', output)
+            log('Output =', output, level=DEBUG)
         else:
-            log('No results for the file')
+            log('No results for the file', level=DEBUG)
     elif retval == 0:
-        log('No issues found')
+        log('No issues found', level=DEBUG)
     else:
-        log('Exited with:', retval)
+        log('Exited with:', retval, level=ERROR)
     return output
+
+
+class AnalysisCancelled(Exception):
+    """
+    Raised inside an analysis once it was cancelled.
+    """
+
+
+def check_cancelled(cancel):
+    """
+    Stop the analysis if the event is set.
+    """
+    if cancel is not None and cancel.is_set():
+        raise AnalysisCancelled()
+
+
+def find_config(file, project_dir=None):
+    """
+    Find the ``.coafile`` for the file, searching upwards from the project
+    directory or from the directory of the file if there is none.
+    """
+    return find_user_config(project_dir or os.path.dirname(file))
+
+
+def file_budget(budget, file, project_dir=None):
+    """
+    Make the ``RunBudget`` of the analyses of the file from the ``Budget``,
+    analyses sharing it share its run budget.
+    """
+    config = find_config(file, project_dir)
+    return RunBudget(budget, config_signature(config) if config else None)
+
+
+def skipped_result(bear, file, message):
+    """
+    Make a result telling that the bear was skipped on the file. It is
+    marked as incomplete, the results of the bear are missing.
+    """
+    result = Result.from_values(bear.name, message, file, 1,
+                                severity=RESULT_SEVERITY.INFO)
+    result.incomplete = True
+    return result
+
+
+def run_local_bears(bears, file, file_dict, message_queue, cancel=None,
+                    budget=None):
+    """
+    Run instantiated local bears on one file of the file dictionary.
+
+    :param cancel: An event checked before each bear, the analysis is
+                   cancelled once it is set.
+    :param budget: The ``RunBudget`` of the file, bears run unbounded if
+                   None. Bears that are skipped for it get a result
+                   telling so instead of theirs.
+    """
+    results = []
+    for bear in bears:
+        check_cancelled(cancel)
+        if budget is None:
+            with stats.timer('bear.' + bear.name):
+                results.extend(run_local_bear(message_queue, 0, results,
+                                              file_dict, bear, file) or [])
+            continue
+        skipped = budget.skip(bear, file)
+        if skipped is None:
+            with stats.timer('bear.' + bear.name):
+                finished, outcome = budget.call(bear, file, run_local_bear,
+                                                message_queue, 0, results,
+                                                file_dict, bear, file)
+            if finished:
+                results.extend(outcome or [])
+                continue
+            skipped = outcome
+        results.append(skipped_result(bear, file, skipped))
+    return results
+
+
+def run_global_bears(bears, message_queue, cancel=None, budget=None,
+                     file=None, skipped_bears=None):
+    """
+    Run instantiated global bears in the order of their dependencies.
+
+    :param cancel:        An event checked before each bear, the analysis
+                          is cancelled once it is set.
+    :param budget:        The ``RunBudget`` of the bears, they run unbounded
+                          if None.
+    :param file:          The file the bears analyse, if it is a single one.
+                          Skipped bears get a result telling so on it.
+    :param skipped_bears: A list the bears skipped on several files are
+                          appended to with why they were skipped.
+    """
+    results = []
+    global_result_dict = {}
+    for bear in bears:
+        check_cancelled(cancel)
+        dependency_results = get_global_dependency_results(
+            global_result_dict, bear)
+        if dependency_results is False:
+            continue
+        skipped = None if budget is None else budget.skip(bear, file)
+        if skipped is None:
+            with stats.timer('bear.' + bear.name):
+                if budget is None:
+                    finished, bear_results = True, run_global_bear(
+                        message_queue, 0, bear, dependency_results)
+                else:
+                    finished, bear_results = budget.call(
+                        bear, file, run_global_bear, message_queue, 0, bear,
+                        dependency_results)
+            if finished:
+                bear_results = bear_results or []
+                global_result_dict[bear.name] = bear_results
+                results.extend(bear_results)
+                continue
+            skipped = bear_results
+        if file is None:
+            log(bear.name, skipped, level=WARNING)
+            if skipped_bears is not None:
+                skipped_bears.append((bear, skipped))
+        else:
+            results.append(skipped_result(bear, file, skipped))
+    return results
+
+
+def filter_ignored(results, file_dict):
+    """
+    Drop the results ignored by comments in the analysed files.
+    """
+    ignore_ranges = list(yield_ignore_ranges(file_dict))
+    return [result for result in results
+            if not check_result_ignore(result, ignore_ranges)]
+
+
+def flush_messages(message_queue, log_printer):
+    while not message_queue.empty():
+        log_printer.log_message(message_queue.get())
+
+
+def analyse_section(section, local_bear_list, global_bear_list, file,
+                    log_printer, content=None, cancel=None, bear_filter=None,
+                    budget=None):
+    """
+    Run the bears of a section on the file in the calling thread.
+
+    :param content:     The lines of the file, read from disk if None.
+    :param cancel:      An event checked before each bear, the analysis is
+                        cancelled once it is set.
+    :param bear_filter: Selects the bear classes to run, all if None.
+    :param budget:      The ``RunBudget`` of the file, bears run unbounded
+                        if None.
+    :return:            The list of results that are not ignored by the
+                        file.
+    """
+    if bear_filter is not None:
+        local_bear_list = list(filter(bear_filter, local_bear_list))
+        global_bear_list = list(filter(bear_filter, global_bear_list))
+        if not local_bear_list and not global_bear_list:
+            return []
+
+    with stats.timer('read'):
+        file_dict = (get_file_dict([file], log_printer) if content is None
+                     else {file: content})
+    if not file_dict:
+        return []
+
+    message_queue = queue.Queue()
+    with stats.timer('instantiate'):
+        local_bears, global_bears = instantiate_bears(section,
+                                                      list(local_bear_list),
+                                                      list(global_bear_list),
+                                                      file_dict,
+                                                      message_queue,
+                                                      console_printer=None)
+
+    try:
+        results = run_local_bears(local_bears, file, file_dict,
+                                  message_queue, cancel, budget)
+        results.extend(run_global_bears(global_bears, message_queue, cancel,
+                                        budget, file))
+    finally:
+        flush_messages(message_queue, log_printer)
+    return filter_ignored(results, file_dict)
+
+
+def enabled_sections(config, log_printer):
+    """
+    Get the enabled sections of the config with their local and global bear
+    classes, none if the config can't be loaded.
+    """
+    try:
+        sections, local_bears, global_bears, targets = config_cache.get(
+            config, log_printer)
+    except Exception as exception:
+        log('Failed to load', config, 'with:', exception,
+            level=WARNING)
+        return []
+
+    return [(section_name, section,
+             local_bears[section_name], global_bears[section_name])
+            for section_name, section in sections.items()
+            if section.is_enabled(targets)]
+
+
+def analyse_file(file, project_dir=None, log_printer=None, content=None,
+                 progress=None, cancel=None, bear_filter=None, budget=None):
+    """
+    Analyse the file with coala inside the calling thread.
+
+    Unlike ``run_coala_with_specific_file`` this does not touch ``sys.argv``,
+    the working directory or stdout, so several files can be analysed in
+    parallel in one process.
+
+    :param file:        The absolute path of the file to analyse.
+    :param project_dir: The directory the ``.coafile`` is searched from.
+    :param log_printer: The sink for coala's log messages, a fresh
+                        ``ListLogPrinter`` if None.
+    :param content:     The lines to analyse instead of the file on disk,
+                        e.g. of an unsaved buffer.
+    :param progress:    Called with the results of the sections finished so
+                        far, like they are returned, whenever a section
+                        finished and other sections are still to run.
+    :param cancel:      An event checked before each bear, the analysis
+                        raises ``AnalysisCancelled`` once it is set.
+    :param bear_filter: Selects the bear classes to run, all if None.
+    :param budget:      The ``Budget`` of the analysis or the ``RunBudget``
+                        it shares with other analyses of the file, bears
+                        run unbounded if None.
+    :return:            A dictionary with the section names as keys and the
+                        lists of their ``Result`` objects as values or None
+                        if there are no results.
+    """
+    log_printer = ListLogPrinter() if log_printer is None else log_printer
+    with stats.timer('config'):
+        config = find_config(file, project_dir)
+        if not config:
+            log('No coafile found for', file, level=DEBUG)
+            return None
+
+        sections = [(section_name, section, local_bears, global_bears)
+                    for section_name, section, local_bears, global_bears
+                    in enabled_sections(config, log_printer)
+                    if section_matches(section, file)]
+    run_budget = budget
+    if budget is not None and not isinstance(budget, RunBudget):
+        run_budget = RunBudget(budget, config_signature(config))
+    results = {}
+    for index, (section_name, section, local_bears, global_bears) in (
+            enumerate(sections, 1)):
+        results[section_name] = analyse_section(section,
+                                                local_bears,
+                                                global_bears,
+                                                file,
+                                                log_printer,
+                                                content,
+                                                cancel,
+                                                bear_filter,
+                                                run_budget)
+        if progress is not None and index < len(sections):
+            progress(dict(results))
+
+    if not any(results.values()):
+        log('No issues found', level=DEBUG)
+        return None
+    return results
+
+
+def prewarm(project_dir=None, log_printer=None):
+    """
+    Look up the installed bear directories and load the sections of the
+    ``.coafile`` of the project with their bears, so the first analysis
+    doesn't wait for it. coala itself is imported along with this module.
+    """
+    log_printer = ListLogPrinter() if log_printer is None else log_printer
+    bear_registry.registered_dirs()
+    if project_dir is None:
+        return
+    config = find_user_config(project_dir)
+    if config:
+        enabled_sections(config, log_printer)
+
+
+def workspace_files(project_dir, log_printer=None):
+    """
+    Collect the files selected by the enabled sections of the ``.coafile``
+    of the project.
+    """
+    log_printer = ListLogPrinter() if log_printer is None else log_printer
+    config = find_user_config(project_dir)
+    if not config:
+        log('No coafile found for', project_dir, level=DEBUG)
+        return []
+
+    files = set()
+    for _, section, _, _ in enabled_sections(config, log_printer):
+        files.update(collect_files(
+            glob_list(section.get('files', '')), log_printer,
+            ignored_file_paths=glob_list(section.get('ignore', ''))))
+    return sorted(files)
+
+
+def analyse_files(files, project_dir=None, log_printer=None, cancel=None,
+                  budget=None):
+    """
+    Analyse several files in one pass inside the calling thread.
+
+    The files are grouped by their ``.coafile`` and the bears of a section
+    are instantiated once for all files it selects, instead of once per
+    file like ``analyse_file`` does.
+
+    :param files:       The absolute paths of the files to analyse.
+    :param project_dir: The directory the ``.coafile`` is searched from.
+    :param log_printer: The sink for coala's log messages, a fresh
+                        ``ListLogPrinter`` if None.
+    :param cancel:      An event checked before each bear, the analysis
+                        raises ``AnalysisCancelled`` once it is set.
+    :param budget:      The ``Budget`` of the analysis of each file, the run
+                        budget doesn't apply to global bears.
+    :return:            An iterator yielding each file selected by a section
+                        with its results, like ``analyse_file`` returns
+                        them, as soon as the file is analysed. Files global
+                        bears report on are yielded once more with all their
+                        results when the global bears finished. Results of
+                        global bears are yielded with each file they
+                        affect, along with their ranges in other files.
+    """
+    log_printer = ListLogPrinter() if log_printer is None else log_printer
+    configs = OrderedDict()
+    found = {}
+    for file in files:
+        search_dir = project_dir or os.path.dirname(file)
+        if search_dir not in found:
+            found[search_dir] = find_user_config(search_dir)
+        configs.setdefault(found[search_dir], []).append(file)
+
+    for config, config_files in configs.items():
+        if not config:
+            log('No coafile found for', len(config_files), 'files',
+                level=DEBUG)
+            continue
+        with stats.timer('config'):
+            sections = enabled_sections(config, log_printer)
+        yield from _analyse_batch(sections, config_files, log_printer,
+                                  cancel, budget, config_signature(config))
+
+
+def _analyse_batch(sections, files, log_printer, cancel, budget=None,
+                   signature=None):
+    """
+    Analyse the files with the sections of one config.
+    """
+    message_queue = queue.Queue()
+    runs = []
+    for section_name, section, local_bear_list, global_bear_list in sections:
+        section_files = {file for file in files
+                         if section_matches(section, file)}
+        if not section_files:
+            continue
+        with stats.timer('instantiate'):
+            local_bears, _ = instantiate_bears(section,
+                                               list(local_bear_list), [], {},
+                                               message_queue,
+                                               console_printer=None)
+        runs.append((section_name, section, local_bears,
+                     list(global_bear_list), section_files))
+
+    has_global_bears = any(run[3] for run in runs)
+    file_dict = {}
+    results = {}
+    for file in files:
+        file_runs = [run for run in runs if file in run[4]]
+        if not file_runs:
+            continue
+        with stats.timer('read'):
+            single_file_dict = get_file_dict([file], log_printer)
+        if not single_file_dict:
+            continue
+
+        file_results = {}
+        run_budget = (None if budget is None
+                      else RunBudget(budget, signature))
+        for section_name, _, local_bears, _, _ in file_runs:
+            file_results[section_name] = filter_ignored(
+                run_local_bears(local_bears, file, single_file_dict,
+                                message_queue, cancel, run_budget),
+                single_file_dict)
+        flush_messages(message_queue, log_printer)
+        if has_global_bears:
+            file_dict.update(single_file_dict)
+            results[file] = file_results
+        yield file, dict(file_results) if any(file_results.values()) else None
+
+    reported = set()
+    for section_name, section, _, global_bear_list, section_files in runs:
+        if not global_bear_list:
+            continue
+        section_file_dict = {file: file_dict[file]
+                             for file in section_files if file in file_dict}
+        with stats.timer('instantiate'):
+            _, global_bears = instantiate_bears(section, [],
+                                                list(global_bear_list),
+                                                section_file_dict,
+                                                message_queue,
+                                                console_printer=None)
+        global_budget = (None if budget is None
+                         else RunBudget(budget._replace(run=None), signature))
+        skipped_bears = []
+        section_results = filter_ignored(
+            run_global_bears(global_bears, message_queue, cancel,
+                             global_budget, skipped_bears=skipped_bears),
+            section_file_dict)
+        # Each file of the section misses the results of the skipped bears.
+        section_results.extend(skipped_result(bear, file, skipped)
+                               for bear, skipped in skipped_bears
+                               for file in sorted(section_file_dict))
+        for result in section_results:
+            for file in {code.file for code in result.affected_code}:
+                if file in results:
+                    results[file][section_name] = (
+                        results[file].get(section_name, []) + [result])
+                    reported.add(file)
+        flush_messages(message_queue, log_printer)
+
+    for file in files:
+        if file in reported:
+            yield file, dict(results[file])
+
+
+def run_coala_on_file(file, project_dir=None, log_printer=None):
+    """
+    Analyse the file like ``analyse_file`` does.
+
+    :return: The results in the format of ``coala --json`` or None if there
+             are none.
+    """
+    results = analyse_file(file, project_dir, log_printer)
+    if results is None:
+        return None
+
+    JSONEncoder = create_json_encoder(use_relpath=False)
+    return json.dumps({'results': results}, cls=JSONEncoder)
@@ -0,0 +1,115 @@
+import os
+import threading
+
+from coalib.misc import Constants
+from coalib.output.Interactions import fail_acquire_settings
+from coalib.parsing.Globbing import fnmatch
+from coalib.settings.ConfigurationGathering import load_configuration
+from coalib.settings.SectionFilling import fill_section
+from coalib.settings.Setting import glob_list
+
+from .log import DEBUG, log
+from .registry import bear_registry
+
+
+def stat_signature(path):
+    """
+    Get what identifies a version of the file on disk, None if it is
+    missing.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def config_signature(config):
+    """
+    Get the signatures of all configuration files merged for the config.
+    """
+    return tuple(stat_signature(path)
+                 for path in (Constants.system_coafile,
+                              Constants.user_coafile,
+                              config))
+
+
+def section_matches(section, file):
+    """
+    Check whether the ``files`` and ``ignore`` settings of the section
+    select the file.
+    """
+    files = glob_list(section.get('files', ''))
+    ignored = glob_list(section.get('ignore', ''))
+    return (bool(files) and fnmatch(file, files) and
+            not (ignored and fnmatch(file, ignored)))
+
+
+def fill_sections(sections, log_printer, registry=bear_registry):
+    """
+    Fill the settings of the sections with the bears of the registry, like
+    ``fill_settings`` of coala does without importing the bears again.
+
+    :return: A tuple holding the local and global bear classes of each
+             section.
+    """
+    local_bears = {}
+    global_bears = {}
+    for section_name, section in sections.items():
+        section_local_bears, section_global_bears = registry.get(section,
+                                                                 log_printer)
+        fill_section(section, fail_acquire_settings, log_printer,
+                     section_local_bears + section_global_bears)
+        local_bears[section_name] = section_local_bears
+        global_bears[section_name] = section_global_bears
+    return local_bears, global_bears
+
+
+class ConfigCache:
+    """
+    A thread safe cache of the resolved sections of each ``.coafile``.
+
+    Sections are loaded and filled with the bears of the registry once per
+    config. They are reloaded when one of the configuration files changes on
+    disk or when the config is invalidated explicitly.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, config, log_printer):
+        """
+        Get the sections of the config.
+
+        :return: A tuple holding the sections, the local and global bear
+                 classes of each section and the targets.
+        """
+        signature = config_signature(config)
+        with self._lock:
+            entry = self._entries.get(config)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        log('Loading configuration', config, level=DEBUG)
+        sections, targets = load_configuration(['--config', config],
+                                               log_printer)
+        local_bears, global_bears = fill_sections(sections, log_printer)
+        loaded = sections, local_bears, global_bears, targets
+        with self._lock:
+            self._entries[config] = (signature, loaded)
+        return loaded
+
+    def invalidate(self, path=None):
+        """
+        Forget the sections loaded from the config, all of them if the path
+        is None or a user wide configuration file.
+        """
+        with self._lock:
+            if path is None or os.path.basename(path) == '.coarc':
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+
+config_cache = ConfigCache()
@@ -1,56 +1,149 @@
+import hashlib
 import json
 
+from .stats import stats
+
+
+def make_range(start_line, start_char, end_line, end_char):
+    """
+    Make a range of LSP from the positions of coala.
+
+    Line position and character offset should be zero-based according to
+    LSP, but row and column positions of coala are None or one-based
+    numbers. coala uses None for convenience, None for a column means the
+    whole line.
+    """
+    if start_line:
+        start_line -= 1
+    if start_char is None or end_char is None:
+        return {
+            'start': {'line': start_line, 'character': 0},
+            'end': {'line': start_line + 1, 'character': 0},
+        }
+    if end_line:
+        end_line -= 1
+    return {
+        'start': {'line': start_line,
+                  'character': start_char - 1 if start_char else start_char},
+        'end': {'line': end_line,
+                'character': end_char - 1 if end_char else end_char},
+    }
+
 
 def output_to_diagnostics(output):
     """
     Turn output to diagnstics.
+
+    The message and severity of a problem are converted once for all of its
+    affected ranges.
     """
     if output is None:
         return None
-    output_json = json.loads(output)['results']
+    with stats.timer('parse'):
+        output_json = json.loads(output)['results']
     res = []
-    for key, problems in output_json.items():
-        section = key
+    append = res.append
+    for section, problems in output_json.items():
         for problem in problems:
-            """
-            Transform RESULT_SEVERITY of coala into DiagnosticSeverity of LSP
-            coala: INFO = 0, NORMAL = 1, MAJOR = 2
-            LSP: Error = 1, Warning = 2, Information = 3, Hint = 4
-            """
+            # coala's INFO, NORMAL and MAJOR are LSP's Information, Warning
+            # and Error.
             severity = 3 - problem['severity']
-            message = problem['message']
-            origin = problem['origin']
-            real_message = '[{}] {}: {}'.format(section, origin, message)
+            message = '[{}] {}: {}'.format(section, problem['origin'],
+                                           problem['message'])
             for code in problem['affected_code']:
-                """
-                Line position and character offset should be zero-based
-                according to LSP, but row and column positions of coala
-                are None or one-based number.
-                coala uses None for convenience. None for column means the
-                whole line while None for line means the whole file.
-                """
-                def convert_offset(x): return x - 1 if x else x
-                start_line = convert_offset(code['start']['line'])
-                start_char = convert_offset(code['start']['column'])
-                end_line = convert_offset(code['end']['line'])
-                end_char = convert_offset(code['end']['column'])
-                if start_char is None or end_char is None:
-                    start_char = 0
-                    end_line = start_line + 1
-                    end_char = 0
-                res.append({
+                start = code['start']
+                end = code['end']
+                append({
                     'severity': severity,
-                    'range': {
-                        'start': {
-                            'line': start_line,
-                            'character': start_char
-                        },
-                        'end': {
-                            'line': end_line,
-                            'character': end_char
-                        }
-                    },
+                    'range': make_range(start['line'], start['column'],
+                                        end['line'], end['column']),
                     'source': 'coala',
-                    'message': real_message
+                    'message': message,
                 })
     return res
+
+
+def results_to_diagnostics(results, path=None):
+    """
+    Turn the coala ``Result`` objects of each section to diagnostics.
+
+    This is the in-process counterpart of ``output_to_diagnostics``, it
+    reads the results directly instead of parsing their JSON dump. Results
+    marked as incomplete mark their diagnostics as well, in their ``data``.
+
+    :param path: The file the diagnostics are published for. Only the
+                 ranges in it are converted if given, results of global
+                 bears can affect several files.
+    """
+    if results is None:
+        return None
+    res = []
+    append = res.append
+    for section, problems in results.items():
+        for problem in problems:
+            severity = 3 - problem.severity
+            message = '[{}] {}: {}'.format(section, problem.origin,
+                                           problem.message)
+            for code in problem.affected_code:
+                if path is not None and code.file != path:
+                    continue
+                start = code.start
+                end = code.end
+                diagnostic = {
+                    'severity': severity,
+                    'range': make_range(start.line, start.column,
+                                        end.line, end.column),
+                    'source': 'coala',
+                    'message': message,
+                }
+                if getattr(problem, 'incomplete', False):
+                    diagnostic['data'] = {'incomplete': True}
+                append(diagnostic)
+    return res
+
+
+def is_complete(diagnostics):
+    """
+    Check that no bear was skipped in the analysis the diagnostics are of,
+    e.g. for exceeding its budget. Only such diagnostics can be reused for
+    the same content.
+    """
+    return not any(diagnostic.get('data', {}).get('incomplete')
+                   for diagnostic in diagnostics or [])
+
+
+def diagnostics_fingerprint(diagnostics):
+    """
+    Hash a list of diagnostics, equal lists get the same fingerprint.
+    """
+    dump = json.dumps(diagnostics or [], sort_keys=True,
+                      separators=(',', ':'))
+    return hashlib.sha1(dump.encode()).digest()
+
+
+def diagnostics_size(diagnostics):
+    """
+    Estimate the memory used by a list of diagnostics in bytes.
+    """
+    return sum(256 + len(diagnostic['message'])
+               for diagnostic in diagnostics)
+
+
+def of_sections(diagnostics, sections):
+    """
+    Select the diagnostics of the sections, by the section name their
+    messages start with.
+    """
+    prefixes = tuple('[{}] '.format(section) for section in sections)
+    return [diagnostic for diagnostic in diagnostics or []
+            if diagnostic['message'].startswith(prefixes)]
+
+
+def merge_sections(previous, diagnostics, sections):
+    """
+    Put the diagnostics of the finished sections in place of their previous
+    ones, the previous diagnostics of the other sections are kept.
+    """
+    prefixes = tuple('[{}] '.format(section) for section in sections)
+    return diagnostics + [diagnostic for diagnostic in previous or []
+                          if not diagnostic['message'].startswith(prefixes)]
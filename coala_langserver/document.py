@@ -0,0 +1,134 @@
+import re
+import threading
+
+
+_LINE = re.compile(r'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+')
+
+
+def split_lines(text):
+    r"""
+    Split the text into lines keeping their line breaks. Only the line
+    breaks of LSP (``\n``, ``\r\n`` and ``\r``) end a line.
+    """
+    return _LINE.findall(text)
+
+
+def utf16_index(line, character):
+    """
+    Convert an LSP character offset, counted in UTF-16 code units, into an
+    index of the line.
+    """
+    units = 0
+    for index, char in enumerate(line):
+        if units >= character:
+            return index
+        units += 2 if ord(char) > 0xFFFF else 1
+    return len(line)
+
+
+class Document:
+    """
+    The text of an open document, kept as a list of lines so an edit only
+    touches the lines it changes.
+    """
+
+    def __init__(self, uri, text, version=None):
+        self.uri = uri
+        self.version = version
+        self.lines = split_lines(text)
+        # The lines analysed last with the diagnostics of their line local
+        # bears and the fingerprint of the configuration they were analysed
+        # with, the base of incremental analyses.
+        self.analysed = None
+
+    @property
+    def text(self):
+        return ''.join(self.lines)
+
+    def size(self):
+        """
+        Estimate the memory used by the text in bytes.
+        """
+        return sum(64 + len(line) for line in self.lines)
+
+    def line(self, line_number):
+        if line_number < len(self.lines):
+            return self.lines[line_number]
+        return ''
+
+    def apply_change(self, change):
+        """
+        Apply a content change of ``textDocument/didChange``. A change
+        without a range replaces the whole text.
+        """
+        text = change['text']
+        if change.get('range') is None:
+            self.lines = split_lines(text)
+            return
+
+        start = change['range']['start']
+        end = change['range']['end']
+        start_line = min(start['line'], len(self.lines))
+        end_line = min(end['line'], len(self.lines))
+        first = self.line(start_line)
+        last = self.line(end_line)
+        before = first[:utf16_index(first, start['character'])]
+        after = last[utf16_index(last, end['character']):]
+        self.lines[start_line:end_line + 1] = split_lines(
+            before + text + after)
+
+    def file(self):
+        """
+        Get the lines the way coala reads them from a file, with universal
+        line breaks.
+        """
+        return tuple(line if '\r' not in line
+                     else line.rstrip('\r\n') + '\n'
+                     for line in self.lines)
+
+
+class DocumentStore:
+    """
+    A thread safe store of the documents open in the client.
+    """
+
+    def __init__(self):
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, uri):
+        return uri in self._documents
+
+    def __len__(self):
+        return len(self._documents)
+
+    def uris(self):
+        with self._lock:
+            return list(self._documents)
+
+    def open(self, uri, text, version=None):
+        with self._lock:
+            self._documents[uri] = Document(uri, text, version)
+            return self._documents[uri]
+
+    def get(self, uri):
+        return self._documents.get(uri)
+
+    def change(self, uri, changes, version=None):
+        """
+        Apply the content changes to the document in order.
+
+        :return: The changed document or None if it is not open.
+        """
+        with self._lock:
+            document = self._documents.get(uri)
+            if document is None:
+                return None
+            for change in changes:
+                document.apply_change(change)
+            document.version = version
+            return document
+
+    def close(self, uri):
+        with self._lock:
+            return self._documents.pop(uri, None)
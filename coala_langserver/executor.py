@@ -0,0 +1,292 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import (
+    CancelledError, Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor)
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from .log import WARNING, log
+
+
+EXECUTOR_MODES = ('thread', 'process')
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def process_context():
+    """
+    Get the multiprocessing context worker processes are started with.
+
+    Forking the threaded server could hand the workers locks that other
+    threads hold, like the import lock while coala is warmed up. Where
+    possible workers are forked from a single threaded server process
+    instead, which has coala imported already.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['coala_langserver.coalashim'])
+    return context
+
+
+def create_process_pool(max_workers=None):
+    try:
+        return ProcessPoolExecutor(max_workers, mp_context=process_context())
+    except TypeError:
+        # Python < 3.7 always forks the workers.
+        return ProcessPoolExecutor(max_workers)
+
+
+def run_cancellable(fn, args, kwargs, grace, interval=0.25):
+    """
+    Call the function in a worker process and kill the process once the
+    ``cancel`` event of the call is set and the call doesn't return within
+    the grace period, e.g. as a bear doesn't return.
+    """
+    cancel = kwargs.get('cancel')
+    if cancel is None:
+        return fn(*args, **kwargs)
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(interval):
+            if cancel.is_set():
+                if not done.wait(grace):
+                    os._exit(1)
+                return
+
+    thread = threading.Thread(target=watch, name='coala-cancel')
+    thread.daemon = True
+    thread.start()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        done.set()
+
+
+class SupervisedExecutor(Executor):
+    """
+    A process pool that replaces its worker processes when one of them
+    dies, or after a number of jobs, while the submitting process and its
+    state live on.
+
+    A crashed worker breaks the whole ``ProcessPoolExecutor`` and fails all
+    jobs in flight in it, so the pool is replaced and these jobs are run
+    again one at a time in a pool of their own, where a crash can only be
+    caused by the job itself. Only such crashes count as failed attempts of
+    a job.
+
+    Jobs taking a ``cancel`` event have their worker process killed once
+    the event is set and they don't stop in time. They aren't retried.
+    """
+
+    def __init__(self, max_workers=None, recycle_after=None, retries=1,
+                 cancel_grace=1):
+        """
+        :param max_workers:   The number of worker processes.
+        :param recycle_after: The number of jobs after which the workers
+                              are replaced, never if None.
+        :param retries:       How often a job that crashed its worker is
+                              retried before it fails, too.
+        :param cancel_grace:  The seconds a cancelled job gets to stop before
+                              its worker process is killed.
+        """
+        self.max_workers = max_workers
+        self.recycle_after = recycle_after
+        self.retries = retries
+        self.cancel_grace = cancel_grace
+        self.restarts = 0
+        self.recycled = 0
+        self._pool = None
+        self._jobs = 0
+        self._shutdown = False
+        self._lock = threading.Lock()
+        # The jobs in flight in each pool and, once a pool broke, how many
+        # of them it failed.
+        self._in_flight = {}
+        self._broken = {}
+        self._suspects = deque()
+        self._isolation_pool = None
+        self._isolating = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._submit(future, fn, args, kwargs, self.retries)
+        return future
+
+    def _submit(self, future, fn, args, kwargs, retries):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after '
+                                   'shutdown')
+            if (self._pool is not None and self.recycle_after and
+                    self._jobs >= self.recycle_after):
+                # The running jobs finish in the old workers.
+                self._pool.shutdown(wait=False)
+                self._pool = None
+                self.recycled += 1
+            if self._pool is None:
+                self._pool = create_process_pool(self.max_workers)
+                self._jobs = 0
+            self._jobs += 1
+            pool = self._pool
+            job = self._submit_to(pool, fn, args, kwargs)
+        job.add_done_callback(partial(self._done, future, pool,
+                                      fn, args, kwargs, retries))
+
+    def _submit_to(self, pool, fn, args, kwargs):
+        self._in_flight[pool] = self._in_flight.get(pool, 0) + 1
+        try:
+            job = pool.submit(run_cancellable, fn, args, kwargs,
+                              self.cancel_grace)
+        except BrokenProcessPool as exception:
+            job = Future()
+            job.set_exception(exception)
+        return job
+
+    def _isolate(self, future, fn, args, kwargs, retries):
+        """
+        Queue the job to run alone once the jobs queued before finished.
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after '
+                                   'shutdown')
+            self._suspects.append((future, fn, args, kwargs, retries))
+        self._next_suspect()
+
+    def _next_suspect(self):
+        with self._lock:
+            if self._isolating:
+                return
+            if not self._suspects or self._shutdown:
+                if self._isolation_pool is not None:
+                    self._isolation_pool.shutdown(wait=False)
+                    self._isolation_pool = None
+                return
+            future, fn, args, kwargs, retries = self._suspects.popleft()
+            if self._isolation_pool is None:
+                self._isolation_pool = create_process_pool(1)
+            self._isolating = True
+            pool = self._isolation_pool
+            job = self._submit_to(pool, fn, args, kwargs)
+        job.add_done_callback(partial(self._done, future, pool,
+                                      fn, args, kwargs, retries))
+
+    def _done(self, future, pool, fn, args, kwargs, retries, job):
+        exception = job.exception()
+        broken = isinstance(exception, BrokenProcessPool)
+        with self._lock:
+            alone = self._finished(pool, broken)
+            isolated = pool is self._isolation_pool
+            if isolated:
+                self._isolating = False
+        if broken:
+            self._restart(pool)
+            cancel = kwargs.get('cancel')
+            if cancel is not None and cancel.is_set():
+                exception = CancelledError()
+            elif not alone or retries > 0:
+                try:
+                    self._isolate(future, fn, args, kwargs,
+                                  retries - 1 if alone else retries)
+                    exception = None
+                except RuntimeError as error:
+                    exception = error
+        if isolated:
+            self._next_suspect()
+        if broken and exception is None:
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(job.result())
+
+    def _finished(self, pool, broken):
+        """
+        Record that a job of the pool finished.
+
+        :return: True if the pool broke while the job was the only one in
+                 flight in it, so the job crashed it.
+        """
+        if broken and pool not in self._broken:
+            self._broken[pool] = self._in_flight[pool]
+        alone = self._broken.get(pool) == 1
+        self._in_flight[pool] -= 1
+        if not self._in_flight[pool]:
+            del self._in_flight[pool]
+            self._broken.pop(pool, None)
+        return alone
+
+    def _restart(self, pool):
+        """
+        Drop the broken pool, the next job starts a new one.
+        """
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+            elif self._isolation_pool is pool:
+                self._isolation_pool = None
+            else:
+                return
+            self.restarts += 1
+        log('A worker process died, restarting the workers', level=WARNING)
+        pool.shutdown(wait=False)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._shutdown = True
+            pools = [pool for pool in (self._pool, self._isolation_pool)
+                     if pool is not None]
+            suspects = list(self._suspects)
+            self._suspects.clear()
+        for future, _, _, _, _ in suspects:
+            future.set_exception(RuntimeError(
+                'cannot schedule new futures after shutdown'))
+        for pool in pools:
+            pool.shutdown(wait=wait)
+
+
+def create_executor(mode='thread', max_workers=None, recycle_after=None):
+    """
+    Create the pool that coala analysis jobs are submitted to.
+
+    Both pools fall back to the defaults of ``concurrent.futures`` if no
+    number of workers is given. Processes are supervised, so a crashing
+    analysis can't take the server down.
+
+    :param recycle_after: The number of jobs after which worker processes
+                          are replaced, never if None.
+    """
+    if mode == 'thread':
+        return ThreadPoolExecutor(max_workers=max_workers)
+    elif mode == 'process':
+        return SupervisedExecutor(max_workers, recycle_after)
+    raise ValueError('Unknown executor mode: {}'.format(mode))
+
+
+def shares_memory(executor):
+    """
+    Check whether jobs of the executor run in the process submitting them,
+    so they can call back into it.
+    """
+    return not isinstance(executor, (ProcessPoolExecutor,
+                                     SupervisedExecutor))
+
+
+def create_cancel_event(executor):
+    """
+    Create an event that jobs of the executor can check to notice they were
+    cancelled. Worker processes get a proxy of an event of a shared manager
+    process, started on first use.
+    """
+    global _manager
+    if shares_memory(executor):
+        return threading.Event()
+    with _manager_lock:
+        if _manager is None:
+            _manager = process_context().Manager()
+    return _manager.Event()
@@ -0,0 +1,88 @@
+# Bears of coala-bears checking each line on its own. Other bears can
+# declare it with a ``LINE_LOCAL = True`` class attribute.
+LINE_LOCAL_BEARS = frozenset([
+    'KeywordBear',
+    'LineLengthBear',
+    'SpaceConsistencyBear',
+])
+
+
+def is_line_local(bear):
+    """
+    Check whether the results of the bear class for a line only depend on
+    the line. Global bears never are.
+    """
+    return getattr(bear, 'LINE_LOCAL', bear.__name__ in LINE_LOCAL_BEARS)
+
+
+def is_whole_file(bear):
+    return not is_line_local(bear)
+
+
+def has_ignore_comments(lines):
+    """
+    Check whether the lines may hold coala's ignore comments, which can
+    affect results outside a changed range. It matches like coala does
+    before parsing them.
+    """
+    return any('gnor' in line or 'oqa' in line for line in lines)
+
+
+def changed_lines(old, new):
+    """
+    Find the lines that differ between two versions of a document.
+
+    :return: A tuple ``(start, old_end, new_end)`` telling that the lines
+             ``old[start:old_end]`` were replaced by ``new[start:new_end]``.
+    """
+    start = 0
+    limit = min(len(old), len(new))
+    while start < limit and old[start] == new[start]:
+        start += 1
+    old_end, new_end = len(old), len(new)
+    while (old_end > start and new_end > start and
+           old[old_end - 1] == new[new_end - 1]):
+        old_end -= 1
+        new_end -= 1
+    return start, old_end, new_end
+
+
+def shift_diagnostics(diagnostics, start, old_end, new_end):
+    """
+    Carry diagnostics over an edit replacing the lines from start to
+    old_end with the ones from start to new_end.
+
+    Diagnostics above the edit are kept, the ones below are moved by the
+    number of lines added or removed and the ones on changed lines are
+    dropped.
+    """
+    delta = new_end - old_end
+    shifted = []
+    for diagnostic in diagnostics:
+        first = diagnostic['range']['start']
+        last = diagnostic['range']['end']
+        if last['line'] < start or (last['line'] == start and
+                                    last['character'] == 0 and
+                                    first['line'] < start):
+            shifted.append(diagnostic)
+        elif first['line'] >= old_end:
+            shifted.append(offset_diagnostic(diagnostic, delta))
+    return shifted
+
+
+def offset_diagnostic(diagnostic, lines):
+    """
+    Move a diagnostic down by a number of lines.
+    """
+    if not lines:
+        return diagnostic
+    first = diagnostic['range']['start']
+    last = diagnostic['range']['end']
+    moved = dict(diagnostic)
+    moved['range'] = {
+        'start': {'line': first['line'] + lines,
+                  'character': first['character']},
+        'end': {'line': last['line'] + lines,
+                'character': last['character']},
+    }
+    return moved
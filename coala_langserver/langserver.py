@@ -1,17 +1,207 @@
 import sys
+import asyncio
 import argparse
 import socketserver
+import threading
+import time
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 
-from pyls.jsonrpc.endpoint import Endpoint
+from pyls.jsonrpc.endpoint import Endpoint, CANCEL_METHOD
 from pyls.jsonrpc.dispatchers import MethodDispatcher
+from pyls.jsonrpc.exceptions import (
+    JsonRpcInvalidParams, JsonRpcRequestCancelled)
 from pyls.jsonrpc.streams import JsonRpcStreamReader
 from pyls.jsonrpc.streams import JsonRpcStreamWriter
 from coala_utils.decorators import enforce_signature
-from .log import log
-from .coalashim import run_coala_with_specific_file
-from .uri import path_from_uri
-from .diagnostic import output_to_diagnostics
+from .log import DEBUG, ERROR, LEVELS, WARNING, configure, log
+from .executor import (
+    create_cancel_event, create_executor, shares_memory, EXECUTOR_MODES)
+from .budget import Budget, quarantine
+from .cache import DiagnosticsCache, analysis_key, is_config_file
+from .scheduler import AnalysisScheduler
+from .document import DocumentStore
+from .state import SessionState, resident_memory
+from .store import DiagnosticsStore, default_cache_dir, workspace_store_path
+from .uri import path_from_uri, uri_from_path
+from .diagnostic import (
+    diagnostics_fingerprint, is_complete, merge_sections, of_sections,
+    results_to_diagnostics)
+from .incremental import (
+    changed_lines, has_ignore_comments, is_line_local, is_whole_file,
+    offset_diagnostic, shift_diagnostics)
+from .stats import log_periodically, stats
+from .transport import open_stdio, serve_stream
+
+
+LINT_WORKSPACE_COMMAND = 'coala.lintWorkspace'
+BATCH = 'batch'
+FILE_DELETED = 3
+
+
+def diagnose_file(path, project_dir, content=None, budget=None,
+                  progress=None, cancel=None):
+    """
+    Analyse the file and turn its results into diagnostics in one job, so
+    only plain diagnostics leave the worker.
+
+    :param budget:   The ``Budget`` of the analysis, unbounded if None.
+    :param progress: Called with the diagnostics of the sections finished so
+                     far and the names of these sections while further
+                     sections run. It can only be given if the job runs in
+                     the server process.
+    :param cancel:   An event that stops the analysis once it is set.
+    """
+    from .coalashim import analyse_file
+
+    on_section = None
+    if progress is not None:
+        def on_section(results):
+            progress(results_to_diagnostics(results), list(results))
+    with stats.timer('analyse'):
+        results = analyse_file(path, project_dir, content=content,
+                               progress=on_section, cancel=cancel,
+                               budget=budget)
+    with stats.timer('convert'):
+        return results_to_diagnostics(results)
+
+
+def diagnose_document(path, project_dir, content, change=None, budget=None,
+                      progress=None, cancel=None):
+    """
+    Analyse the content of an open document, keeping the diagnostics of the
+    line local bears apart.
+
+    :param change:   A tuple of the first and the end line of the content
+                     that changed since the last analysis and the
+                     diagnostics of the line local bears outside of them,
+                     shifted to the content already. Line local bears only
+                     run on the changed lines then, the other bears always
+                     run on the whole content. Everything runs if None.
+    :param budget:   The ``Budget`` of the analysis, unbounded if None. Both
+                     passes share its run budget.
+    :param progress: Called with the diagnostics of the sections finished
+                     so far and the names of these sections while further
+                     sections run.
+    :param cancel:   An event that stops the analysis once it is set.
+    :return:         The diagnostics of all bears and the ones of the line
+                     local bears.
+    """
+    from .coalashim import analyse_file, file_budget
+
+    if change is None:
+        start, end, kept = 0, len(content), []
+    else:
+        start, end, kept = change
+    if budget is not None:
+        budget = file_budget(budget, path, project_dir)
+
+    on_section = None
+    if progress is not None:
+        def on_section(results):
+            progress(results_to_diagnostics(results) +
+                     of_sections(kept, results), list(results))
+    with stats.timer('analyse'):
+        results = analyse_file(path, project_dir, content=content,
+                               progress=on_section, cancel=cancel,
+                               bear_filter=is_whole_file, budget=budget)
+        line_results = None
+        if end > start:
+            line_results = analyse_file(path, project_dir,
+                                        content=content[start:end],
+                                        cancel=cancel,
+                                        bear_filter=is_line_local,
+                                        budget=budget)
+    with stats.timer('convert'):
+        line_local = kept + [offset_diagnostic(diagnostic, start)
+                             for diagnostic in
+                             results_to_diagnostics(line_results) or []]
+        return (results_to_diagnostics(results) or []) + line_local, line_local
+
+
+def incremental_change(document, content, config=None):
+    """
+    Find what changed in the content since the last analysis of the
+    document, as ``diagnose_document`` takes it.
+
+    :param config: The fingerprint of the configuration the content is
+                   analysed with.
+    :return:       The change or None if everything has to be analysed,
+                   e.g. as ignore comments can affect any line, line local
+                   bears were skipped last time or the configuration
+                   changed since.
+    """
+    if document.analysed is None:
+        return None
+    analysed, line_local, analysed_config = document.analysed
+    if (analysed_config != config or not is_complete(line_local) or
+            has_ignore_comments(analysed) or has_ignore_comments(content)):
+        return None
+    start, old_end, new_end = changed_lines(analysed, content)
+    return start, new_end, shift_diagnostics(line_local,
+                                             start, old_end, new_end)
+
+
+def wait_until_idle(idle, cancel=None, interval=0.1):
+    """
+    Block while the idle event is cleared, unless the cancel event is set.
+    """
+    if idle is None or idle.is_set():
+        return
+    with stats.timer('yield'):
+        while not idle.wait(interval):
+            if cancel is not None and cancel.is_set():
+                return
+
+
+def diagnose_files(paths, project_dir, budget=None, progress=None,
+                   cancel=None, idle=None):
+    """
+    Analyse the files in one pass and turn the results of each file into
+    diagnostics as soon as it is analysed.
+
+    :param paths:       The files to analyse, all files selected by the
+                        sections of the project if None.
+    :param project_dir: The directory the ``.coafile`` is searched from.
+    :param budget:      The ``Budget`` of the analysis of each file,
+                        unbounded if None.
+    :param progress:    Called with each path and its diagnostics. It can
+                        only be given if the job runs in the server process.
+    :param cancel:      An event that stops the analysis once it is set.
+    :param idle:        An event the analysis waits for before each file,
+                        so it yields to interactive analyses.
+    :return:            The paths and diagnostics that were not published.
+    """
+    from .coalashim import analyse_files, workspace_files
+
+    if paths is None:
+        paths = workspace_files(project_dir)
+    unpublished = []
+    wait_until_idle(idle, cancel)
+    for path, results in analyse_files(paths, project_dir, cancel=cancel,
+                                       budget=budget):
+        diagnostics = results_to_diagnostics(results, path)
+        if progress is None:
+            unpublished.append((path, diagnostics))
+        else:
+            progress(path, diagnostics)
+        wait_until_idle(idle, cancel)
+    return unpublished
+
+
+def warm_up(project_dir):
+    """
+    Import coala and load the configuration of the project ahead of the
+    first analysis.
+    """
+    try:
+        from .coalashim import prewarm
+        with stats.timer('prewarm'):
+            prewarm(project_dir)
+    except Exception:
+        log('Warming up failed: {}'.format(traceback.format_exc()),
+            level=WARNING)
 
 
 class _StreamHandlerWrapper(socketserver.StreamRequestHandler, object):
@@ -23,10 +213,24 @@ class _StreamHandlerWrapper(socketserver.StreamRequestHandler, object):
 
     def setup(self):
         super(_StreamHandlerWrapper, self).setup()
-        self.delegate = self.DELEGATE_CLASS(self.rfile, self.wfile)
+        self.delegate = self.DELEGATE_CLASS(self.rfile, self.wfile,
+                                            **self.DELEGATE_KWARGS)
 
     def handle(self):
+        log('Client connected from {}'.format(self.client_address),
+            level=DEBUG)
         self.delegate.start()
+        log('Client disconnected from {}'.format(self.client_address),
+            level=DEBUG)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    """
+    A TCP server serving each connection in its own thread.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
 
 
 class LangServer(MethodDispatcher):
@@ -34,16 +238,107 @@ class LangServer(MethodDispatcher):
     Language server for coala base on JSON RPC.
     """
 
-    def __init__(self, rx, tx):
+    def __init__(self, rx, tx, executor=None, diagnostics_cache=None,
+                 debounce=0, max_state_bytes=32 * 1024 * 1024,
+                 cache_dir=None, background_executor=None, budget=None):
+        """
+        :param executor:            The pool the coala analyses are
+                                    submitted to. It is shared with the
+                                    caller if given, otherwise the server
+                                    creates and owns a default one.
+        :param background_executor: The pool the workspace lints are
+                                    submitted to, like ``executor``. The
+                                    default one has a single worker of the
+                                    kind of ``executor``.
+        :param budget:              The ``Budget`` of the analyses, they run
+                                    unbounded if None.
+        :param diagnostics_cache: The ``DiagnosticsCache`` consulted before
+                                  analysing a file, a private one if None.
+        :param debounce:          The seconds to wait for further saves of a
+                                  document before analysing it.
+        :param max_state_bytes:   The approximate memory budget of the
+                                  documents and published diagnostics kept
+                                  for the session.
+        :param cache_dir:         The directory the diagnostics of each
+                                  workspace are stored in across restarts,
+                                  nothing is stored if None.
+        """
         self.root_path = None
         self._jsonrpc_stream_reader = JsonRpcStreamReader(rx)
         self._jsonrpc_stream_writer = JsonRpcStreamWriter(tx)
         self._endpoint = Endpoint(self, self._jsonrpc_stream_writer.write)
         self._dispatchers = []
         self._shutdown = False
+        self._owns_executor = executor is None
+        self._executor = create_executor() if executor is None else executor
+        self._diagnostics_cache = (DiagnosticsCache()
+                                   if diagnostics_cache is None
+                                   else diagnostics_cache)
+        self._owns_background_executor = background_executor is None
+        if background_executor is None:
+            background_executor = create_executor(
+                'thread' if shares_memory(self._executor) else 'process', 1)
+        self._background_executor = background_executor
+        # Jobs look diagnostics up in the server process, they only hand
+        # the analyses to worker processes.
+        self._job_executor = (self._executor
+                              if shares_memory(self._executor)
+                              else ThreadPoolExecutor())
+        self._background_job_executor = (
+            background_executor if shares_memory(background_executor)
+            else ThreadPoolExecutor(max_workers=1))
+        self._scheduler = AnalysisScheduler(
+            self._job_executor, debounce,
+            partial(create_cancel_event, self._executor),
+            self._background_job_executor,
+            partial(create_cancel_event, background_executor))
+        self._documents = DocumentStore()
+        self._lint_workspace = False
+        self._batch = set()
+        self._batch_all = False
+        self._batch_waiters = []
+        self._batch_requests = set()
+        self._batch_lock = threading.Lock()
+        self._linting = False
+        self.suppressed_publishes = 0
+        self._state = SessionState(max_state_bytes, self._evicted)
+        self._publish_lock = threading.Lock()
+        self._cache_dir = cache_dir
+        self._store = None
+        self._budget = budget
 
     def start(self):
-        self._jsonrpc_stream_reader.listen(self._endpoint.consume)
+        try:
+            self._jsonrpc_stream_reader.listen(self.consume)
+        finally:
+            self.close()
+
+    def consume(self, message):
+        """
+        Dispatch a JSON RPC message.
+
+        The endpoint only cancels requests that did not start yet, so
+        ``$/cancelRequest`` for a running workspace lint is handled here.
+        """
+        method = message.get('method')
+        params = message.get('params') or {}
+        if method == CANCEL_METHOD:
+            self._cancel_request(params.get('id'))
+        elif (method == 'workspace/executeCommand' and 'id' in message and
+                params.get('command') == LINT_WORKSPACE_COMMAND):
+            with self._batch_lock:
+                self._batch_requests.add(message['id'])
+        self._endpoint.consume(message)
+
+    def close(self):
+        """
+        Drop the pending analyses once the client is gone, nobody is left to
+        publish their diagnostics to.
+        """
+        self._scheduler.supersede_all()
+        self._drop_batch()
+        if self._store is not None:
+            self._store.close()
 
     def m_initialize(self, **params):
         """
@@ -54,70 +349,539 @@ class LangServer(MethodDispatcher):
             self.root_path = path_from_uri(params['rootUri'])
         elif 'rootPath' in params:
             self.root_path = path_from_uri(params['rootPath'])
+        options = params.get('initializationOptions') or {}
+        self._lint_workspace = bool(options.get('lintWorkspace'))
+        if self._cache_dir is not None and self.root_path is not None:
+            self._store = DiagnosticsStore(
+                workspace_store_path(self._cache_dir, self.root_path))
         return {
             'capabilities': {
-                'textDocumentSync': 1
+                'textDocumentSync': 2,
+                'executeCommandProvider': {
+                    'commands': [LINT_WORKSPACE_COMMAND],
+                },
             }
         }
 
+    def m_initialized(self, **_kwargs):
+        """
+        Serve for the initialized notification.
+
+        coala is only imported once ``initialize`` is answered, it is warmed
+        up in the background now, in the workers too if they run in other
+        processes. The diagnostics stored by the last run for files that are
+        unchanged since are published then. The workspace is linted once if
+        the client asked for it with the ``lintWorkspace`` initialization
+        option.
+        """
+        thread = threading.Thread(target=self._warm_up, name='coala-warm-up')
+        thread.daemon = True
+        thread.start()
+        if not shares_memory(self._executor):
+            self._executor.submit(warm_up, self.root_path)
+        if self._lint_workspace:
+            self.lint()
+
+    def _warm_up(self):
+        warm_up(self.root_path)
+        if self._store is not None:
+            with stats.timer('restore'):
+                self._restore()
+
+    def _restore(self):
+        """
+        Publish the stored diagnostics of the files that are unchanged since
+        they were analysed, unless they are open in the client.
+        """
+        for path in self._store.paths():
+            if self._is_open(path):
+                continue
+            key = analysis_key(path, self.root_path)
+            if key is None:
+                self._store.discard(path)
+                continue
+            diagnostics = self._store.get(key)
+            if diagnostics:
+                self._diagnostics_cache.put(key, diagnostics)
+                self.send_diagnostics(path, diagnostics)
+
+    def m_workspace__execute_command(self, command, arguments=None,
+                                     **_kwargs):
+        """
+        Serve for the workspace/executeCommand request.
+
+        The lint command is answered once the workspace is linted.
+        """
+        if command != LINT_WORKSPACE_COMMAND:
+            raise JsonRpcInvalidParams(
+                'Unknown command: {}'.format(command))
+        return self.lint().result
+
+    def m_text_document__did_open(self, textDocument, **_kwargs):
+        """
+        Serve for the textDocument/didOpen notification.
+        """
+        document = self._documents.open(textDocument['uri'],
+                                        textDocument['text'],
+                                        textDocument.get('version'))
+        self._state.opened(document.uri, document.size())
+        self._analyse(path_from_uri(document.uri), document.file(), document)
+
+    def m_text_document__did_change(self, textDocument,
+                                    contentChanges=(), **_kwargs):
+        """
+        Serve for the textDocument/didChange notification.
+
+        The changes are applied to the open document and its unsaved content
+        is analysed, changes of documents that are not open are ignored.
+        """
+        document = self._documents.change(textDocument['uri'],
+                                          contentChanges,
+                                          textDocument.get('version'))
+        if document is None:
+            log('Ignoring changes of', textDocument['uri'],
+                'as it is not open', level=DEBUG)
+            return
+        self._state.opened(document.uri, document.size())
+        self._analyse(path_from_uri(document.uri), document.file(), document)
+
+    def m_text_document__did_close(self, textDocument, **_kwargs):
+        """
+        Serve for the textDocument/didClose notification.
+        """
+        self._documents.close(textDocument['uri'])
+        self._state.closed(textDocument['uri'])
+
+    def _evicted(self, uri):
+        """
+        Drop the base of incremental analyses of a document evicted from the
+        state. The diagnostics cache is bounded by itself and shared with the
+        lints, so it is left alone.
+        """
+        document = self._documents.get(uri)
+        if document is not None:
+            document.analysed = None
+
     def m_text_document__did_save(self, **params):
         """
-        Serve for did_change request.
+        Serve for did_save request.
+        """
+        with stats.timer('did_save'):
+            uri = params['textDocument']['uri']
+            document = self._documents.get(uri)
+            if document is None:
+                self._analyse(path_from_uri(uri))
+            else:
+                self._analyse(path_from_uri(uri), document.file(), document)
+
+    def m___coala__stats(self, **_kwargs):
         """
-        uri = params['textDocument']['uri']
-        path = path_from_uri(uri)
-        diagnostics = output_to_diagnostics(
-            run_coala_with_specific_file(self.root_path, path))
+        Serve for the $/coala/stats request.
+
+        Answer the timings of the phases in seconds along with the counters
+        of the caches and of the scheduler, and the memory used.
+        """
+        return {
+            'timings': stats.snapshot(),
+            'cache': self._diagnostics_cache.stats(),
+            'scheduler': {
+                'dropped': self._scheduler.dropped,
+                'cancelled': self._scheduler.cancelled,
+                'preempted': self._scheduler.preempted,
+            },
+            'suppressed_publishes': self.suppressed_publishes,
+            'memory': {
+                'resident': resident_memory(),
+                'session': self._state.stats(),
+            },
+            'store': None if self._store is None else self._store.stats(),
+            'quarantined': quarantine.stats(),
+        }
+
+    def _analyse(self, path, content=None, document=None):
+        """
+        Publish the diagnostics of the file or of its unsaved content.
+
+        The lookup in the caches and the analysis are scheduled as one job,
+        so the reader thread can keep serving messages and never reads files
+        or imports coala itself. Diagnostics are published as sections
+        finish and once more when the whole analysis finished.
+
+        :param document: The open document the content is of. Its line local
+                         bears only rerun on the lines changed since its
+                         last analysis then.
+        """
+        start = time.perf_counter()
+        progress = (partial(self._publish_sections, path)
+                    if shares_memory(self._executor) else None)
+        self._scheduler.schedule(path, self._diagnose,
+                                 (path, content, document),
+                                 partial(self._analysis_done,
+                                         path, content, start,
+                                         document=document),
+                                 progress)
+
+    def _diagnose(self, path, content=None, document=None, progress=None,
+                  cancel=None):
+        """
+        Look the diagnostics of the file or of its unsaved content up in the
+        diagnostics cache, or else in the diagnostics store, and analyse it
+        on the executor if they are in neither.
+
+        :return: The analysis key, the diagnostics, the ones of the line
+                 local bears if the document was analysed and whether the
+                 diagnostics were looked up.
+        """
+        key = analysis_key(path, self.root_path, content)
+        diagnostics = self._lookup(key)
+        if diagnostics is not None:
+            return key, diagnostics, None, True
+        config = None if key is None else key[2]
+        if document is None:
+            diagnostics = self._run(self._executor, diagnose_file, path,
+                                    self.root_path, content, self._budget,
+                                    progress=progress, cancel=cancel)
+            return key, diagnostics, None, False
+        diagnostics, line_local = self._run(
+            self._executor, diagnose_document, path, self.root_path, content,
+            incremental_change(document, content, config), self._budget,
+            progress=progress, cancel=cancel)
+        return key, diagnostics, line_local, False
+
+    def _lookup(self, key):
+        """
+        Get the diagnostics of the analysis key from the diagnostics cache
+        or else from the diagnostics store, None if neither has them.
+        """
+        if key is None:
+            return None
+        diagnostics = self._diagnostics_cache.get(key)
+        if diagnostics is None and self._store is not None:
+            diagnostics = self._store.get(key)
+            if diagnostics is not None:
+                self._diagnostics_cache.put(key, diagnostics)
+        return diagnostics
+
+    def _remember(self, path, key, diagnostics, content=None):
+        """
+        Cache the diagnostics of an analysis unless the file changed on disk
+        while it was analysed. They are only stored if the content analysed
+        is the one on disk, unsaved content changes with every keystroke
+        and would push the saved files out of the store.
+
+        Diagnostics of analyses that skipped a bear are neither cached nor
+        stored, the bear may run on the same content later.
+
+        :param content: The unsaved content analysed, None for the file.
+        """
+        if key is None or not is_complete(diagnostics):
+            return
+        saved = key == analysis_key(path, self.root_path)
+        if content is None and not saved:
+            return
+        self._diagnostics_cache.put(key, diagnostics)
+        if saved and self._store is not None:
+            self._store.put(key, diagnostics)
+
+    @staticmethod
+    def _run(executor, fn, *args, **kwargs):
+        """
+        Run the analysis in the calling job, or in a worker process and wait
+        for it if the executor has them.
+        """
+        if shares_memory(executor):
+            return fn(*args, **kwargs)
+        return executor.submit(fn, *args, **kwargs).result()
+
+    def _publish_sections(self, path, diagnostics, sections):
+        """
+        Publish the diagnostics of the finished sections of a running
+        analysis, along with the ones published last for the other sections
+        until they finish, too.
+        """
+        previous = self._state.diagnostics(uri_from_path(path))
+        self.send_diagnostics(path,
+                              merge_sections(previous, diagnostics, sections))
+
+    def _analysis_done(self, path, content, start, future, document=None):
+        """
+        Publish the diagnostics of a finished analysis job and remember the
+        analysed ones.
+        """
+        try:
+            key, diagnostics, line_local, looked_up = future.result()
+        except Exception:
+            log('Analysis of {} failed: {}'.format(
+                path, traceback.format_exc()), level=ERROR)
+            return
+        if not looked_up:
+            if document is not None:
+                document.analysed = (content, line_local,
+                                     None if key is None else key[2])
+            self._remember(path, key, diagnostics, content)
         self.send_diagnostics(path, diagnostics)
+        stats.record('latency', time.perf_counter() - start)
+
+    def lint(self, paths=None):
+        """
+        Publish the diagnostics of several files analysed in one batch.
+
+        Requests arriving while a batch is scheduled or running are merged
+        into a single follow-up batch, that starts once the running batch
+        finished. Diagnostics of documents open in the client are left to
+        their own analyses. Batches run in the background and pause while
+        single files are analysed. Files analysed before are not analysed
+        again.
+
+        :param paths: The files to analyse, all files selected by the
+                      sections of the project if None.
+        :return:      A future resolved once the files are linted.
+        """
+        done = Future()
+        if paths is None and self.root_path is None:
+            log('Unable to lint the workspace without a root path',
+                level=WARNING)
+            done.set_result(None)
+            return done
+        with self._batch_lock:
+            if paths is None:
+                self._batch_all = True
+            else:
+                self._batch.update(paths)
+            self._batch_waiters.append(done)
+            if self._linting:
+                return done
+            batch = self._next_batch()
+        self._schedule_batch(*batch)
+        return done
+
+    def _next_batch(self):
+        """
+        Take the requested batch to schedule it, while holding the batch
+        lock.
+        """
+        batch = None if self._batch_all else sorted(self._batch)
+        self._batch.clear()
+        self._batch_all = False
+        self._linting = True
+        return (batch, list(self._batch_waiters),
+                set(self._batch_requests))
+
+    def _schedule_batch(self, batch, waiters, requests):
+        progress = (self._publish_batched
+                    if shares_memory(self._background_executor) else None)
+        self._scheduler.schedule(BATCH, self._lint_batch, (batch,),
+                                 partial(self._batch_done,
+                                         waiters, requests),
+                                 progress, background=True)
+
+    def _lint_batch(self, paths, progress=None, cancel=None, idle=None):
+        """
+        Look the diagnostics of the files of a batch up in the diagnostics
+        cache or else in the diagnostics store, and analyse the others in
+        one pass on the background executor, remembering their diagnostics.
+
+        :param paths:    The files to lint, all files selected by the
+                         sections of the project if None.
+        :param progress: Called with each path and its diagnostics.
+        :return:         The paths and diagnostics that were not published.
+        """
+        if paths is None:
+            from .coalashim import workspace_files
+            paths = workspace_files(self.root_path)
+        unpublished = []
+        keys = {}
+        for path in paths:
+            key = analysis_key(path, self.root_path)
+            diagnostics = self._lookup(key)
+            if diagnostics is None:
+                keys[path] = key
+            elif progress is None:
+                unpublished.append((path, diagnostics))
+            else:
+                progress(path, diagnostics)
+        if not keys:
+            return unpublished
+
+        on_file = None
+        if progress is not None:
+            def on_file(path, diagnostics):
+                self._remember(path, keys.get(path), diagnostics)
+                progress(path, diagnostics)
+        analysed = self._run(self._background_executor, diagnose_files,
+                             [path for path in paths if path in keys],
+                             self.root_path, self._budget, progress=on_file,
+                             cancel=cancel, idle=idle)
+        for path, diagnostics in analysed:
+            self._remember(path, keys.get(path), diagnostics)
+        return unpublished + analysed
+
+    def _batch_done(self, waiters, requests, future):
+        """
+        Publish the diagnostics a finished batch job did not publish itself
+        and schedule the follow-up batch if any was requested meanwhile.
+        """
+        with self._batch_lock:
+            self._batch_waiters = [waiter for waiter in self._batch_waiters
+                                   if waiter not in waiters]
+            self._batch_requests.difference_update(requests)
+            follow_up = None
+            if self._batch_waiters:
+                follow_up = self._next_batch()
+            else:
+                self._linting = False
+        try:
+            unpublished = future.result()
+        except Exception:
+            log('Batch analysis failed: {}'.format(traceback.format_exc()),
+                level=ERROR)
+            unpublished = []
+        for path, diagnostics in unpublished:
+            self._publish_batched(path, diagnostics)
+        for waiter in waiters:
+            waiter.set_result(None)
+        if follow_up is not None:
+            self._schedule_batch(*follow_up)
+
+    def _cancel_request(self, request_id):
+        """
+        Cancel the batch a workspace lint request is waiting for.
+        """
+        with self._batch_lock:
+            if request_id not in self._batch_requests:
+                return
+        log('Cancelling the workspace lint')
+        self._scheduler.supersede(BATCH)
+        self._drop_batch()
+
+    def _drop_batch(self):
+        """
+        Forget the requested batch, its lint requests are answered as
+        cancelled.
+        """
+        with self._batch_lock:
+            waiters = self._batch_waiters
+            self._batch_waiters = []
+            self._batch_requests.clear()
+            self._batch.clear()
+            self._batch_all = False
+            self._linting = False
+        for waiter in waiters:
+            waiter.set_exception(JsonRpcRequestCancelled())
+
+    def _publish_batched(self, path, diagnostics):
+        if not self._is_open(path):
+            self.send_diagnostics(path, diagnostics)
+
+    def _is_open(self, path):
+        return any(path_from_uri(uri) == path
+                   for uri in self._documents.uris())
 
     def m_shutdown(self, **_kwargs):
         self._shutdown = True
+        if self._job_executor is not self._executor:
+            self._job_executor.shutdown(wait=False)
+        if self._background_job_executor is not self._background_executor:
+            self._background_job_executor.shutdown(wait=False)
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
+        if self._owns_background_executor:
+            self._background_executor.shutdown(wait=False)
+
+    def m_workspace__did_change_watched_files(self, changes=(), **_kwargs):
+        """
+        Serve for the workspace/didChangeWatchedFiles notification.
+
+        Changed configuration files drop the sections loaded from them and
+        relint the workspace if it is linted. The other files changed on
+        disk are linted in one batch, unless they are open in the client.
+        """
+        configs = []
+        paths = []
+        for change in changes:
+            path = path_from_uri(change['uri'])
+            if is_config_file(path):
+                configs.append(path)
+            elif change.get('type') == FILE_DELETED:
+                self.send_diagnostics(path, [])
+            elif not self._is_open(path):
+                paths.append(path)
+
+        if not configs:
+            if paths:
+                self.lint(paths)
+            return
+        # The bears may be configured differently now.
+        for uri in self._documents.uris():
+            document = self._documents.get(uri)
+            if document is not None:
+                document.analysed = None
+        try:
+            self._job_executor.submit(self._configs_changed, configs, paths)
+        except RuntimeError as exception:
+            log('Unable to reload the configuration with:', exception,
+                level=WARNING)
+
+    def _configs_changed(self, configs, paths):
+        """
+        Drop the sections loaded from the changed configuration files and
+        relint the workspace if it is linted, else the changed files. This
+        runs on the executor, coala's configuration is loaded there.
+        """
+        from .config import config_cache
 
-    # TODO: Support did_change and did_change_watched_files.
-    # def serve_change(self, request):
-    #     '""Serve for the request of documentation changed.""'
-    #     params = request['params']
-    #     uri = params['textDocument']['uri']
-    #     path = path_from_uri(uri)
-    #     diagnostics = output_to_diagnostics(
-    #         run_coala_with_specific_file(self.root_path, path))
-    #     self.send_diagnostics(path, diagnostics)
-    #     return None
-    #
-    # def serve_did_change_watched_files(self, request):
-    #     '""Serve for thr workspace/didChangeWatchedFiles request.""'
-    #     changes = request['changes']
-    #     for fileEvent in changes:
-    #         uri = fileEvent['uri']
-    #         path = path_from_uri(uri)
-    #         diagnostics = output_to_diagnostics(
-    #             run_coala_with_specific_file(self.root_path, path))
-    #         self.send_diagnostics(path, diagnostics)
+        for config in configs:
+            config_cache.invalidate(config)
+        if self._lint_workspace:
+            self.lint()
+        elif paths:
+            self.lint(paths)
 
     def send_diagnostics(self, path, diagnostics):
+        """
+        Publish the diagnostics of the file unless they are the ones
+        published last for it.
+        """
         _diagnostics = []
         if diagnostics is not None:
             _diagnostics = diagnostics
+        uri = uri_from_path(path)
+        fingerprint = diagnostics_fingerprint(_diagnostics)
         params = {
-            'uri': 'file://{0}'.format(path),
+            'uri': uri,
             'diagnostics': _diagnostics,
         }
-        self._endpoint.notify('textDocument/publishDiagnostics', params=params)
+        # Publishing under the lock keeps the fingerprint in line with what
+        # the client received last.
+        with self._publish_lock:
+            if self._state.fingerprint(uri) == fingerprint:
+                self.suppressed_publishes += 1
+                return
+            # Running analyses only publish their finished sections over
+            # these, if they can publish before they finish.
+            self._state.published(uri, fingerprint,
+                                  _diagnostics
+                                  if shares_memory(self._executor) else None)
+            with stats.timer('publish'):
+                self._endpoint.notify('textDocument/publishDiagnostics',
+                                      params=params)
 
 
 @enforce_signature
-def start_tcp_lang_server(handler_class: LangServer, bind_addr, port):
+def start_tcp_lang_server(handler_class: LangServer, bind_addr, port,
+                          **handler_kwargs):
     # Construct a custom wrapper class around the user's handler_class
     wrapper_class = type(
         handler_class.__name__ + 'Handler',
         (_StreamHandlerWrapper,),
-        {'DELEGATE_CLASS': handler_class},
+        {'DELEGATE_CLASS': handler_class,
+         'DELEGATE_KWARGS': handler_kwargs},
     )
 
     try:
-        server = socketserver.TCPServer((bind_addr, port), wrapper_class)
+        server = _ThreadingTCPServer((bind_addr, port), wrapper_class)
     except Exception as e:
-        log('Fatal Exception: {}'.format(e))
+        log('Fatal Exception: {}'.format(e), level=ERROR)
         sys.exit(1)
 
     log('Serving {} on ({}, {})'.format(
@@ -130,26 +894,161 @@ def start_tcp_lang_server(handler_class: LangServer, bind_addr, port):
 
 
 @enforce_signature
-def start_io_lang_server(handler_class: LangServer, rstream, wstream):
+def start_io_lang_server(handler_class: LangServer, rstream, wstream,
+                         **handler_kwargs):
     log('Starting {} IO language server'.format(handler_class.__name__))
-    server = handler_class(rstream, wstream)
+    server = handler_class(rstream, wstream, **handler_kwargs)
     server.start()
 
 
+@enforce_signature
+def start_async_tcp_lang_server(handler_class: LangServer, bind_addr, port,
+                                **handler_kwargs):
+    """
+    Serve each TCP connection as a session of the handler class on an
+    asyncio event loop.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        server = loop.run_until_complete(asyncio.start_server(
+            partial(serve_stream, partial(handler_class, **handler_kwargs)),
+            bind_addr, port))
+    except Exception as e:
+        log('Fatal Exception: {}'.format(e), level=ERROR)
+        sys.exit(1)
+
+    log('Serving {} on ({}, {})'.format(
+        handler_class.__name__, bind_addr, port))
+    try:
+        loop.run_forever()
+    finally:
+        log('Shutting down')
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+@enforce_signature
+def start_async_io_lang_server(handler_class: LangServer, **handler_kwargs):
+    """
+    Serve the standard input and output as a session of the handler class
+    on an asyncio event loop.
+    """
+    async def serve():
+        reader, writer = await open_stdio(loop)
+        await serve_stream(partial(handler_class, **handler_kwargs),
+                           reader, writer)
+
+    log('Starting {} IO language server'.format(handler_class.__name__))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(serve())
+    finally:
+        loop.close()
+
+
 def main():
     parser = argparse.ArgumentParser(description='')
     parser.add_argument('--mode', default='stdio',
                         help='communication (stdio|tcp)')
     parser.add_argument('--addr', default=2087,
                         help='server listen (tcp)', type=int)
+    parser.add_argument('--transport', default='asyncio',
+                        choices=('asyncio', 'blocking'),
+                        help='how messages are read and written')
+    parser.add_argument('--executor', default='thread',
+                        choices=EXECUTOR_MODES,
+                        help='pool running the coala analyses')
+    parser.add_argument('--max-workers', default=None, type=int,
+                        help='number of concurrent coala analyses')
+    parser.add_argument('--recycle-after', default=None, type=int,
+                        help='number of analyses after which the worker '
+                             'processes are replaced')
+    parser.add_argument('--debounce', default=0.2, type=float,
+                        help='seconds to wait for further saves of a file')
+    parser.add_argument('--cache-entries', default=512, type=int,
+                        help='number of files the diagnostics are cached of')
+    parser.add_argument('--cache-bytes', default=64 * 1024 * 1024, type=int,
+                        help='approximate size limit of cached diagnostics')
+    parser.add_argument('--session-bytes', default=32 * 1024 * 1024,
+                        type=int,
+                        help='approximate memory budget of the state kept '
+                             'per client')
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                        help='directory the diagnostics of each workspace '
+                             'are kept in across restarts')
+    parser.add_argument('--no-cache-dir', action='store_true',
+                        help='keep no diagnostics across restarts')
+    parser.add_argument('--bear-timeout', default=30, type=float,
+                        help='seconds a bear may run on a file, 0 for no '
+                             'limit')
+    parser.add_argument('--run-timeout', default=120, type=float,
+                        help='seconds all bears may run on a file, 0 for no '
+                             'limit')
+    parser.add_argument('--quarantine-after', default=2, type=int,
+                        help='number of timeouts in a row after which a '
+                             'bear is disabled for similar files')
+    parser.add_argument('--quarantine-seconds', default=600, type=float,
+                        help='seconds a timed out bear stays disabled')
+    parser.add_argument('--stats-interval', default=0, type=float,
+                        help='seconds between logged timing summaries, '
+                             '0 to disable')
+
+    parser.add_argument('--log-level', default='warning', choices=LEVELS,
+                        help='least severe level of logged messages')
+    parser.add_argument('--log-file', default=None,
+                        help='file to append the log to instead of stderr')
 
     args = parser.parse_args()
+    configure(args.log_level, args.log_file)
+    if args.stats_interval > 0:
+        log_periodically(args.stats_interval)
+    handler_kwargs = {
+        'executor': create_executor(args.executor, args.max_workers,
+                                    args.recycle_after),
+        # Batches run one at a time, one worker is all they use.
+        'background_executor': create_executor(args.executor, 1,
+                                               args.recycle_after),
+        'diagnostics_cache': DiagnosticsCache(args.cache_entries,
+                                              args.cache_bytes),
+        'debounce': args.debounce,
+        'max_state_bytes': args.session_bytes,
+        'cache_dir': None if args.no_cache_dir else args.cache_dir,
+        'budget': Budget(args.bear_timeout or None, args.run_timeout or None,
+                         args.quarantine_after, args.quarantine_seconds),
+    }
 
-    if args.mode == 'stdio':
-        start_io_lang_server(LangServer, sys.stdin.buffer, sys.stdout.buffer)
+    # Analyses in threads share the fate of the server, so it is served
+    # again after a fatal error. Worker processes are supervised instead.
+    while True:
+        try:
+            serve(args, handler_kwargs)
+            return
+        except Exception:
+            if args.executor != 'thread':
+                raise
+            log('FATAL ERROR: {}'.format(traceback.format_exc()),
+                level=ERROR)
+
+
+def serve(args, handler_kwargs):
+    """
+    Serve the language server with the transport and mode of the
+    arguments.
+    """
+    if args.mode == 'stdio' and args.transport == 'asyncio':
+        start_async_io_lang_server(LangServer, **handler_kwargs)
+    elif args.mode == 'stdio':
+        start_io_lang_server(LangServer, sys.stdin.buffer, sys.stdout.buffer,
+                             **handler_kwargs)
+    elif args.mode == 'tcp' and args.transport == 'asyncio':
+        host, addr = '0.0.0.0', args.addr
+        start_async_tcp_lang_server(LangServer, host, addr, **handler_kwargs)
     elif args.mode == 'tcp':
         host, addr = '0.0.0.0', args.addr
-        start_tcp_lang_server(LangServer, host, addr)
+        start_tcp_lang_server(LangServer, host, addr, **handler_kwargs)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,87 @@
+import atexit
+import logging
+import logging.handlers
+import queue
 import sys
 
 
-def log(*args, **kwargs):
-    print(*args, file=sys.stderr, **kwargs)
-    sys.stderr.flush()
+LEVELS = ('debug', 'info', 'warning', 'error')
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+FORMAT = '%(asctime)s %(levelname)s %(message)s'
+MAX_LENGTH = 4096
+
+logger = logging.getLogger('coala_langserver')
+logger.setLevel(WARNING)
+
+_max_length = MAX_LENGTH
+_listener = None
+
+
+def truncate(message, max_length):
+    """
+    Shorten the message to the maximum length, noting how much was cut.
+    """
+    if max_length is None or len(message) <= max_length:
+        return message
+    return '{}... ({} more characters)'.format(message[:max_length],
+                                               len(message) - max_length)
+
+
+def log(*args, level=INFO, sep=' '):
+    """
+    Log the arguments joined like ``print`` does.
+
+    Nothing is formatted if the level is disabled and long messages are
+    truncated, so logging big payloads stays cheap.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    message = sep.join(str(arg) for arg in args)
+    logger.log(level, truncate(message, _max_length))
+
+
+def configure(level='warning', destination=None, max_length=MAX_LENGTH):
+    """
+    Write the messages of the level and above to the destination from a
+    background thread, so logging never waits for the output.
+
+    :param level:       One of ``LEVELS``.
+    :param destination: The file to append to, stderr if None.
+    :param max_length:  The number of characters messages are truncated to,
+                        None to keep them whole.
+    """
+    global _listener, _max_length
+    stop()
+    if destination is None:
+        handler = logging.StreamHandler(sys.stderr)
+    else:
+        handler = logging.FileHandler(destination, encoding='utf-8')
+    handler.setFormatter(logging.Formatter(FORMAT))
+
+    records = queue.Queue()
+    logger.handlers = [logging.handlers.QueueHandler(records)]
+    logger.propagate = False
+    logger.setLevel(level.upper())
+    _max_length = max_length
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+
+
+def stop():
+    """
+    Write the queued messages and stop the background thread.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+atexit.register(stop)
@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+
+from coalib.bears.BEAR_KIND import BEAR_KIND
+from coalib.collecting import Dependencies
+from coalib.collecting.Collectors import (
+    collect_bears, collect_registered_bears_dirs)
+from coalib.parsing.Globbing import glob_escape
+from coalib.settings.Setting import path_list
+
+
+class BearRegistry:
+    """
+    A thread safe registry of the bear classes imported by the server.
+
+    Bears are imported lazily the first time a section asks for them and the
+    classes as well as the resolved dependencies of each bear list are kept
+    for the lifetime of the server.
+    """
+
+    KINDS = [BEAR_KIND.LOCAL, BEAR_KIND.GLOBAL]
+
+    def __init__(self):
+        self._registered_dirs = None
+        self._collected = {}
+        self._resolved = {}
+        self._lock = threading.RLock()
+
+    def registered_dirs(self):
+        """
+        Get the bear directories registered by installed packages.
+        """
+        with self._lock:
+            if self._registered_dirs is None:
+                self._registered_dirs = collect_registered_bears_dirs(
+                    'coalabears')
+            return self._registered_dirs
+
+    def bear_dirs(self, section):
+        """
+        Get the bear directory globs of the section, like
+        ``Section.bear_dirs`` does without looking up the registered
+        directories again.
+        """
+        bear_dirs = path_list(section.get('bear_dirs', ''))
+        for bear_dir in bear_dirs:
+            if bear_dir not in sys.path:
+                sys.path.append(bear_dir)
+        return tuple(os.path.join(glob_escape(bear_dir), '**')
+                     for bear_dir in bear_dirs + self.registered_dirs())
+
+    def collect(self, bear_dirs, bear_glob, log_printer):
+        """
+        Get the local and global bear classes matching the glob, importing
+        them on first use.
+        """
+        key = bear_dirs, bear_glob
+        with self._lock:
+            if key not in self._collected:
+                self._collected[key] = collect_bears(list(bear_dirs),
+                                                     [bear_glob],
+                                                     self.KINDS,
+                                                     log_printer)
+            return self._collected[key]
+
+    def get(self, section, log_printer):
+        """
+        Get the local and global bears of the section, including their
+        dependencies in the order they have to run in.
+        """
+        bear_dirs = self.bear_dirs(section)
+        bear_globs = tuple(section.get('bears', ''))
+        key = bear_dirs, bear_globs
+        with self._lock:
+            if key not in self._resolved:
+                local_bears, global_bears = [], []
+                for bear_glob in bear_globs:
+                    collected = self.collect(bear_dirs, bear_glob,
+                                             log_printer)
+                    local_bears.extend(collected[0])
+                    global_bears.extend(collected[1])
+                self._resolved[key] = (Dependencies.resolve(local_bears),
+                                       Dependencies.resolve(global_bears))
+            local_bears, global_bears = self._resolved[key]
+        return list(local_bears), list(global_bears)
+
+    def clear(self):
+        with self._lock:
+            self._registered_dirs = None
+            self._collected.clear()
+            self._resolved.clear()
+
+
+bear_registry = BearRegistry()
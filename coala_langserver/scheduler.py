@@ -0,0 +1,257 @@
+import threading
+from functools import partial
+
+from .log import WARNING, log
+
+
+class _Document:
+    """
+    The scheduling state of the analyses of one document.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.job = None
+        self.cancel = None
+        self.timer = None
+        self.running = False
+        self.pending = False
+        self.background = False
+
+    @property
+    def idle(self):
+        return self.timer is None and not self.running and not self.pending
+
+
+class AnalysisScheduler:
+    """
+    Schedule the analyses of documents on an executor.
+
+    Requests for the same document within the debounce window are merged
+    into one run and at most one run per document is in flight; requests
+    arriving meanwhile are merged into a single follow-up run. Runs
+    superseded by a newer request are cancelled and their results dropped.
+
+    Background runs go to their own executor, so they never hold up the
+    interactive ones, and yield to them: they get an ``idle`` event that is
+    cleared while interactive runs are scheduled or running. A request for
+    a background run that is running already doesn't supersede it, it only
+    queues the follow-up run.
+    """
+
+    def __init__(self, executor, debounce=0, cancel_factory=None,
+                 background_executor=None, background_cancel_factory=None):
+        """
+        :param executor:            The executor the analyses are submitted
+                                    to.
+        :param debounce:            The seconds to wait for further requests
+                                    of a document before analysing it.
+        :param cancel_factory:      Creates the event passed to each run as
+                                    its ``cancel`` argument, set once the run
+                                    is superseded. Runs can't be interrupted
+                                    and background runs don't yield if None.
+        :param background_executor: The executor background runs are
+                                    submitted to, the one of the other runs
+                                    if None.
+        :param background_cancel_factory:
+                                    Creates the events of the background
+                                    runs, like ``cancel_factory`` that is
+                                    used if None.
+        """
+        self.debounce = debounce
+        self.dropped = 0
+        self.cancelled = 0
+        self.preempted = 0
+        self._executor = executor
+        self._background_executor = (executor if background_executor is None
+                                     else background_executor)
+        self._cancel_factory = cancel_factory
+        self._background_cancel_factory = (
+            cancel_factory if background_cancel_factory is None
+            else background_cancel_factory)
+        self._documents = {}
+        self._interactive = set()
+        self._idle = None
+        self._condition = threading.Condition()
+
+    def schedule(self, key, fn, args, callback, progress=None,
+                 background=False):
+        """
+        Request an analysis of the document.
+
+        :param key:        The document, usually its path.
+        :param fn:         The analysis, submitted to the executor with
+                           args.
+        :param args:       The arguments of the analysis.
+        :param callback:   Called with the future of the run unless the run
+                           is superseded by a newer request.
+        :param progress:   Passed to the analysis as its ``progress``
+                           argument, wrapped so calls are dropped once the
+                           run is superseded. The executor has to run jobs
+                           in this process.
+        :param background: Whether the run yields to interactive ones. The
+                           analysis takes an ``idle`` argument then.
+        """
+        with self._condition:
+            document = self._documents.setdefault(key, _Document())
+            document.job = fn, args, callback, progress
+            document.background = background
+            if background and document.running:
+                # The running run finishes and reports its results.
+                document.pending = True
+                return
+            document.version += 1
+            if not background:
+                self._busy(key)
+            self._cancel(document)
+            if document.timer is not None:
+                document.timer.cancel()
+                document.timer = None
+            if self.debounce > 0:
+                document.timer = threading.Timer(self.debounce, self._start,
+                                                 (key,))
+                document.timer.daemon = True
+                document.timer.start()
+                return
+        self._start(key)
+
+    def supersede(self, key):
+        """
+        Drop the scheduled and running analyses of the document, e.g.
+        because its diagnostics are known already.
+        """
+        with self._condition:
+            document = self._documents.get(key)
+            if document is None:
+                return
+            document.version += 1
+            document.pending = False
+            self._cancel(document)
+            if document.timer is not None:
+                document.timer.cancel()
+                document.timer = None
+            self._forget_if_idle(key, document)
+
+    def supersede_all(self):
+        """
+        Drop the scheduled and running analyses of all documents.
+        """
+        with self._condition:
+            keys = list(self._documents)
+        for key in keys:
+            self.supersede(key)
+
+    def _start(self, key):
+        with self._condition:
+            document = self._documents.get(key)
+            if document is None:
+                return
+            document.timer = None
+            if document.running:
+                document.pending = True
+                return
+            document.running = True
+            document.pending = False
+            fn, args, callback, progress = document.job
+            version = document.version
+            kwargs = {}
+            if progress is not None:
+                kwargs['progress'] = partial(self._progress, key, version,
+                                             progress)
+            cancel_factory = (self._background_cancel_factory
+                              if document.background
+                              else self._cancel_factory)
+            if cancel_factory is not None:
+                document.cancel = kwargs['cancel'] = cancel_factory()
+                if document.background:
+                    kwargs['idle'] = self._idle_event()
+            executor = (self._background_executor if document.background
+                        else self._executor)
+
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except RuntimeError as exception:
+            log('Unable to schedule analysis of', key, 'with:', exception,
+                level=WARNING)
+            with self._condition:
+                document.running = False
+                document.cancel = None
+                self._forget_if_idle(key, document)
+            return
+        future.add_done_callback(partial(self._done, key, version, callback))
+
+    def _idle_event(self):
+        if self._idle is None:
+            self._idle = self._background_cancel_factory()
+            if not self._interactive:
+                self._idle.set()
+        return self._idle
+
+    def _busy(self, key):
+        """
+        Record that an interactive run of the document is scheduled, the
+        background runs pause until no such run is left.
+        """
+        if key in self._interactive:
+            return
+        self._interactive.add(key)
+        if len(self._interactive) == 1 and self._idle is not None:
+            self._idle.clear()
+            if any(document.running and document.background
+                   for document in self._documents.values()):
+                self.preempted += 1
+
+    def _cancel(self, document):
+        """
+        Interrupt the running analysis of the document, its results are
+        outdated.
+        """
+        if document.cancel is not None and not document.cancel.is_set():
+            document.cancel.set()
+            self.cancelled += 1
+
+    def _progress(self, key, version, progress, *args):
+        # Reported while holding the lock, so a newer run can't finish in
+        # between and have its results overwritten by this one.
+        with self._condition:
+            document = self._documents.get(key)
+            if document is not None and version == document.version:
+                progress(*args)
+
+    def _done(self, key, version, callback, future):
+        with self._condition:
+            document = self._documents[key]
+            document.running = False
+            document.cancel = None
+            current = version == document.version
+            restart = document.pending
+            if not current:
+                self.dropped += 1
+
+        if current:
+            callback(future)
+
+        if restart:
+            self._start(key)
+        else:
+            with self._condition:
+                self._forget_if_idle(key, document)
+
+    def _forget_if_idle(self, key, document):
+        if document.idle and self._documents.get(key) is document:
+            del self._documents[key]
+            if key in self._interactive:
+                self._interactive.discard(key)
+                if not self._interactive and self._idle is not None:
+                    self._idle.set()
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        """
+        Block until no analysis is scheduled or running.
+
+        :return: False if the timeout expired first.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._documents,
+                                            timeout)
@@ -0,0 +1,185 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from .diagnostic import diagnostics_size
+
+
+# Rough memory used by an entry besides its URI and document text.
+ENTRY_SIZE = 200
+
+
+def resident_memory():
+    """
+    Get the resident memory of the process in bytes, its peak where the
+    current one is unknown and None if neither is known.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, the others kilobytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _Entry:
+    """
+    The state kept for one URI.
+    """
+
+    __slots__ = ('fingerprint', 'diagnostics', 'diagnostics_size',
+                 'document_size', 'open', 'size')
+
+    def __init__(self, uri):
+        self.fingerprint = None
+        self.diagnostics = None
+        self.diagnostics_size = 0
+        self.document_size = 0
+        self.open = False
+        self.size = ENTRY_SIZE + len(uri)
+
+
+class SessionState:
+    """
+    A thread safe record of the documents of a session and of the
+    diagnostics published last for each URI, or of their fingerprints,
+    bounded by a memory budget.
+
+    Once the estimated size exceeds the budget, the least recently used
+    URIs that aren't open in the client are evicted, along with whatever
+    ``on_evict`` drops for them. Open documents are never evicted.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, on_evict=None):
+        """
+        :param max_bytes: The approximate memory budget in bytes.
+        :param on_evict:  Called with each evicted URI, outside the lock.
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, uri):
+        return uri in self._entries
+
+    def opened(self, uri, document_size):
+        """
+        Record that the document is open with text of the given size, also
+        when its text changed.
+        """
+        with self._lock:
+            entry = self._touch(uri)
+            entry.open = True
+            self._resize(entry, document_size)
+            evicted = self._evict()
+        self._evicted(evicted)
+
+    def closed(self, uri):
+        """
+        Record that the document was closed, its state can be evicted now.
+        """
+        with self._lock:
+            entry = self._touch(uri)
+            entry.open = False
+            self._resize(entry, 0)
+            evicted = self._evict()
+        self._evicted(evicted)
+
+    def fingerprint(self, uri):
+        """
+        Get the fingerprint of the diagnostics published last for the URI,
+        None if there are none.
+        """
+        with self._lock:
+            entry = self._entries.get(uri)
+            if entry is None:
+                return None
+            self._entries.move_to_end(uri)
+            return entry.fingerprint
+
+    def diagnostics(self, uri):
+        """
+        Get the diagnostics published last for the URI if they were kept,
+        None otherwise.
+        """
+        with self._lock:
+            entry = self._entries.get(uri)
+            return None if entry is None else entry.diagnostics
+
+    def published(self, uri, fingerprint, diagnostics=None):
+        """
+        Record the fingerprint of the diagnostics published for the URI.
+
+        :param diagnostics: The published diagnostics to keep along with it,
+                            none are kept if None.
+        """
+        size = 0 if diagnostics is None else diagnostics_size(diagnostics)
+        with self._lock:
+            entry = self._touch(uri)
+            entry.fingerprint = fingerprint
+            entry.diagnostics = diagnostics
+            entry.size += size - entry.diagnostics_size
+            self.size += size - entry.diagnostics_size
+            entry.diagnostics_size = size
+            evicted = self._evict()
+        self._evicted(evicted)
+
+    def stats(self):
+        """
+        Get the counters of the state.
+        """
+        with self._lock:
+            return {'entries': len(self._entries),
+                    'open': sum(entry.open
+                                for entry in self._entries.values()),
+                    'bytes': self.size,
+                    'max_bytes': self.max_bytes,
+                    'evictions': self.evictions}
+
+    def _touch(self, uri):
+        entry = self._entries.get(uri)
+        if entry is None:
+            entry = self._entries[uri] = _Entry(uri)
+            self.size += entry.size
+        else:
+            self._entries.move_to_end(uri)
+        return entry
+
+    def _resize(self, entry, document_size):
+        self.size += document_size - entry.document_size
+        entry.size += document_size - entry.document_size
+        entry.document_size = document_size
+
+    def _evict(self):
+        evicted = []
+        if self.size <= self.max_bytes:
+            return evicted
+        for uri, entry in list(self._entries.items()):
+            if self.size <= self.max_bytes:
+                break
+            if entry.open:
+                continue
+            del self._entries[uri]
+            self.size -= entry.size
+            self.evictions += 1
+            evicted.append(uri)
+        return evicted
+
+    def _evicted(self, uris):
+        if self._on_evict is not None:
+            for uri in uris:
+                self._on_evict(uri)
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .log import WARNING, log
+
+
+def percentile(ordered, percent):
+    """
+    Get the nearest rank percentile of the sorted samples.
+    """
+    index = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[int(index)]
+
+
+class Histogram:
+    """
+    The durations recorded last for a phase, along with the count and the
+    total of all durations ever recorded for it.
+    """
+
+    def __init__(self, window=1024):
+        self.count = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self._samples.append(seconds)
+
+    def summary(self):
+        """
+        Summarise the durations in seconds, the percentiles only cover the
+        samples of the window.
+        """
+        ordered = sorted(self._samples)
+        if not ordered:
+            return {'count': self.count, 'total': self.total}
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': sum(ordered) / len(ordered),
+            'p50': percentile(ordered, 50),
+            'p95': percentile(ordered, 95),
+            'p99': percentile(ordered, 99),
+            'max': ordered[-1],
+        }
+
+
+class Stats:
+    """
+    Thread safe rolling histograms of the time spent in each phase of the
+    analyses and of the requests.
+
+    Phases are recorded in the process they run in, the analyses of a
+    process pool aren't included.
+    """
+
+    def __init__(self, window=1024):
+        """
+        :param window: The number of recent durations kept per phase.
+        """
+        self.window = window
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.window)
+            histogram.record(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Record the time spent in the block, also if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """
+        Get the summary of each phase by its name.
+        """
+        with self._lock:
+            return {name: histogram.summary()
+                    for name, histogram in self._histograms.items()}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+def format_snapshot(snapshot, limit=8):
+    """
+    Format the phases that took the most time in total as a single line.
+    """
+    phases = sorted(snapshot.items(), key=lambda item: -item[1]['total'])
+    return '; '.join(
+        '{} n={} p50={:.1f}ms p95={:.1f}ms max={:.1f}ms'.format(
+            name, summary['count'], summary['p50'] * 1000,
+            summary['p95'] * 1000, summary['max'] * 1000)
+        for name, summary in phases[:limit] if 'p50' in summary)
+
+
+def log_periodically(interval, source=None):
+    """
+    Log the hot spots of the stats every interval seconds from a daemon
+    thread. They are logged as warnings, so asking for them is enough to
+    see them with the default log level.
+
+    :param source: The stats to log, the ones of the server if None.
+    :return:       An event that stops the logging once it is set.
+    """
+    source = stats if source is None else source
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            line = format_snapshot(source.snapshot())
+            if line:
+                log('Stats:', line, level=WARNING)
+
+    thread = threading.Thread(target=run, name='coala-stats')
+    thread.daemon = True
+    thread.start()
+    return stop
+
+
+stats = Stats()
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .log import WARNING, log
+
+
+# Stores of another schema version are dropped when they are opened. Since
+# version 2 analyses that skipped bears are not stored.
+SCHEMA_VERSION = 2
+
+
+def default_cache_dir():
+    """
+    Get the directory the server keeps its caches in, inside the cache
+    directory of the user.
+    """
+    base = (os.environ.get('XDG_CACHE_HOME') or
+            os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'coala-langserver')
+
+
+def workspace_store_path(cache_dir, root_path):
+    """
+    Get the path of the store of the workspace inside the cache directory.
+    """
+    root_path = os.path.abspath(root_path)
+    name = os.path.basename(root_path.rstrip(os.sep)) or 'root'
+    digest = hashlib.sha1(root_path.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, '{}-{}'.format(name, digest),
+                        'diagnostics.sqlite')
+
+
+def key_context(key):
+    """
+    Serialise the parts of an analysis key besides the path and the digest
+    of the content, the configuration and the bear versions.
+    """
+    return json.dumps(key[2:])
+
+
+class DiagnosticsStore:
+    """
+    A thread safe SQLite index of the diagnostics of analysed files, keyed by
+    the analysis keys of the ``DiagnosticsCache``, that outlives the server.
+
+    It keeps the most recently used entries up to a number of entries. A
+    corrupt database is replaced by an empty one. Once the database fails
+    otherwise, the store logs it and turns into a no-op so the server keeps
+    working without it.
+    """
+
+    def __init__(self, path, max_entries=4096):
+        """
+        :param path:        The database file, created with its directory.
+        :param max_entries: The number of entries kept.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                self._connection = self._open()
+            except sqlite3.DatabaseError as exception:
+                log('Replacing the diagnostics store', path, 'after:',
+                    exception, level=WARNING)
+                os.remove(path)
+                self._connection = self._open()
+        except (OSError, sqlite3.Error) as exception:
+            self._failed(exception)
+
+    def _open(self):
+        connection = sqlite3.connect(self.path, timeout=5,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        try:
+            self._create(connection)
+        except sqlite3.Error:
+            connection.close()
+            raise
+        return connection
+
+    def _create(self, connection):
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        version, = connection.execute('PRAGMA user_version').fetchone()
+        if version != SCHEMA_VERSION:
+            connection.execute('DROP TABLE IF EXISTS diagnostics')
+            connection.execute(
+                'PRAGMA user_version = {:d}'.format(SCHEMA_VERSION))
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS diagnostics ('
+            'path TEXT NOT NULL, digest TEXT NOT NULL, '
+            'context TEXT NOT NULL, diagnostics TEXT NOT NULL, '
+            'used REAL NOT NULL, PRIMARY KEY (path, digest))')
+
+    def _failed(self, exception):
+        log('Disabling the diagnostics store', self.path, 'after:',
+            exception, level=WARNING)
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except sqlite3.Error:
+                pass
+        self._connection = None
+
+    def get(self, key):
+        """
+        Get the diagnostics stored for the analysis key or None on a miss.
+        """
+        path, digest = key[:2]
+        with self._lock:
+            if self._connection is None:
+                return None
+            try:
+                row = self._connection.execute(
+                    'SELECT context, diagnostics FROM diagnostics '
+                    'WHERE path = ? AND digest = ?', (path, digest)).fetchone()
+                if row is None or row[0] != key_context(key):
+                    self.misses += 1
+                    return None
+                self._connection.execute(
+                    'UPDATE diagnostics SET used = ? '
+                    'WHERE path = ? AND digest = ?',
+                    (time.time(), path, digest))
+            except sqlite3.Error as exception:
+                self._failed(exception)
+                return None
+            self.hits += 1
+            return json.loads(row[1])
+
+    def put(self, key, diagnostics):
+        """
+        Store the diagnostics for the analysis key.
+        """
+        path, digest = key[:2]
+        row = (path, digest, key_context(key),
+               json.dumps(list(diagnostics or [])), time.time())
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO diagnostics '
+                    'VALUES (?, ?, ?, ?, ?)', row)
+                self.writes += 1
+                # Pruning is amortised over several writes.
+                if self.writes % 64 == 0:
+                    self._prune()
+            except sqlite3.Error as exception:
+                self._failed(exception)
+
+    def _prune(self):
+        self._connection.execute(
+            'DELETE FROM diagnostics WHERE rowid IN ('
+            'SELECT rowid FROM diagnostics ORDER BY used DESC '
+            'LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def paths(self):
+        """
+        Get the paths of the stored files, the most recently used first.
+        """
+        with self._lock:
+            if self._connection is None:
+                return []
+            try:
+                return [path for path, in self._connection.execute(
+                    'SELECT path FROM diagnostics GROUP BY path '
+                    'ORDER BY MAX(used) DESC')]
+            except sqlite3.Error as exception:
+                self._failed(exception)
+                return []
+
+    def discard(self, path):
+        """
+        Drop the diagnostics stored for any version of the file.
+        """
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._connection.execute(
+                    'DELETE FROM diagnostics WHERE path = ?', (path,))
+            except sqlite3.Error as exception:
+                self._failed(exception)
+
+    def close(self):
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._prune()
+            except sqlite3.Error:
+                pass
+            self._connection.close()
+            self._connection = None
+
+    def stats(self):
+        """
+        Get the counters of the store.
+        """
+        with self._lock:
+            return {'path': self.path,
+                    'enabled': self._connection is not None,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'writes': self.writes}
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import sys
+import threading
+
+from .log import WARNING, log
+
+
+async def read_message(reader):
+    """
+    Read the body of the next JSON RPC message from the stream.
+
+    :return: The body or None at the end of the stream.
+    """
+    content_length = None
+    while True:
+        line = await reader.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if not line:
+            if content_length is None:
+                continue
+            break
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            content_length = int(value.strip())
+
+    try:
+        return await reader.readexactly(content_length)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class AsyncStreamFile:
+    """
+    A file like wrapper of an asyncio stream writer that can be written to
+    from any thread.
+
+    Writes are buffered and handed to the event loop, which sends all data
+    written meanwhile at once, so a burst of notifications costs a single
+    write instead of one flush per message.
+    """
+
+    def __init__(self, writer, loop):
+        self._writer = writer
+        self._loop = loop
+        self._buffer = []
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def write(self, data):
+        with self._lock:
+            if self.closed:
+                return
+            self._buffer.append(data)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._send)
+        except RuntimeError:
+            # The loop was closed after the stream.
+            self.closed = True
+
+    def flush(self):
+        # The event loop sends the buffer as soon as it gets to it.
+        pass
+
+    def _send(self):
+        with self._lock:
+            data = b''.join(self._buffer)
+            self._buffer.clear()
+            self._scheduled = False
+        if data and not self._writer.transport.is_closing():
+            self._writer.write(data)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+        if not self._writer.transport.is_closing():
+            self._send()
+            self._writer.close()
+
+
+async def serve_stream(server_factory, reader, writer):
+    """
+    Serve a JSON RPC session on a pair of asyncio streams.
+
+    Messages are read without blocking the event loop and dispatched in the
+    order they arrive, as the document notifications depend on it. The
+    handlers only schedule the analyses on their executors, so reading
+    never waits for coala.
+
+    :param server_factory: Creates the ``LangServer`` of the session from a
+                           reader and a writer file, the reader is unused.
+    """
+    loop = asyncio.get_event_loop()
+    wfile = AsyncStreamFile(writer, loop)
+    server = server_factory(None, wfile)
+    try:
+        while True:
+            try:
+                body = await read_message(reader)
+            except (ValueError, ConnectionError) as exception:
+                log('Failed to read message:', exception, level=WARNING)
+                break
+            if body is None:
+                break
+            try:
+                message = json.loads(body.decode('utf-8'))
+            except ValueError:
+                log('Failed to parse JSON message', body, level=WARNING)
+                continue
+            server.consume(message)
+            # Let the loop send the responses before reading on.
+            await asyncio.sleep(0)
+    finally:
+        server.close()
+        wfile.close()
+
+
+async def open_stdio(loop):
+    """
+    Wrap the standard input and output into asyncio streams.
+    """
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, sys.stdout)
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    return reader, writer
@@ -11,6 +11,13 @@ def path_from_uri(uri):
     return path
 
 
+def uri_from_path(path):
+    """
+    Get the URI diagnostics of the path are published for.
+    """
+    return 'file://{0}'.format(path)
+
+
 def dir_from_uri(uri):
     """
     Get the directory name from the path.
@@ -16,6 +16,11 @@ Feature: langserver module
     When I invoke send_diagnostics message
     Then I should receive a publishDiagnostics type response
 
+  Scenario: Test send_diagnostics with unchanged diagnostics
+    Given the LangServer instance
+    When I invoke send_diagnostics twice with the same diagnostics
+    Then I should receive a single publishDiagnostics type response
+
   Scenario: Test negative m_text_document__did_save
     Given the LangServer instance
     When I send a did_save request about a non-existed file to the server
@@ -26,6 +31,11 @@ Feature: langserver module
     When I send a did_save request about a existing file to the server
     Then I should receive a publishDiagnostics type response
 
+  Scenario: Test m_text_document__did_save does not block the reader
+    Given the LangServer instance
+    When I send a did_save request while coala is still running
+    Then it should answer the shutdown request before the analysis finishes
+
   Scenario: Test when coafile is missing
     Given the LangServer instance
     When I send a did_save request on a file with no coafile to server
@@ -36,6 +46,26 @@ Feature: langserver module
     When I send a did_change request about a file to the server
     Then it should ignore the request
 
+  Scenario: Test didChange of an open document
+    Given the LangServer instance
+    When I open a document and change it on the server
+    Then coala should analyse the unsaved content
+
+  Scenario: Test lint workspace command
+    Given the LangServer instance
+    When I send a lint workspace command to the server
+    Then it should publish the diagnostics of the workspace files
+
+  Scenario: Test cancelling the lint workspace command
+    Given the LangServer instance
+    When I cancel a running lint workspace command
+    Then the command should be answered as cancelled
+
+  Scenario: Test the stats request
+    Given the LangServer instance
+    When I request the stats after a did_save request
+    Then it should answer the timings of the analysis
+
   Scenario: Test langserver shutdown
     Given the LangServer instance
     When I send a shutdown request to the server
@@ -50,3 +80,8 @@ Feature: langserver module
     Given the server started in TCP mode
     When I send a initialize request via TCP stream
     Then it should return the response with textDocumentSync via TCP
+
+  Scenario: Test language server in tcp mode with several clients
+    Given the server started in TCP mode on port 20802
+    When two clients connect and the second one sends a initialize request
+    Then the second client should be answered while the first is connected
@@ -10,7 +10,7 @@ import sys
 import time
 import socket
 import tempfile
-from threading import Thread
+from threading import Event, Thread
 
 from behave import given, when, then
 from unittest import mock
@@ -60,7 +60,7 @@ def step_impl(context):
 
     def consumer(response):
         assert response is not None
-        assert response['result']['capabilities']['textDocumentSync'] == 1
+        assert response['result']['capabilities']['textDocumentSync'] == 2
         context.f.close()
         context._passed = True
 
@@ -78,6 +78,27 @@ def step_impl(context):
     context._diagCount = 0
 
 
+@when('I invoke send_diagnostics twice with the same diagnostics')
+def step_impl(context):
+    context.langServer.send_diagnostics('/sample', [])
+    context.langServer.send_diagnostics('/sample', None)
+    context._diagCount = 0
+
+
+@then('I should receive a single publishDiagnostics type response')
+def step_impl(context):
+    context.f.seek(0)
+    published = []
+
+    reader = streams.JsonRpcStreamReader(context.f)
+    reader.listen(published.append)
+    reader.close()
+
+    assert len(published) == 1
+    assert published[0]['method'] == 'textDocument/publishDiagnostics'
+    assert context.langServer.suppressed_publishes == 1
+
+
 @when('I send a did_save request about a non-existed file to the server')
 def step_impl(context):
     request = {
@@ -134,6 +155,8 @@ def step_impl(context):
 
 @then('I should receive a publishDiagnostics type response')
 def step_impl(context):
+    # The analysis runs in the executor, wait for it to publish.
+    assert context.langServer._scheduler.wait(60)
     context.f.seek(0)
     context._passed = False
 
@@ -176,6 +199,57 @@ def step_impl(context):
     context.langServer._endpoint.consume(request)
 
 
+@when('I open a document and change it on the server')
+def step_impl(context):
+    uri = 'file:///Users/mock-user/unsaved.py'
+    requests = [{
+        'method': 'textDocument/didOpen',
+        'params': {
+            'textDocument': {
+                'uri': uri,
+                'languageId': 'python',
+                'version': 1,
+                'text': 'def test():\n  a = 1\n',
+            },
+        },
+        'jsonrpc': '2.0',
+    }, {
+        'method': 'textDocument/didChange',
+        'params': {
+            'textDocument': {
+                'uri': uri,
+                'version': 2,
+            },
+            'contentChanges': [
+                {
+                    'range': {
+                        'start': {'line': 1, 'character': 2},
+                        'end': {'line': 1, 'character': 3},
+                    },
+                    'text': 'b',
+                },
+            ],
+        },
+        'jsonrpc': '2.0',
+    }]
+
+    with mock.patch('coala_langserver.coalashim.analyse_file',
+                    return_value=None) as mock_analyse:
+        for request in requests:
+            context.langServer._endpoint.consume(request)
+        assert context.langServer._scheduler.wait(60)
+    context.analyse_file = mock_analyse
+
+
+@then('coala should analyse the unsaved content')
+def step_impl(context):
+    # the line local bears may only get the changed lines
+    contents = [kwargs['content']
+                for _, kwargs in context.analyse_file.call_args_list]
+    assert contents[-2] == ('def test():\n', '  b = 1\n')
+    context.f.close()
+
+
 @then('it should ignore the request')
 def step_impl(context):
     length = context.f.seek(0, os.SEEK_END)
@@ -183,6 +257,167 @@ def step_impl(context):
     context.f.close()
 
 
+@when('I send a lint workspace command to the server')
+def step_impl(context):
+    requests = [{
+        'method': 'initialize',
+        'params': {
+            'rootUri': 'file:///Users/mock-user/project',
+            'capabilities': {},
+        },
+        'id': 1,
+        'jsonrpc': '2.0',
+    }, {
+        'method': 'workspace/executeCommand',
+        'params': {
+            'command': 'coala.lintWorkspace',
+        },
+        'id': 2,
+        'jsonrpc': '2.0',
+    }]
+    files = ['/Users/mock-user/project/a.py',
+             '/Users/mock-user/project/b.py']
+
+    with mock.patch('coala_langserver.coalashim.workspace_files',
+                    return_value=files), \
+            mock.patch('coala_langserver.coalashim.analyse_files',
+                       return_value=[(file, None) for file in files]) \
+            as mock_analyse:
+        for request in requests:
+            context.langServer.consume(request)
+        assert context.langServer._scheduler.wait(60)
+        # wait for the answer of the command
+        context.langServer._endpoint.shutdown()
+    context.analyse_files = mock_analyse
+
+
+@then('it should publish the diagnostics of the workspace files')
+def step_impl(context):
+    # all files are analysed in a single batch
+    assert context.analyse_files.call_count == 1
+
+    context.f.seek(0)
+    published = []
+    answers = []
+
+    def consumer(message):
+        if message.get('method') == 'textDocument/publishDiagnostics':
+            published.append(message['params']['uri'])
+        elif message.get('id') == 2:
+            answers.append(message)
+
+    reader = streams.JsonRpcStreamReader(context.f)
+    reader.listen(consumer)
+    reader.close()
+
+    assert answers == [{'jsonrpc': '2.0', 'id': 2, 'result': None}]
+    assert published == ['file:///Users/mock-user/project/a.py',
+                         'file:///Users/mock-user/project/b.py']
+
+
+@when('I cancel a running lint workspace command')
+def step_impl(context):
+    blocker = Event()
+    started = Event()
+
+    def blocked_files(*args, **kwargs):
+        started.set()
+        blocker.wait(10)
+        return []
+
+    requests = [{
+        'method': 'initialize',
+        'params': {
+            'rootUri': 'file:///Users/mock-user/project',
+            'capabilities': {},
+        },
+        'id': 1,
+        'jsonrpc': '2.0',
+    }, {
+        'method': 'workspace/executeCommand',
+        'params': {
+            'command': 'coala.lintWorkspace',
+        },
+        'id': 2,
+        'jsonrpc': '2.0',
+    }]
+
+    with mock.patch('coala_langserver.coalashim.workspace_files',
+                    side_effect=blocked_files):
+        for request in requests:
+            context.langServer.consume(request)
+        assert started.wait(10)
+        context.langServer.consume({
+            'method': '$/cancelRequest',
+            'params': {'id': 2},
+            'jsonrpc': '2.0',
+        })
+        context.langServer._endpoint.shutdown()
+        blocker.set()
+        assert context.langServer._scheduler.wait(60)
+
+
+@then('the command should be answered as cancelled')
+def step_impl(context):
+    context.f.seek(0)
+    answers = []
+
+    def consumer(message):
+        if message.get('id') == 2:
+            answers.append(message)
+
+    reader = streams.JsonRpcStreamReader(context.f)
+    reader.listen(consumer)
+    reader.close()
+
+    assert answers[0]['error']['code'] == -32800
+    assert context.langServer._scheduler.cancelled == 1
+
+
+@when('I request the stats after a did_save request')
+def step_impl(context):
+    requests = [{
+        'method': 'textDocument/didSave',
+        'params': {
+            'textDocument': {
+                'uri': 'file:///Users/mock-user/project/a.py',
+            },
+        },
+        'jsonrpc': '2.0',
+    }, {
+        'method': '$/coala/stats',
+        'id': 1,
+        'jsonrpc': '2.0',
+    }]
+
+    with mock.patch('coala_langserver.coalashim.analyse_file',
+                    return_value=None):
+        context.langServer.consume(requests[0])
+        assert context.langServer._scheduler.wait(60)
+        context.langServer.consume(requests[1])
+
+
+@then('it should answer the timings of the analysis')
+def step_impl(context):
+    context.f.seek(0)
+    answers = []
+
+    def consumer(message):
+        if message.get('id') == 1:
+            answers.append(message)
+
+    reader = streams.JsonRpcStreamReader(context.f)
+    reader.listen(consumer)
+    reader.close()
+
+    timings = answers[0]['result']['timings']
+    for phase in ('did_save', 'analyse', 'publish', 'latency'):
+        assert timings[phase]['count'] >= 1
+    assert answers[0]['result']['scheduler']['dropped'] == 0
+    # the published diagnostics are kept in the session state
+    assert answers[0]['result']['memory']['session']['entries'] == 1
+
+
 @when('I send a shutdown request to the server')
 def step_impl(context):
     request = {
@@ -214,9 +449,68 @@ def step_impl(context):
     assert context.langServer._shutdown
 
 
-def gen_alt_log(context, mode='tcp'):
+@when('I send a did_save request while coala is still running')
+def step_impl(context):
+    context.analysis_blocker = Event()
+
+    def blocked_run(*args, **kwargs):
+        context.analysis_blocker.wait(10)
+
+    request = {
+        'method': 'textDocument/didSave',
+        'params': {
+            'textDocument': {
+                'uri': 'file:///Users/mock-user/slow.py',
+            },
+        },
+        'jsonrpc': '2.0',
+    }
+    # The analysis is looked up and run by the scheduled job, so the patches
+    # stay active until it finished.
+    context.analysis_patches = [
+        mock.patch('coala_langserver.langserver.analysis_key',
+                   return_value=None),
+        mock.patch('coala_langserver.langserver.diagnose_file',
+                   side_effect=blocked_run),
+    ]
+    for patch in context.analysis_patches:
+        patch.start()
+    context.langServer._endpoint.consume(request)
+
+    request = {
+        'method': 'shutdown',
+        'params': None,
+        'id': 1,
+        'jsonrpc': '2.0',
+    }
+    context.langServer._endpoint.consume(request)
+
+
+@then('it should answer the shutdown request before the analysis finishes')
+def step_impl(context):
+    context.f.seek(0)
+    context._passed = False
+
+    def consumer(response):
+        assert response is not None
+        assert response['result'] is None
+        context._passed = True
+
+    reader = streams.JsonRpcStreamReader(context.f)
+    reader.listen(consumer)
+
+    context.analysis_blocker.set()
+    context.langServer._scheduler.wait(60)
+    for patch in context.analysis_patches:
+        patch.stop()
+    context.f.close()
+
+    assert context._passed
+
+
+def gen_alt_log(context, mode='tcp', port=20801):
     if mode == 'tcp':
-        check = 'Serving LangServer on (0.0.0.0, 20801)\n'
+        check = 'Serving LangServer on (0.0.0.0, {})\n'.format(port)
     elif mode == 'stdio':
         check = 'Starting LangServer IO language server\n'
     else:
@@ -282,7 +576,7 @@ def step_impl(context):
 
     def consumer(response):
         assert response is not None
-        assert response['result']['capabilities']['textDocumentSync'] == 1
+        assert response['result']['capabilities']['textDocumentSync'] == 2
         context.f.close()
         context._passed = True
 
@@ -294,6 +588,66 @@ def step_impl(context):
         assert False
 
 
+@given('the server started in TCP mode on port {port:d}')
+def step_impl(context, port):
+    context._server_alive = False
+
+    with mock.patch('coala_langserver.langserver.log') as mock_log:
+        mock_log.side_effect = gen_alt_log(context, port=port)
+
+        sys.argv = ['', '--mode', 'tcp', '--addr', str(port)]
+        context.thread = Thread(target=main)
+        context.thread.daemon = True
+        context.thread.start()
+
+        for _ in range(20):
+            if context._server_alive:
+                break
+            else:
+                time.sleep(1)
+        else:
+            assert False
+
+    context.port = port
+
+
+@when('two clients connect and the second one sends a initialize request')
+def step_impl(context):
+    context.socks = [socket.create_connection(
+        address=('0.0.0.0', context.port), timeout=10) for _ in range(2)]
+    context.f = context.socks[1].makefile('rwb')
+    context.reader = streams.JsonRpcStreamReader(context.f)
+    writer = streams.JsonRpcStreamWriter(context.f)
+
+    request = {
+        'method': 'initialize',
+        'params': {
+            'rootUri': '/Users/mock-user/mock-dir',
+            'capabilities': {},
+        },
+        'id': 1,
+        'jsonrpc': '2.0',
+    }
+    writer.write(request)
+
+
+@then('the second client should be answered while the first is connected')
+def step_impl(context):
+    context._passed = False
+
+    def consumer(response):
+        assert response['result']['capabilities']['textDocumentSync'] == 2
+        context.f.close()
+        context._passed = True
+
+    context.reader.listen(consumer)
+    context.reader.close()
+    for sock in context.socks:
+        sock.close()
+
+    assert context._passed
+
+
 @given('I send a initialize request via stdio stream')
 def step_impl(context):
     context.f = tempfile.TemporaryFile()
@@ -340,7 +694,7 @@ def step_impl(context):
 
     def consumer(response):
         assert response is not None
-        assert response['result']['capabilities']['textDocumentSync'] == 1
+        assert response['result']['capabilities']['textDocumentSync'] == 2
         context.f.close()
         context._passed = True
 
@@ -0,0 +1,102 @@
+import threading
+import unittest
+from unittest import mock
+
+from coala_langserver.budget import Budget, Quarantine, RunBudget
+from coala_langserver.coalashim import run_local_bears
+
+
+class Bear:
+
+    def __init__(self, name):
+        self.name = name
+
+
+BUDGET = Budget(bear=0.05, run=None, strikes=2, cool_down=60)
+
+
+@mock.patch('coala_langserver.budget.log')
+class QuarantineTestCase(unittest.TestCase):
+
+    def test_strikes_in_a_row(self, mock_log):
+        quarantine = Quarantine()
+        quarantine.timed_out('SlowBear', '/project/a.py', 'config', BUDGET)
+        quarantine.finished('SlowBear', '/project/b.py')
+        self.assertFalse(quarantine.timed_out('SlowBear', '/project/a.py',
+                                              'config', BUDGET))
+        self.assertTrue(quarantine.timed_out('SlowBear', '/project/b.py',
+                                             'config', BUDGET))
+
+        # the bear is disabled for the files with the same extension in the
+        # directory
+        self.assertIsNotNone(quarantine.disabled('SlowBear', '/project/c.py',
+                                                 'config'))
+        self.assertIsNone(quarantine.disabled('SlowBear', '/project/a.txt',
+                                              'config'))
+        self.assertIsNone(quarantine.disabled('SlowBear', '/other/a.py',
+                                              'config'))
+        self.assertEqual(quarantine.stats(), ['SlowBear /project/*.py'])
+
+    def test_enabled_again(self, mock_log):
+        quarantine = Quarantine()
+        for _ in range(2):
+            quarantine.timed_out('SlowBear', '/project/a.py', 'config',
+                                 BUDGET)
+
+        with mock.patch('coala_langserver.budget.time.monotonic',
+                        return_value=10 ** 9):
+            self.assertIsNone(quarantine.disabled('SlowBear',
+                                                  '/project/a.py', 'config'))
+
+    def test_enabled_by_config_change(self, mock_log):
+        quarantine = Quarantine()
+        for _ in range(2):
+            quarantine.timed_out('SlowBear', '/project/a.py', 'config',
+                                 BUDGET)
+
+        self.assertIsNone(quarantine.disabled('SlowBear', '/project/a.py',
+                                              'changed'))
+        self.assertEqual(quarantine.stats(), [])
+
+
+@mock.patch('coala_langserver.budget.log')
+class RunBudgetTestCase(unittest.TestCase):
+
+    def test_timeout(self, mock_log):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        budget = RunBudget(BUDGET, 'config', Quarantine())
+        bear = Bear('SlowBear')
+
+        finished, message = budget.call(bear, '/project/a.py',
+                                        release.wait, 10)
+
+        self.assertFalse(finished)
+        self.assertIn('more than 0.05 seconds', message)
+        # the bear keeps running, so it can't run on other files
+        self.assertEqual(budget.skip(bear, '/project/b.py'),
+                         'Skipped as it still runs on another file.')
+
+    def test_run_budget(self, mock_log):
+        budget = RunBudget(Budget(None, 0, 2, 60), 'config', Quarantine())
+
+        self.assertIn('analysis took more than 0 seconds',
+                      budget.skip(Bear('Bear'), '/project/a.py'))
+
+    @mock.patch('coala_langserver.coalashim.run_local_bear')
+    def test_skipped_bears_get_a_result(self, mock_run, mock_log):
+        quarantine = Quarantine()
+        for _ in range(2):
+            quarantine.timed_out('SlowBear', '/project/a.py', 'config',
+                                 BUDGET)
+        mock_run.return_value = ['result']
+
+        results = run_local_bears([Bear('SlowBear'), Bear('FastBear')],
+                                  '/project/a.py', {}, None,
+                                  budget=RunBudget(BUDGET, 'config',
+                                                   quarantine))
+
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(results[0].origin, 'SlowBear')
+        self.assertIn('Disabled for /project/*.py', results[0].message)
+        self.assertEqual(results[1], 'result')
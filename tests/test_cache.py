@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from coala_langserver.cache import (
+    DiagnosticsCache, analysis_key, diagnostics_size, file_digest,
+    is_config_file)
+
+
+def make_diagnostics(message, count=1):
+    return [{'message': message} for _ in range(count)]
+
+
+class DiagnosticsCacheTestCase(unittest.TestCase):
+
+    def test_discard(self):
+        cache = DiagnosticsCache()
+        cache.put(('/a.py', 'v1'), make_diagnostics('old'))
+        cache.put(('/a.py', 'v2'), make_diagnostics('new'))
+        cache.put(('/b.py', 'v1'), make_diagnostics('other'))
+
+        cache.discard('/a.py')
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, diagnostics_size(
+            make_diagnostics('other')))
+
+    def test_miss_and_hit(self):
+        cache = DiagnosticsCache()
+        self.assertEqual(cache.get('key'), None)
+
+        diagnostics = make_diagnostics('issue')
+        cache.put('key', diagnostics)
+        self.assertEqual(cache.get('key'), diagnostics)
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_no_diagnostics_is_a_hit(self):
+        cache = DiagnosticsCache()
+        cache.put('key', None)
+
+        # a clean file is cached as an empty list
+        self.assertEqual(cache.get('key'), [])
+
+    def test_evict_by_entries(self):
+        cache = DiagnosticsCache(max_entries=2)
+        cache.put('a', make_diagnostics('a'))
+        cache.put('b', make_diagnostics('b'))
+        # touching `a` makes `b` the least recently used entry
+        cache.get('a')
+        cache.put('c', make_diagnostics('c'))
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertNotEqual(cache.get('a'), None)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_evict_by_bytes(self):
+        diagnostics = make_diagnostics('issue', 4)
+        size = diagnostics_size(diagnostics)
+        cache = DiagnosticsCache(max_bytes=size * 2)
+        for key in 'abc':
+            cache.put(key, diagnostics)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()['bytes'], size * 2)
+        self.assertEqual(cache.get('a'), None)
+
+    def test_too_large(self):
+        cache = DiagnosticsCache(max_bytes=1)
+        cache.put('key', make_diagnostics('issue'))
+
+        self.assertEqual(len(cache), 0)
+
+
+class AnalysisKeyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        file = tempfile.NamedTemporaryFile(delete=False)
+        file.write(b'a = 1\n')
+        file.close()
+        self.path = file.name
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_missing_file(self):
+        self.assertEqual(file_digest('/non/existing/file.py'), None)
+        self.assertEqual(analysis_key('/non/existing/file.py'), None)
+
+    @mock.patch('coala_langserver.coalashim.find_config')
+    def test_content_changes_key(self, mock_find):
+        mock_find.return_value = ''
+        key = analysis_key(self.path)
+        self.assertEqual(key, analysis_key(self.path))
+
+        with open(self.path, 'a') as file:
+            file.write('b = 2\n')
+        self.assertNotEqual(key, analysis_key(self.path))
+
+
+class ConfigFileTestCase(unittest.TestCase):
+
+    def test_is_config_file(self):
+        self.assertTrue(is_config_file('/project/.coafile'))
+        self.assertTrue(is_config_file('/home/user/.coarc'))
+        self.assertFalse(is_config_file('/project/a.py'))
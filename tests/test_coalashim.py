@@ -1,7 +1,14 @@
+import sys
+import threading
 import unittest
+from collections import OrderedDict
+from types import SimpleNamespace
 from unittest import mock
 
-from coala_langserver.coalashim import run_coala_with_specific_file
+from coala_langserver.coalashim import (
+    AnalysisCancelled, analyse_file, analyse_files, prewarm,
+    run_coala_on_file, run_coala_with_specific_file, run_local_bears)
+from coala_langserver.log import DEBUG, ERROR
 
 
 def generate_side_effect(message, ret):
@@ -28,7 +35,7 @@ class ShimTestCase(unittest.TestCase):
         output = run_coala_with_specific_file(None, None)
 
         # log is message information
-        mock_log.assert_called_with('Output =', message)
+        mock_log.assert_called_with('Output =', message, level=DEBUG)
         # return value is issue message
         self.assertEqual(message, output)
 
@@ -38,7 +45,8 @@ class ShimTestCase(unittest.TestCase):
         output = run_coala_with_specific_file(None, None)
 
         # log is `no results` reminder
-        mock_log.assert_called_with('No results for the file')
+        mock_log.assert_called_with('No results for the file',
+                                    level=DEBUG)
         # return value is empty string
         self.assertEqual(message, output)
 
@@ -48,7 +56,7 @@ class ShimTestCase(unittest.TestCase):
         output = run_coala_with_specific_file(None, None)
 
         # log is `no issue` reminder
-        mock_log.assert_called_with('No issues found')
+        mock_log.assert_called_with('No issues found', level=DEBUG)
         # return value is None
         self.assertEqual(None, output)
 
@@ -58,7 +66,7 @@ class ShimTestCase(unittest.TestCase):
         output = run_coala_with_specific_file(None, None)
 
         # log is `exit` reminder
-        mock_log.assert_called_with('Exited with:', -1)
+        mock_log.assert_called_with('Exited with:', -1, level=ERROR)
         # return value is None
         self.assertEqual(None, output)
 
@@ -73,3 +81,216 @@ class ShimTestCase(unittest.TestCase):
         working_dir = None
         run_coala_with_specific_file(working_dir, None)
         mock_os.chdir.assert_called_with('.')
+
+
+@mock.patch('coala_langserver.coalashim.log')
+class ReentrantShimTestCase(unittest.TestCase):
+
+    @mock.patch('coala_langserver.coalashim.find_user_config')
+    def test_no_config(self, mock_find, mock_log):
+        mock_find.return_value = ''
+        output = run_coala_on_file('/project/file.py', '/project')
+
+        # config is searched from the project directory
+        mock_find.assert_called_with('/project')
+        # no analysis is run without a coafile
+        self.assertEqual(None, output)
+
+    @mock.patch('coala_langserver.coalashim.find_user_config')
+    def test_config_from_file_dir(self, mock_find, mock_log):
+        mock_find.return_value = ''
+        run_coala_on_file('/project/sub/file.py')
+
+        mock_find.assert_called_with('/project/sub')
+
+    @mock.patch('coala_langserver.coalashim.os.chdir')
+    @mock.patch('coala_langserver.coalashim.section_matches')
+    @mock.patch('coala_langserver.coalashim.analyse_section')
+    @mock.patch('coala_langserver.coalashim.config_cache')
+    @mock.patch('coala_langserver.coalashim.find_user_config')
+    def test_no_global_state(self, mock_find, mock_config, mock_analyse,
+                             mock_matches, mock_chdir, mock_log):
+        mock_find.return_value = '/project/.coafile'
+        section = mock.Mock()
+        section.is_enabled.return_value = True
+        mock_config.get.return_value = ({'python': section},
+                                        {'python': []}, {'python': []}, [])
+        mock_matches.return_value = True
+        mock_analyse.return_value = []
+        argv = list(sys.argv)
+
+        output = run_coala_on_file('/project/file.py', '/project')
+
+        # neither the arguments nor the working directory are changed
+        self.assertEqual(argv, sys.argv)
+        self.assertFalse(mock_chdir.called)
+        # the config found is loaded and the file is passed explicitly
+        self.assertEqual(mock_config.get.call_args[0][0],
+                         '/project/.coafile')
+        self.assertEqual(mock_analyse.call_args[0][3], '/project/file.py')
+        # no results mean no output
+        self.assertEqual(None, output)
+
+    @mock.patch('coala_langserver.coalashim.section_matches')
+    @mock.patch('coala_langserver.coalashim.analyse_section')
+    @mock.patch('coala_langserver.coalashim.config_cache')
+    @mock.patch('coala_langserver.coalashim.find_user_config')
+    def test_unmatched_section(self, mock_find, mock_config, mock_analyse,
+                               mock_matches, mock_log):
+        mock_find.return_value = '/project/.coafile'
+        section = mock.Mock()
+        section.is_enabled.return_value = True
+        mock_config.get.return_value = ({'yml': section},
+                                        {'yml': []}, {'yml': []}, [])
+        mock_matches.return_value = False
+
+        run_coala_on_file('/project/file.py', '/project')
+
+        # sections not selecting the file are not run
+        self.assertFalse(mock_analyse.called)
+
+    @mock.patch('coala_langserver.coalashim.section_matches')
+    @mock.patch('coala_langserver.coalashim.analyse_section')
+    @mock.patch('coala_langserver.coalashim.config_cache')
+    @mock.patch('coala_langserver.coalashim.find_user_config')
+    def test_progress(self, mock_find, mock_config, mock_analyse,
+                      mock_matches, mock_log):
+        mock_find.return_value = '/project/.coafile'
+        section = mock.Mock()
+        section.is_enabled.return_value = True
+        mock_config.get.return_value = (
+            OrderedDict([('pep8', section), ('mypy', section)]),
+            {'pep8': [], 'mypy': []}, {'pep8': [], 'mypy': []}, [])
+        mock_matches.return_value = True
+        mock_analyse.side_effect = [['style'], ['type']]
+        progress = mock.Mock()
+
+        results = analyse_file('/project/file.py', '/project',
+                               progress=progress)
+
+        # the fast section is reported before the slow one finishes, the
+        # last section only with the returned results
+        progress.assert_called_once_with({'pep8': ['style']})
+        self.assertEqual({'pep8': ['style'], 'mypy': ['type']}, results)
+
+        mock_analyse.side_effect = [[], ['type']]
+        progress.reset_mock()
+        analyse_file('/project/file.py', '/project', progress=progress)
+
+        # a section without issues is reported too, its issues are gone
+        progress.assert_called_once_with({'pep8': []})
+
+
+@mock.patch('coala_langserver.coalashim.log')
+class BatchShimTestCase(unittest.TestCase):
+
+    @mock.patch('coala_langserver.coalashim.run_local_bears')
+    @mock.patch('coala_langserver.coalashim.instantiate_bears')
+    @mock.patch('coala_langserver.coalashim.get_file_dict')
+    @mock.patch('coala_langserver.coalashim.section_matches')
+    @mock.patch('coala_langserver.coalashim.config_cache')
+    @mock.patch('coala_langserver.coalashim.find_user_config')
+    def test_analyse_files(self, mock_find, mock_config, mock_matches,
+                           mock_file_dict, mock_instantiate, mock_run,
+                           mock_log):
+        mock_find.return_value = '/project/.coafile'
+        section = mock.Mock()
+        section.is_enabled.return_value = True
+        mock_config.get.return_value = ({'python': section},
+                                        {'python': []}, {'python': []}, [])
+        mock_matches.side_effect = lambda section, file: file.endswith('.py')
+        mock_file_dict.side_effect = lambda files, _: {files[0]: ('a\n',)}
+        mock_instantiate.return_value = ([], [])
+        mock_run.side_effect = lambda bears, file, *_: (
+            [] if file.endswith('b.py') else ['result'])
+
+        analysed = list(analyse_files(['/project/a.py', '/project/b.py',
+                                       '/project/c.yml'], '/project'))
+
+        # config and bears are set up once for the whole batch
+        self.assertEqual(1, mock_find.call_count)
+        self.assertEqual(1, mock_instantiate.call_count)
+        # files no section selects are skipped
+        self.assertEqual([('/project/a.py', {'python': ['result']}),
+                          ('/project/b.py', None)], analysed)
+
+    @mock.patch('coala_langserver.coalashim.run_global_bears')
+    @mock.patch('coala_langserver.coalashim.run_local_bears')
+    @mock.patch('coala_langserver.coalashim.instantiate_bears')
+    @mock.patch('coala_langserver.coalashim.get_file_dict')
+    @mock.patch('coala_langserver.coalashim.section_matches')
+    @mock.patch('coala_langserver.coalashim.config_cache')
+    @mock.patch('coala_langserver.coalashim.find_user_config')
+    def test_skipped_global_bear(self, mock_find, mock_config,
+                                 mock_matches, mock_file_dict,
+                                 mock_instantiate, mock_run, mock_run_global,
+                                 mock_log):
+        mock_find.return_value = '/project/.coafile'
+        section = mock.Mock()
+        section.is_enabled.return_value = True
+        mock_config.get.return_value = ({'python': section},
+                                        {'python': []},
+                                        {'python': ['CPDBear']}, [])
+        mock_matches.return_value = True
+        mock_file_dict.side_effect = lambda files, _: {files[0]: ('a\n',)}
+        mock_instantiate.return_value = ([], [])
+        mock_run.return_value = []
+
+        def run_global_bears(*args, skipped_bears):
+            skipped_bears.append((SimpleNamespace(name='CPDBear'),
+                                  'Skipped'))
+            return []
+        mock_run_global.side_effect = run_global_bears
+
+        analysed = list(analyse_files(['/project/a.py', '/project/b.py'],
+                                      '/project'))
+
+        # each file tells the global bear was skipped on it
+        self.assertEqual(
+            [(file, [(result.origin, result.affected_code[0].file,
+                      result.incomplete)
+                     for result in results['python']])
+             for file, results in analysed[2:]],
+            [('/project/a.py', [('CPDBear', '/project/a.py', True)]),
+             ('/project/b.py', [('CPDBear', '/project/b.py', True)])])
+
+    @mock.patch('coala_langserver.coalashim.run_local_bear')
+    def test_cancel(self, mock_run, mock_log):
+        cancel = threading.Event()
+
+        def run(*args):
+            cancel.set()
+            return ['result']
+        mock_run.side_effect = run
+
+        with self.assertRaises(AnalysisCancelled):
+            run_local_bears([SimpleNamespace(name='FirstBear'),
+                             SimpleNamespace(name='SecondBear')],
+                            '/project/a.py', {}, None, cancel)
+
+        # the bears after the cancellation are not run
+        self.assertEqual(1, mock_run.call_count)
+
+
+class PrewarmTestCase(unittest.TestCase):
+
+    @mock.patch('coala_langserver.coalashim.bear_registry')
+    @mock.patch('coala_langserver.coalashim.config_cache')
+    @mock.patch('coala_langserver.coalashim.find_user_config')
+    def test_loads_project_config(self, mock_find, mock_cache,
+                                  mock_registry):
+        mock_find.return_value = '/project/.coafile'
+        mock_cache.get.return_value = ({}, {}, {}, [])
+
+        prewarm('/project')
+
+        self.assertTrue(mock_registry.registered_dirs.called)
+        self.assertEqual('/project/.coafile', mock_cache.get.call_args[0][0])
+
+    @mock.patch('coala_langserver.coalashim.bear_registry')
+    @mock.patch('coala_langserver.coalashim.find_user_config')
+    def test_without_project(self, mock_find, mock_registry):
+        prewarm()
+
+        self.assertTrue(mock_registry.registered_dirs.called)
+        self.assertFalse(mock_find.called)
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from coalib.settings.Section import Section
+from coalib.settings.Setting import Setting
+
+from coala_langserver.config import ConfigCache, section_matches
+
+
+@mock.patch('coala_langserver.config.log')
+@mock.patch('coala_langserver.config.fill_sections')
+@mock.patch('coala_langserver.config.load_configuration')
+class ConfigCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.config = os.path.join(self.dir.name, '.coafile')
+        with open(self.config, 'w') as file:
+            file.write('[all]\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_loaded_once(self, mock_load, mock_fill, mock_log):
+        mock_load.return_value = ({}, [])
+        mock_fill.return_value = ({}, {})
+        cache = ConfigCache()
+
+        first = cache.get(self.config, None)
+        second = cache.get(self.config, None)
+
+        # the sections are reused as long as the coafile is unchanged
+        self.assertIs(first, second)
+        self.assertEqual(mock_load.call_count, 1)
+
+    def test_reload_on_change(self, mock_load, mock_fill, mock_log):
+        mock_load.return_value = ({}, [])
+        mock_fill.return_value = ({}, {})
+        cache = ConfigCache()
+
+        cache.get(self.config, None)
+        with open(self.config, 'a') as file:
+            file.write('bears = SpaceConsistencyBear\n')
+        cache.get(self.config, None)
+
+        self.assertEqual(mock_load.call_count, 2)
+
+    def test_invalidate(self, mock_load, mock_fill, mock_log):
+        mock_load.return_value = ({}, [])
+        mock_fill.return_value = ({}, {})
+        cache = ConfigCache()
+
+        cache.get(self.config, None)
+        cache.invalidate(self.config)
+        cache.get(self.config, None)
+
+        self.assertEqual(mock_load.call_count, 2)
+
+
+class SectionMatchesTestCase(unittest.TestCase):
+
+    def make_section(self, files, ignore=None):
+        section = Section('python')
+        section.append(Setting('files', files, origin='/project/.coafile'))
+        if ignore is not None:
+            section.append(Setting('ignore', ignore,
+                                   origin='/project/.coafile'))
+        return section
+
+    def test_files(self):
+        section = self.make_section('**.py')
+        self.assertTrue(section_matches(section, '/project/a/b.py'))
+        self.assertFalse(section_matches(section, '/project/a/b.yml'))
+
+    def test_ignore(self):
+        section = self.make_section('**.py', 'vendor/**')
+        self.assertFalse(section_matches(section, '/project/vendor/b.py'))
+
+    def test_no_files(self):
+        self.assertFalse(section_matches(Section('python'), '/project/a.py'))
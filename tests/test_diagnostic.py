@@ -1,7 +1,11 @@
 import os
+import json
 import unittest
+from types import SimpleNamespace
 
-from coala_langserver.diagnostic import output_to_diagnostics
+from coala_langserver.diagnostic import (
+    diagnostics_fingerprint, is_complete, merge_sections, of_sections,
+    output_to_diagnostics, results_to_diagnostics)
 
 
 def get_output(filename):
@@ -13,6 +17,28 @@ def get_output(filename):
     return output
 
 
+def get_results(filename):
+    """
+    Build objects shaped like coala results from a JSON output resource.
+    """
+    def position(value):
+        return SimpleNamespace(line=value['line'], column=value['column'])
+
+    results = {}
+    for section, problems in json.loads(get_output(filename))[
+            'results'].items():
+        results[section] = [
+            SimpleNamespace(
+                origin=problem['origin'],
+                message=problem['message'],
+                severity=problem['severity'],
+                affected_code=[SimpleNamespace(start=position(code['start']),
+                                               end=position(code['end']))
+                               for code in problem['affected_code']])
+            for problem in problems]
+    return results
+
+
 class DiagnosticTestCase(unittest.TestCase):
 
     def test_none_output(self):
@@ -73,3 +99,116 @@ class DiagnosticTestCase(unittest.TestCase):
 
         # should be able to handle multiple bears & problems
         self.assertEqual(len(result), 3)
+
+    def test_ranges_share_the_problem(self):
+        # each affected range is a diagnostic with the message and severity
+        # of its problem
+        for filename in sorted(os.listdir(os.path.join(
+                os.path.dirname(__file__), 'resources/diagnostic'))):
+            output = get_output(filename)
+            expected = [
+                ('[{}] {}: {}'.format(section, problem['origin'],
+                                      problem['message']),
+                 3 - problem['severity'])
+                for section, problems in json.loads(output)[
+                    'results'].items()
+                for problem in problems
+                for _ in problem['affected_code']]
+            self.assertEqual(expected,
+                             [(diagnostic['message'], diagnostic['severity'])
+                              for diagnostic in
+                              output_to_diagnostics(output)])
+
+
+class ResultsDiagnosticTestCase(unittest.TestCase):
+
+    def test_none_results(self):
+        result = results_to_diagnostics(None)
+        self.assertEqual(result, None)
+
+    def test_ranges_of_other_files(self):
+        def code(file, line):
+            position = SimpleNamespace(line=line, column=None)
+            return SimpleNamespace(file=file, start=position, end=position)
+
+        # a global bear reports duplicated code in two files
+        results = {'all': [SimpleNamespace(
+            origin='CPDBear', message='Duplicated code', severity=1,
+            affected_code=[code('/project/a.py', 3),
+                           code('/project/b.py', 7)])]}
+
+        diagnostics = results_to_diagnostics(results, '/project/b.py')
+
+        self.assertEqual([diagnostic['range']['start']['line']
+                          for diagnostic in diagnostics], [6])
+        self.assertEqual(len(results_to_diagnostics(results)), 2)
+
+    def test_incomplete(self):
+        position = SimpleNamespace(line=1, column=None)
+        code = SimpleNamespace(file='/project/a.py', start=position,
+                               end=position)
+        skipped = SimpleNamespace(origin='SlowBear', message='Skipped',
+                                  severity=0, affected_code=[code],
+                                  incomplete=True)
+        result = SimpleNamespace(origin='FastBear', message='Issue',
+                                 severity=1, affected_code=[code])
+
+        self.assertTrue(is_complete(results_to_diagnostics(
+            {'all': [result]})))
+        self.assertFalse(is_complete(results_to_diagnostics(
+            {'all': [result, skipped]})))
+        self.assertTrue(is_complete(None))
+
+    def test_same_as_output(self):
+        # the in-process path matches the JSON fallback
+        for filename in sorted(os.listdir(os.path.join(
+                os.path.dirname(__file__), 'resources/diagnostic'))):
+            self.assertEqual(
+                results_to_diagnostics(get_results(filename)),
+                output_to_diagnostics(get_output(filename)))
+
+
+class FingerprintTestCase(unittest.TestCase):
+
+    def test_fingerprint(self):
+        diagnostics = output_to_diagnostics(
+            get_output('output_multiple_problems.json'))
+        reordered = [dict(reversed(list(diagnostic.items())))
+                     for diagnostic in diagnostics]
+
+        # the key order doesn't matter but the diagnostics do
+        self.assertEqual(diagnostics_fingerprint(diagnostics),
+                         diagnostics_fingerprint(reordered))
+        self.assertNotEqual(diagnostics_fingerprint(diagnostics),
+                            diagnostics_fingerprint(diagnostics[1:]))
+        self.assertEqual(diagnostics_fingerprint(None),
+                         diagnostics_fingerprint([]))
+
+
+class SectionsTestCase(unittest.TestCase):
+
+    def diagnostic(self, message):
+        return {'message': message}
+
+    def test_of_sections(self):
+        diagnostics = [self.diagnostic('[fast] Bear: a'),
+                       self.diagnostic('[fast-too] Bear: b'),
+                       self.diagnostic('[slow] Bear: c')]
+
+        self.assertEqual(of_sections(diagnostics, ['fast']),
+                         diagnostics[:1])
+        self.assertEqual(of_sections(None, ['fast']), [])
+
+    def test_merge_sections(self):
+        previous = [self.diagnostic('[fast] Bear: old'),
+                    self.diagnostic('[slow] Bear: old')]
+
+        # the finished section replaces its diagnostics, the other one
+        # keeps them until it finishes
+        self.assertEqual(
+            merge_sections(previous, [self.diagnostic('[fast] Bear: new')],
+                           ['fast']),
+            [self.diagnostic('[fast] Bear: new'),
+             self.diagnostic('[slow] Bear: old')])
+        self.assertEqual(merge_sections(previous, [], ['fast', 'slow']), [])
+        self.assertEqual(merge_sections(None, [], ['fast']), [])
@@ -0,0 +1,74 @@
+import unittest
+
+from coala_langserver.document import (
+    Document, DocumentStore, split_lines, utf16_index)
+
+
+def make_change(start_line, start_char, end_line, end_char, text):
+    return {
+        'range': {
+            'start': {'line': start_line, 'character': start_char},
+            'end': {'line': end_line, 'character': end_char},
+        },
+        'text': text,
+    }
+
+
+class DocumentTestCase(unittest.TestCase):
+
+    def test_split_lines(self):
+        self.assertEqual(split_lines('a\nb\r\nc\rd'),
+                         ['a\n', 'b\r\n', 'c\r', 'd'])
+        # form feeds are no line breaks for LSP
+        self.assertEqual(split_lines('a\x0cb\n'), ['a\x0cb\n'])
+        self.assertEqual(split_lines(''), [])
+
+    def test_utf16_index(self):
+        self.assertEqual(utf16_index('abc', 2), 2)
+        # characters outside of the BMP take two code units
+        self.assertEqual(utf16_index('\U0001F600ab', 2), 1)
+        self.assertEqual(utf16_index('ab', 10), 2)
+
+    def test_insert(self):
+        document = Document('file:///a.py', 'a = 1\nb = 2\n')
+        document.apply_change(make_change(1, 5, 1, 5, '0'))
+        self.assertEqual(document.text, 'a = 1\nb = 20\n')
+
+    def test_replace_lines(self):
+        document = Document('file:///a.py', 'a = 1\nb = 2\nc = 3\n')
+        document.apply_change(make_change(0, 4, 2, 0, 'x\ny = '))
+        self.assertEqual(document.lines, ['a = x\n', 'y = c = 3\n'])
+
+    def test_append_at_end(self):
+        document = Document('file:///a.py', 'a = 1\n')
+        document.apply_change(make_change(1, 0, 1, 0, 'b = 2\n'))
+        self.assertEqual(document.text, 'a = 1\nb = 2\n')
+
+    def test_full_change(self):
+        document = Document('file:///a.py', 'a = 1\n')
+        document.apply_change({'text': 'b = 2\n'})
+        self.assertEqual(document.text, 'b = 2\n')
+
+    def test_file(self):
+        document = Document('file:///a.py', 'a = 1\r\nb = 2')
+        self.assertEqual(document.file(), ('a = 1\n', 'b = 2'))
+
+
+class DocumentStoreTestCase(unittest.TestCase):
+
+    def test_lifecycle(self):
+        store = DocumentStore()
+        store.open('file:///a.py', 'a = 1\n', 1)
+        self.assertIn('file:///a.py', store)
+
+        document = store.change('file:///a.py',
+                                [make_change(0, 4, 0, 5, '2')], 2)
+        self.assertEqual(document.text, 'a = 2\n')
+        self.assertEqual(document.version, 2)
+
+        store.close('file:///a.py')
+        self.assertNotIn('file:///a.py', store)
+
+    def test_change_not_open(self):
+        store = DocumentStore()
+        self.assertEqual(store.change('file:///a.py', [], 1), None)
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import CancelledError
+from unittest import mock
+
+from coala_langserver.executor import (
+    SupervisedExecutor, create_cancel_event, create_executor, shares_memory)
+
+
+def crash_once(marker):
+    """
+    Kill the worker process the first time it runs.
+    """
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return 'analysed'
+
+
+def crash(delay=0):
+    time.sleep(delay)
+    os._exit(1)
+
+
+def sleep(seconds, cancel=None):
+    time.sleep(seconds)
+    return seconds
+
+
+@mock.patch('coala_langserver.executor.log')
+class SupervisedExecutorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = SupervisedExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_retry_after_crash(self, mock_log):
+        marker = os.path.join(tempfile.mkdtemp(), 'crashed')
+
+        future = self.executor.submit(crash_once, marker)
+
+        self.assertEqual(future.result(60), 'analysed')
+        self.assertEqual(self.executor.restarts, 1)
+
+    def test_fail_after_retries(self, mock_log):
+        future = self.executor.submit(crash)
+
+        with self.assertRaises(Exception):
+            future.result(60)
+        # the executor keeps working after the job gave up
+        self.assertTrue(self.executor.submit(os.getpid).result(60))
+        self.assertEqual(self.executor.restarts, 2)
+
+    def test_crash_with_other_jobs(self, mock_log):
+        executor = SupervisedExecutor(max_workers=3)
+        self.addCleanup(executor.shutdown)
+        innocent = [executor.submit(sleep, 0.5) for _ in range(2)]
+        culprit = executor.submit(crash, 0.1)
+
+        # the jobs in flight when the pool broke run again one at a time,
+        # only the one crashing on its own fails
+        self.assertEqual([future.result(60) for future in innocent],
+                         [0.5, 0.5])
+        with self.assertRaises(Exception):
+            culprit.result(60)
+        self.assertEqual(executor.restarts, 3)
+
+    def test_kill_cancelled_job(self, mock_log):
+        executor = SupervisedExecutor(max_workers=2, cancel_grace=0.1)
+        self.addCleanup(executor.shutdown)
+        cancel = create_cancel_event(executor)
+        hanging = executor.submit(sleep, 60, cancel=cancel)
+        other = executor.submit(sleep, 1)
+        time.sleep(0.5)
+
+        start = time.monotonic()
+        cancel.set()
+
+        # the worker is killed instead of running the job to its end
+        with self.assertRaises(CancelledError):
+            hanging.result(30)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(other.result(30), 1)
+        self.assertEqual(executor.restarts, 1)
+
+    def test_recycle(self, mock_log):
+        self.executor.recycle_after = 1
+
+        first = self.executor.submit(os.getpid).result(60)
+        second = self.executor.submit(os.getpid).result(60)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.executor.recycled, 1)
+
+    def test_shutdown(self, mock_log):
+        self.executor.shutdown()
+
+        with self.assertRaises(RuntimeError):
+            self.executor.submit(os.getpid)
+
+
+class CreateExecutorTestCase(unittest.TestCase):
+
+    def test_process_pool_is_supervised(self):
+        executor = create_executor('process', 1)
+        try:
+            self.assertIsInstance(executor, SupervisedExecutor)
+            self.assertFalse(shares_memory(executor))
+        finally:
+            executor.shutdown()
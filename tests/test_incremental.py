@@ -0,0 +1,98 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from coala_langserver.incremental import (
+    changed_lines, has_ignore_comments, is_line_local, is_whole_file,
+    shift_diagnostics)
+from coala_langserver.langserver import diagnose_document
+
+
+def diagnostic(line, end_line=None, end_character=3):
+    return {'range': {'start': {'line': line, 'character': 1},
+                      'end': {'line': line if end_line is None else end_line,
+                              'character': end_character}},
+            'message': str(line)}
+
+
+def lines(diagnostics):
+    return [diagnostic['range']['start']['line']
+            for diagnostic in diagnostics]
+
+
+class ChangedLinesTestCase(unittest.TestCase):
+
+    def test_replaced(self):
+        self.assertEqual(changed_lines(('a', 'b', 'c'), ('a', 'x', 'c')),
+                         (1, 2, 2))
+
+    def test_inserted(self):
+        self.assertEqual(changed_lines(('a', 'c'), ('a', 'b', 'b', 'c')),
+                         (1, 1, 3))
+
+    def test_removed(self):
+        self.assertEqual(changed_lines(('a', 'b', 'c'), ('a', 'c')),
+                         (1, 2, 1))
+
+    def test_unchanged(self):
+        self.assertEqual(changed_lines(('a', 'b'), ('a', 'b')), (2, 2, 2))
+
+
+class ShiftDiagnosticsTestCase(unittest.TestCase):
+
+    def test_shift(self):
+        diagnostics = [diagnostic(0), diagnostic(2), diagnostic(5)]
+
+        # lines 2 and 3 were replaced by three lines
+        shifted = shift_diagnostics(diagnostics, 2, 4, 5)
+
+        self.assertEqual(lines(shifted), [0, 6])
+        self.assertEqual(shifted[1]['range']['end']['line'], 6)
+        self.assertEqual(diagnostics[2]['range']['start']['line'], 5)
+
+    def test_whole_line_above(self):
+        # a whole line diagnostic ends at the start of the next line
+        diagnostics = [diagnostic(1, 2, 0), diagnostic(1, 2, 1)]
+
+        shifted = shift_diagnostics(diagnostics, 2, 3, 3)
+
+        self.assertEqual(shifted, diagnostics[:1])
+
+
+class IncrementalTestCase(unittest.TestCase):
+
+    def test_is_line_local(self):
+        self.assertTrue(is_line_local(type('LineLengthBear', (), {})))
+        self.assertFalse(is_line_local(type('PEP8Bear', (), {})))
+        self.assertTrue(is_line_local(SimpleNamespace(
+            __name__='MyBear', LINE_LOCAL=True)))
+
+    def test_has_ignore_comments(self):
+        self.assertTrue(has_ignore_comments(['x = 1  # Ignore PEP8Bear\n']))
+        self.assertTrue(has_ignore_comments(['x = 1  # noqa\n']))
+        self.assertFalse(has_ignore_comments(['x = 1\n']))
+
+
+class DiagnoseDocumentTestCase(unittest.TestCase):
+
+    @mock.patch('coala_langserver.langserver.results_to_diagnostics')
+    @mock.patch('coala_langserver.coalashim.analyse_file')
+    def test_changed_lines_only(self, mock_analyse, mock_convert):
+        mock_analyse.side_effect = ['whole file', 'changed lines']
+        mock_convert.side_effect = lambda results: {
+            'whole file': [diagnostic(0)],
+            'changed lines': [diagnostic(0)],
+        }[results]
+        kept = [diagnostic(7)]
+
+        diagnostics, line_local = diagnose_document(
+            '/project/file.py', '/project', ('a', 'b', 'c', 'd'),
+            (2, 3, kept))
+
+        whole_file, changed = mock_analyse.call_args_list
+        self.assertEqual(whole_file[1]['content'], ('a', 'b', 'c', 'd'))
+        self.assertIs(whole_file[1]['bear_filter'], is_whole_file)
+        self.assertEqual(changed[1]['content'], ('c',))
+        self.assertIs(changed[1]['bear_filter'], is_line_local)
+        self.assertEqual(lines(line_local), [7, 2])
+        self.assertEqual(lines(diagnostics), [0, 7, 2])
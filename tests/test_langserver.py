@@ -0,0 +1,334 @@
+import io
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+from coala_langserver.budget import Budget, Quarantine, RunBudget
+from coala_langserver.executor import SupervisedExecutor
+from coala_langserver.document import Document
+from coala_langserver.langserver import (
+    LangServer, diagnose_document, diagnose_files, incremental_change, main)
+
+
+DIAGNOSTICS = [{'message': '[all] Bear: issue'}]
+
+
+def code(file, line):
+    position = SimpleNamespace(line=line, column=None)
+    return SimpleNamespace(file=file, start=position, end=position)
+
+
+class DiagnoseFilesTestCase(unittest.TestCase):
+
+    @mock.patch('coala_langserver.coalashim.analyse_files')
+    def test_result_of_two_files(self, mock_analyse):
+        result = SimpleNamespace(origin='CPDBear', message='Duplicated code',
+                                 severity=1,
+                                 affected_code=[code('/project/a.py', 3),
+                                                code('/project/b.py', 7)])
+        mock_analyse.return_value = [('/project/a.py', {'all': [result]}),
+                                     ('/project/b.py', {'all': [result]})]
+
+        published = diagnose_files(['/project/a.py', '/project/b.py'],
+                                   '/project')
+
+        # each file only gets the ranges in it
+        self.assertEqual([(path, [diagnostic['range']['start']['line']
+                                  for diagnostic in diagnostics])
+                          for path, diagnostics in published],
+                         [('/project/a.py', [2]), ('/project/b.py', [6])])
+
+
+class DiagnoseDocumentTestCase(unittest.TestCase):
+
+    @mock.patch('coala_langserver.coalashim.config_signature',
+                return_value='config')
+    @mock.patch('coala_langserver.coalashim.find_config',
+                return_value='/project/.coafile')
+    @mock.patch('coala_langserver.coalashim.analyse_file', return_value=None)
+    def test_one_run_budget(self, mock_analyse, *_):
+        diagnose_document('/project/a.py', '/project', ('a\n', 'b\n'),
+                          budget=Budget(bear=1, run=2, strikes=1,
+                                        cool_down=60))
+
+        # both passes share the run budget of the document
+        budgets = [call[1]['budget'] for call in mock_analyse.call_args_list]
+        self.assertEqual(len(budgets), 2)
+        self.assertIsInstance(budgets[0], RunBudget)
+        self.assertIs(budgets[0], budgets[1])
+
+
+class IncrementalChangeTestCase(unittest.TestCase):
+
+    def test_config_changed(self):
+        document = Document('file:///project/a.py', 'a\nb\n')
+        document.analysed = (('a\n', 'b\n'), [], 'config')
+
+        self.assertIsNotNone(incremental_change(document, ('a\n', 'c\n'),
+                                                'config'))
+        # the line local bears rerun on all lines with the new configuration
+        self.assertIsNone(incremental_change(document, ('a\n', 'c\n'),
+                                             'changed'))
+
+
+class LangServerTestCase(unittest.TestCase):
+
+    def server(self, **kwargs):
+        server = LangServer(io.BytesIO(), io.BytesIO(), **kwargs)
+        self.addCleanup(server.close)
+        server.m_initialize(rootUri='file:///project')
+        return server
+
+    def test_lint_in_other_processes(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        background_executor = SupervisedExecutor(1)
+        self.addCleanup(background_executor.shutdown)
+        server = self.server(executor=executor,
+                             background_executor=background_executor)
+
+        with mock.patch.object(server._scheduler, 'schedule') as mock_schedule:
+            server.lint(['/project/a.py'])
+
+        # no bound method of the server is handed to the worker processes
+        self.assertIsNone(mock_schedule.call_args[0][4])
+
+    def test_publish_finished_sections(self):
+        server = self.server()
+        previous = [{'message': '[fast] Bear: old'},
+                    {'message': '[slow] Bear: old'}]
+        server.send_diagnostics('/project/a.py', previous)
+
+        with mock.patch.object(server._endpoint, 'notify') as mock_notify:
+            server._publish_sections('/project/a.py',
+                                     [{'message': '[fast] Bear: new'}],
+                                     ['fast'])
+
+        # the slow section keeps its diagnostics until it finishes
+        self.assertEqual(mock_notify.call_args[1]['params']['diagnostics'],
+                         [{'message': '[fast] Bear: new'},
+                          {'message': '[slow] Bear: old'}])
+
+    def test_lint_follow_up(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        server = self.server(executor=executor,
+                             background_executor=executor)
+        started = threading.Event()
+        blocker = threading.Event()
+        batches = []
+
+        def diagnose_files(paths, project_dir, budget, progress, cancel,
+                           idle):
+            batches.append((paths, cancel.is_set()))
+            started.set()
+            blocker.wait(10)
+            return []
+
+        with mock.patch('coala_langserver.langserver.diagnose_files',
+                        diagnose_files), \
+                mock.patch('coala_langserver.coalashim.workspace_files',
+                           return_value=['/project/a.py', '/project/c.py']):
+            workspace = server.lint()
+            self.assertTrue(started.wait(10))
+            changed = [server.lint(['/project/a.py']),
+                       server.lint(['/project/b.py'])]
+            blocker.set()
+            workspace.result(10)
+            for done in changed:
+                done.result(10)
+
+        # the workspace lint isn't restarted, the changed files are linted
+        # after it in one batch
+        self.assertEqual(batches, [
+            (['/project/a.py', '/project/c.py'], False),
+            (['/project/a.py', '/project/b.py'], False)])
+
+    def test_look_up_in_job(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        server = self.server(executor=executor)
+        blocker = threading.Event()
+        executor.submit(blocker.wait, 10)
+        threads = []
+
+        def analysis_key(path, project_dir=None, content=None):
+            threads.append(threading.current_thread())
+
+        with mock.patch('coala_langserver.langserver.analysis_key',
+                        analysis_key), \
+                mock.patch('coala_langserver.langserver.diagnose_file',
+                           return_value=[]):
+            server._analyse('/project/a.py')
+            # the reader thread doesn't compute the key itself
+            self.assertEqual(threads, [])
+            blocker.set()
+            self.assertTrue(server._scheduler.wait(10))
+
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertTrue(threads)
+
+    @mock.patch('coala_langserver.langserver.analysis_key')
+    def test_store_saved_content_only(self, mock_key):
+        server = self.server()
+        server._store = mock.Mock()
+        mock_key.side_effect = lambda path, project_dir=None, content=None: (
+            path, 'saved' if content in (None, ['saved\n']) else 'unsaved')
+
+        server._remember('/project/a.py', ('/project/a.py', 'unsaved'),
+                         DIAGNOSTICS, ['typed\n'])
+        self.assertFalse(server._store.put.called)
+        server._remember('/project/a.py', ('/project/a.py', 'saved'),
+                         DIAGNOSTICS, ['saved\n'])
+
+        # unsaved content is only cached for the session
+        self.assertEqual(server._diagnostics_cache.get(
+            ('/project/a.py', 'unsaved')), DIAGNOSTICS)
+        server._store.put.assert_called_once_with(
+            ('/project/a.py', 'saved'), DIAGNOSTICS)
+
+    @mock.patch('coala_langserver.langserver.analysis_key')
+    def test_lint_remembered_files(self, mock_key):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        server = self.server(executor=executor,
+                             background_executor=executor)
+        server._store = mock.Mock()
+        server._store.get.return_value = None
+        mock_key.side_effect = lambda path, project_dir=None: (path, 'saved')
+        server._diagnostics_cache.put(('/project/a.py', 'saved'), DIAGNOSTICS)
+        batches = []
+
+        def diagnose_files(paths, project_dir, budget, progress, cancel,
+                           idle):
+            batches.append(paths)
+            for path in paths:
+                progress(path, [])
+            return []
+
+        with mock.patch('coala_langserver.langserver.diagnose_files',
+                        diagnose_files), \
+                mock.patch.object(server._endpoint, 'notify') as mock_notify:
+            server.lint(['/project/a.py', '/project/b.py']).result(10)
+
+        # only the file not analysed before is analysed, and written through
+        self.assertEqual(batches, [['/project/b.py']])
+        self.assertEqual(sorted(call[1]['params']['uri']
+                                for call in mock_notify.call_args_list),
+                         ['file:///project/a.py', 'file:///project/b.py'])
+        self.assertEqual(server._diagnostics_cache.get(
+            ('/project/b.py', 'saved')), [])
+        server._store.put.assert_called_once_with(
+            ('/project/b.py', 'saved'), [])
+
+    @mock.patch('coala_langserver.coalashim.log')
+    @mock.patch('coala_langserver.budget.log')
+    @mock.patch('coala_langserver.langserver.analysis_key',
+                return_value=('/project/a.py', 'saved', 'config', 'bears'))
+    @mock.patch('coala_langserver.coalashim.run_local_bear', return_value=[])
+    @mock.patch('coala_langserver.coalashim.instantiate_bears')
+    @mock.patch('coala_langserver.coalashim.get_file_dict',
+                return_value={'/project/a.py': ('a\n',)})
+    @mock.patch('coala_langserver.coalashim.section_matches',
+                return_value=True)
+    @mock.patch('coala_langserver.coalashim.enabled_sections')
+    @mock.patch('coala_langserver.coalashim.config_signature',
+                return_value='config')
+    @mock.patch('coala_langserver.coalashim.find_config',
+                return_value='/project/.coafile')
+    def test_rerun_after_quarantine(self, mock_find, mock_signature,
+                                    mock_sections, mock_matches,
+                                    mock_file_dict, mock_instantiate,
+                                    mock_run, mock_key, *_):
+        budget = Budget(bear=1, run=None, strikes=1, cool_down=60)
+        registry = Quarantine()
+        registry.timed_out('SlowBear', '/project/a.py', 'config', budget)
+        bear = mock.Mock()
+        bear.name = 'SlowBear'
+        mock_sections.return_value = [('all', None, ['SlowBear'], [])]
+        mock_instantiate.return_value = ([bear], [])
+        server = self.server(budget=budget)
+        server._store = mock.Mock()
+        server._store.get.return_value = None
+
+        with mock.patch('coala_langserver.budget.quarantine', registry), \
+                mock.patch.object(server, 'send_diagnostics') as mock_send:
+            server._analyse('/project/a.py')
+            self.assertTrue(server._scheduler.wait(10))
+            self.assertFalse(mock_run.called)
+            self.assertIn('Disabled', mock_send.call_args[0][1][0]['message'])
+
+            with mock.patch('coala_langserver.budget.time.monotonic',
+                            return_value=10 ** 9):
+                server._analyse('/project/a.py')
+                self.assertTrue(server._scheduler.wait(10))
+
+        # the skipped analysis was neither cached nor stored
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertIsNone(mock_send.call_args[0][1])
+        server._store.put.assert_called_once_with(
+            ('/project/a.py', 'saved', 'config', 'bears'), None)
+
+    def test_eviction_keeps_the_cache(self):
+        server = self.server(max_state_bytes=0)
+        server._diagnostics_cache.put(('/project/a.py', 'saved'),
+                                      DIAGNOSTICS)
+
+        server.send_diagnostics('/project/a.py', DIAGNOSTICS)
+        server.send_diagnostics('/project/b.py', DIAGNOSTICS)
+
+        # the state is evicted but the lints still find the diagnostics
+        self.assertGreater(server._state.stats()['evictions'], 0)
+        self.assertEqual(server._diagnostics_cache.get(
+            ('/project/a.py', 'saved')), DIAGNOSTICS)
+
+    @mock.patch('coala_langserver.config.config_cache')
+    def test_reload_config_in_job(self, mock_config_cache):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        server = self.server(executor=executor)
+        server._lint_workspace = True
+        document = SimpleNamespace(analysed=('a\n',))
+        blocker = threading.Event()
+        executor.submit(blocker.wait, 10)
+
+        with mock.patch.object(server, '_documents') as mock_documents, \
+                mock.patch.object(server, 'lint') as mock_lint:
+            mock_documents.uris.return_value = ['file:///project/a.py']
+            mock_documents.get.return_value = document
+            server.m_workspace__did_change_watched_files(
+                [{'uri': 'file:///project/.coafile', 'type': 2}])
+            # the reader thread only resets the documents
+            self.assertIsNone(document.analysed)
+            self.assertFalse(mock_config_cache.invalidate.called)
+            blocker.set()
+            executor.submit(lambda: None).result(10)
+
+        mock_config_cache.invalidate.assert_called_once_with(
+            '/project/.coafile')
+        mock_lint.assert_called_once_with()
+
+
+@mock.patch('coala_langserver.langserver.log')
+@mock.patch('coala_langserver.langserver.configure')
+@mock.patch('coala_langserver.langserver.create_executor')
+@mock.patch('coala_langserver.langserver.serve')
+class MainTestCase(unittest.TestCase):
+
+    def test_serve_again_with_threads(self, mock_serve, *_):
+        mock_serve.side_effect = [RuntimeError('crash'), None]
+
+        with mock.patch('sys.argv', ['coala-langserver']):
+            main()
+
+        self.assertEqual(mock_serve.call_count, 2)
+
+    def test_supervised_processes(self, mock_serve, *_):
+        mock_serve.side_effect = RuntimeError('crash')
+
+        with mock.patch('sys.argv', ['coala-langserver',
+                                     '--executor', 'process']):
+            with self.assertRaises(RuntimeError):
+                main()
@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from coala_langserver import log as log_module
+from coala_langserver.log import DEBUG, WARNING, configure, log, stop
+
+
+class TruncateTestCase(unittest.TestCase):
+
+    def test_short_message(self):
+        self.assertEqual(log_module.truncate('abc', 3), 'abc')
+
+    def test_long_message(self):
+        self.assertEqual(log_module.truncate('abcdef', 2),
+                         'ab... (4 more characters)')
+
+
+class LogTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        stop()
+        log_module.logger.handlers = []
+        log_module.logger.setLevel(WARNING)
+
+    def test_disabled_level_is_not_formatted(self):
+        payload = mock.MagicMock()
+
+        log('Output =', payload, level=DEBUG)
+
+        self.assertFalse(payload.__str__.called)
+
+    def test_configure_destination(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'langserver.log')
+        configure('debug', path, max_length=10)
+
+        log('x' * 20, level=DEBUG)
+        stop()
+
+        with open(path) as file:
+            content = file.read()
+        self.assertIn('DEBUG ' + 'x' * 10 + '... (10 more characters)',
+                      content)
@@ -0,0 +1,65 @@
+import unittest
+from unittest import mock
+
+from coalib.bears.LocalBear import LocalBear
+from coalib.settings.Section import Section
+from coalib.settings.Setting import Setting
+
+from coala_langserver.registry import BearRegistry
+
+
+class SimpleBear(LocalBear):
+    pass
+
+
+class DependentBear(LocalBear):
+    BEAR_DEPS = {SimpleBear}
+
+
+def make_section(bears):
+    section = Section('python')
+    section.append(Setting('bears', bears))
+    return section
+
+
+@mock.patch('coala_langserver.registry.collect_registered_bears_dirs',
+            return_value=[])
+@mock.patch('coala_langserver.registry.collect_bears')
+class BearRegistryTestCase(unittest.TestCase):
+
+    def test_collected_once(self, mock_collect, mock_dirs):
+        mock_collect.return_value = ([SimpleBear], [])
+        registry = BearRegistry()
+
+        registry.get(make_section('SimpleBear'), None)
+        local_bears, global_bears = registry.get(make_section('SimpleBear'),
+                                                 None)
+
+        # the bear modules are only imported for the first section
+        self.assertEqual(mock_collect.call_count, 1)
+        self.assertEqual(mock_dirs.call_count, 1)
+        self.assertEqual(local_bears, [SimpleBear])
+        self.assertEqual(global_bears, [])
+
+    def test_shared_between_sections(self, mock_collect, mock_dirs):
+        mock_collect.side_effect = lambda dirs, globs, kinds, log: (
+            {'SimpleBear': ([SimpleBear], []),
+             'DependentBear': ([DependentBear], [])}[globs[0]])
+        registry = BearRegistry()
+
+        registry.get(make_section('SimpleBear'), None)
+        local_bears, _ = registry.get(
+            make_section('DependentBear, SimpleBear'), None)
+
+        # every bear is imported once, dependencies run first
+        self.assertEqual(mock_collect.call_count, 2)
+        self.assertEqual(local_bears, [SimpleBear, DependentBear])
+
+    def test_returns_copies(self, mock_collect, mock_dirs):
+        mock_collect.return_value = ([SimpleBear], [])
+        registry = BearRegistry()
+
+        registry.get(make_section('SimpleBear'), None)[0].clear()
+
+        self.assertEqual(registry.get(make_section('SimpleBear'), None)[0],
+                         [SimpleBear])
@@ -0,0 +1,237 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from coala_langserver.scheduler import AnalysisScheduler
+
+
+class AnalysisSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.calls = []
+        self.published = []
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+
+    def analyse(self, value, blocker=None, cancel=None):
+        self.calls.append(value)
+        if blocker is not None:
+            blocker.wait(10)
+        return value
+
+    def publish(self, future):
+        self.published.append(future.result())
+
+    def test_debounce_merges_requests(self):
+        scheduler = AnalysisScheduler(self.executor, debounce=0.05)
+        for value in range(3):
+            scheduler.schedule('file.py', self.analyse, (value,),
+                               self.publish)
+        self.assertTrue(scheduler.wait(10))
+
+        # only the last request is analysed
+        self.assertEqual(self.calls, [2])
+        self.assertEqual(self.published, [2])
+
+    def test_requests_while_running(self):
+        scheduler = AnalysisScheduler(self.executor)
+        blocker = threading.Event()
+        scheduler.schedule('file.py', self.analyse, (0, blocker),
+                           self.publish)
+        for value in range(1, 4):
+            scheduler.schedule('file.py', self.analyse, (value,),
+                               self.publish)
+        blocker.set()
+        self.assertTrue(scheduler.wait(10))
+
+        # requests during the run are merged into one follow-up run and the
+        # superseded result is dropped
+        self.assertEqual(self.calls, [0, 3])
+        self.assertEqual(self.published, [3])
+        self.assertEqual(scheduler.dropped, 1)
+
+    def test_documents_are_independent(self):
+        scheduler = AnalysisScheduler(self.executor)
+        scheduler.schedule('a.py', self.analyse, ('a',), self.publish)
+        scheduler.schedule('b.py', self.analyse, ('b',), self.publish)
+        self.assertTrue(scheduler.wait(10))
+
+        self.assertEqual(sorted(self.published), ['a', 'b'])
+
+    def test_supersede(self):
+        scheduler = AnalysisScheduler(self.executor)
+        blocker = threading.Event()
+        scheduler.schedule('file.py', self.analyse, (0, blocker),
+                           self.publish)
+        scheduler.supersede('file.py')
+        blocker.set()
+        self.assertTrue(scheduler.wait(10))
+
+        self.assertEqual(self.published, [])
+
+    def test_progress_of_superseded_run(self):
+        scheduler = AnalysisScheduler(self.executor)
+        started = threading.Event()
+        blocker = threading.Event()
+        progress = []
+
+        def analyse(progress):
+            progress('first')
+            started.set()
+            blocker.wait(10)
+            progress('second')
+
+        scheduler.schedule('file.py', analyse, (), self.publish,
+                           progress.append)
+        self.assertTrue(started.wait(10))
+        scheduler.supersede('file.py')
+        blocker.set()
+        self.assertTrue(scheduler.wait(10))
+
+        # progress is reported until the run is superseded
+        self.assertEqual(progress, ['first'])
+
+    def test_supersede_all(self):
+        scheduler = AnalysisScheduler(self.executor)
+        blocker = threading.Event()
+        scheduler.schedule('a.py', self.analyse, ('a', blocker),
+                           self.publish)
+        scheduler.schedule('b.py', self.analyse, ('b', blocker),
+                           self.publish)
+        scheduler.supersede_all()
+        blocker.set()
+        self.assertTrue(scheduler.wait(10))
+
+        self.assertEqual(self.published, [])
+
+    def test_cancel_running(self):
+        scheduler = AnalysisScheduler(self.executor,
+                                      cancel_factory=threading.Event)
+        started = threading.Event()
+        cancelled = []
+
+        def analyse(value, cancel):
+            started.set()
+            cancelled.append(cancel.wait(10))
+            return value
+
+        scheduler.schedule('file.py', analyse, (0,), self.publish)
+        self.assertTrue(started.wait(10))
+        scheduler.schedule('file.py', self.analyse, (1,), self.publish)
+        self.assertTrue(scheduler.wait(10))
+
+        # the newer request interrupts the running analysis
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(self.published, [1])
+        self.assertEqual(scheduler.cancelled, 1)
+
+    def test_background_yields(self):
+        background_executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(background_executor.shutdown)
+        scheduler = AnalysisScheduler(self.executor,
+                                      cancel_factory=threading.Event,
+                                      background_executor=background_executor)
+        started = threading.Event()
+        resume = threading.Event()
+        paused = threading.Event()
+        blocker = threading.Event()
+        idle_states = []
+
+        def lint(cancel, idle):
+            started.set()
+            resume.wait(10)
+            idle_states.append(idle.is_set())
+            paused.set()
+            idle_states.append(idle.wait(10))
+            return 'lint'
+
+        scheduler.schedule('lint', lint, (), self.publish, background=True)
+        self.assertTrue(started.wait(10))
+        scheduler.schedule('file.py', self.analyse, ('file', blocker),
+                           self.publish)
+        resume.set()
+        self.assertTrue(paused.wait(10))
+        blocker.set()
+        self.assertTrue(scheduler.wait(10))
+
+        # the lint waits until the interactive analysis finished
+        self.assertEqual(idle_states, [False, True])
+        self.assertEqual(self.published, ['file', 'lint'])
+        self.assertEqual(scheduler.preempted, 1)
+
+    def test_background_executor(self):
+        background_executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(background_executor.shutdown)
+        scheduler = AnalysisScheduler(self.executor,
+                                      background_executor=background_executor)
+        analysed = threading.Event()
+        blocker = threading.Event()
+
+        def analyse(value):
+            analysed.set()
+            return value
+
+        scheduler.schedule('lint', self.analyse, ('lint', blocker),
+                           self.publish, background=True)
+        scheduler.schedule('other', self.analyse, ('other', blocker),
+                           self.publish, background=True)
+        scheduler.schedule('file.py', analyse, ('file',), self.publish)
+
+        # the busy background worker doesn't hold up the other analyses
+        self.assertTrue(analysed.wait(10))
+        self.assertEqual(self.calls, ['lint'])
+        blocker.set()
+        self.assertTrue(scheduler.wait(10))
+        self.assertEqual(self.calls, ['lint', 'other'])
+
+    def test_background_cancel_factory(self):
+        class BackgroundEvent(threading.Event):
+            pass
+
+        scheduler = AnalysisScheduler(
+            self.executor, cancel_factory=threading.Event,
+            background_cancel_factory=BackgroundEvent)
+        events = []
+
+        def analyse(cancel, idle=None):
+            events.append((type(cancel), type(idle)))
+
+        scheduler.schedule('lint', analyse, (), self.publish,
+                           background=True)
+        self.assertTrue(scheduler.wait(10))
+        scheduler.schedule('file.py', analyse, (), self.publish)
+        self.assertTrue(scheduler.wait(10))
+
+        # the events fit the executor each run is submitted to
+        self.assertEqual(events, [(BackgroundEvent, BackgroundEvent),
+                                  (threading.Event, type(None))])
+
+    def test_background_follow_up(self):
+        scheduler = AnalysisScheduler(self.executor,
+                                      cancel_factory=threading.Event)
+        started = threading.Event()
+        blocker = threading.Event()
+        cancelled = []
+
+        def lint(value, cancel, idle):
+            started.set()
+            blocker.wait(10)
+            cancelled.append(cancel.is_set())
+            return value
+
+        scheduler.schedule('lint', lint, ('all',), self.publish,
+                           background=True)
+        self.assertTrue(started.wait(10))
+        for value in ('a.py', 'b.py'):
+            scheduler.schedule('lint', lint, (value,), self.publish,
+                               background=True)
+        blocker.set()
+        self.assertTrue(scheduler.wait(10))
+
+        # the running lint finishes and the requests made meanwhile follow
+        # it in one run
+        self.assertEqual(cancelled, [False, False])
+        self.assertEqual(self.published, ['all', 'b.py'])
+        self.assertEqual(scheduler.dropped, 0)
@@ -0,0 +1,68 @@
+import unittest
+
+from coala_langserver.diagnostic import diagnostics_size
+from coala_langserver.state import ENTRY_SIZE, SessionState, resident_memory
+
+
+def entry_size(uri, document_size=0):
+    return ENTRY_SIZE + len(uri) + document_size
+
+
+class SessionStateTestCase(unittest.TestCase):
+
+    def test_fingerprint(self):
+        state = SessionState()
+        self.assertEqual(state.fingerprint('file:///a'), None)
+
+        state.published('file:///a', b'digest')
+
+        self.assertEqual(state.fingerprint('file:///a'), b'digest')
+        self.assertEqual(state.size, entry_size('file:///a'))
+
+    def test_diagnostics(self):
+        state = SessionState()
+        diagnostics = [{'message': 'issue'}]
+
+        state.published('file:///a', b'digest', diagnostics)
+
+        self.assertEqual(state.diagnostics('file:///a'), diagnostics)
+        self.assertEqual(state.size, entry_size('file:///a') +
+                         diagnostics_size(diagnostics))
+
+        state.published('file:///a', b'other')
+
+        # only the fingerprint is kept now
+        self.assertIsNone(state.diagnostics('file:///a'))
+        self.assertEqual(state.size, entry_size('file:///a'))
+
+    def test_evict_least_recently_used(self):
+        evicted = []
+        state = SessionState(2 * entry_size('file:///a'), evicted.append)
+        state.published('file:///a', b'a')
+        state.published('file:///b', b'b')
+        # touching `a` makes `b` the least recently used entry
+        state.fingerprint('file:///a')
+        state.published('file:///c', b'c')
+
+        self.assertEqual(evicted, ['file:///b'])
+        self.assertNotIn('file:///b', state)
+        self.assertEqual(state.stats()['evictions'], 1)
+
+    def test_open_documents_are_kept(self):
+        evicted = []
+        state = SessionState(entry_size('file:///a', 100), evicted.append)
+        state.opened('file:///a', 100)
+        state.published('file:///b', b'b')
+
+        # the open document alone fills the budget
+        self.assertEqual(evicted, ['file:///b'])
+
+        state.opened('file:///a', 1000)
+        state.closed('file:///a')
+
+        # the text of a closed document isn't accounted anymore
+        self.assertEqual(state.size, entry_size('file:///a'))
+        self.assertEqual(state.stats()['open'], 0)
+
+    def test_resident_memory(self):
+        self.assertGreater(resident_memory(), 0)
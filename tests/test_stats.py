@@ -0,0 +1,67 @@
+import threading
+import unittest
+from unittest import mock
+
+from coala_langserver.log import WARNING
+from coala_langserver.stats import (
+    Histogram, Stats, format_snapshot, log_periodically)
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_summary(self):
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.record(value / 100)
+
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['p50'], 0.5)
+        self.assertEqual(summary['p95'], 0.95)
+        self.assertEqual(summary['p99'], 0.99)
+        self.assertEqual(summary['max'], 1.0)
+
+    def test_rolling_window(self):
+        histogram = Histogram(window=2)
+        for value in (10, 1, 2):
+            histogram.record(value)
+
+        summary = histogram.summary()
+        # the percentiles forget old samples, the totals don't
+        self.assertEqual(summary['max'], 2)
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['total'], 13)
+
+
+class StatsTestCase(unittest.TestCase):
+
+    def test_timer_records_on_error(self):
+        stats = Stats()
+        with self.assertRaises(ValueError):
+            with stats.timer('phase'):
+                raise ValueError()
+
+        self.assertEqual(stats.snapshot()['phase']['count'], 1)
+
+    def test_format_snapshot(self):
+        stats = Stats()
+        stats.record('fast', 0.001)
+        stats.record('slow', 0.5)
+
+        line = format_snapshot(stats.snapshot(), limit=1)
+        self.assertEqual(
+            line, 'slow n=1 p50=500.0ms p95=500.0ms max=500.0ms')
+
+    @mock.patch('coala_langserver.stats.log')
+    def test_log_periodically(self, mock_log):
+        stats = Stats()
+        stats.record('phase', 0.001)
+        logged = threading.Event()
+        mock_log.side_effect = lambda *args, **kwargs: logged.set()
+
+        stop = log_periodically(0.01, stats)
+        self.assertTrue(logged.wait(5))
+        stop.set()
+
+        # the line gets through the default log level
+        self.assertEqual(mock_log.call_args[1], {'level': WARNING})
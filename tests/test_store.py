@@ -0,0 +1,118 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from coala_langserver.store import DiagnosticsStore, workspace_store_path
+
+
+def key(path='/project/a.py', digest='digest', config='config'):
+    return path, digest, config, ('0.11.0', None)
+
+
+DIAGNOSTICS = [{'message': 'issue',
+                'range': {'start': {'line': 0, 'character': 0},
+                          'end': {'line': 1, 'character': 0}}}]
+
+
+class DiagnosticsStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = workspace_store_path(self.directory, '/project')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_outlives_the_store(self):
+        store = DiagnosticsStore(self.path)
+        store.put(key(), DIAGNOSTICS)
+        store.close()
+
+        store = DiagnosticsStore(self.path)
+        self.assertEqual(store.get(key()), DIAGNOSTICS)
+        self.assertEqual(store.paths(), ['/project/a.py'])
+        store.close()
+
+    def test_key_mismatch(self):
+        store = DiagnosticsStore(self.path)
+        store.put(key(), DIAGNOSTICS)
+
+        self.assertIsNone(store.get(key(digest='changed')))
+        self.assertIsNone(store.get(key(config='changed')))
+        self.assertEqual(store.stats()['misses'], 2)
+
+        store.discard('/project/a.py')
+        self.assertIsNone(store.get(key()))
+        store.close()
+
+    def test_prune_least_recently_used(self):
+        store = DiagnosticsStore(self.path, max_entries=2)
+        for index in range(3):
+            store.put(key(digest=str(index)), DIAGNOSTICS)
+        store.get(key(digest='0'))
+        store.close()
+
+        store = DiagnosticsStore(self.path)
+        self.assertEqual(store.get(key(digest='0')), DIAGNOSTICS)
+        self.assertIsNone(store.get(key(digest='1')))
+        store.close()
+
+    @mock.patch('coala_langserver.store.log')
+    def test_replace_corrupt_store(self, mock_log):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as file:
+            file.write('not a database' * 100)
+
+        store = DiagnosticsStore(self.path)
+        store.put(key(), DIAGNOSTICS)
+
+        self.assertEqual(store.get(key()), DIAGNOSTICS)
+        self.assertTrue(mock_log.called)
+        store.close()
+
+    @mock.patch('coala_langserver.store.log')
+    def test_failure_disables_the_store(self, mock_log):
+        store = DiagnosticsStore(self.path)
+        store._connection.close()
+
+        store.put(key(), DIAGNOSTICS)
+
+        self.assertIsNone(store.get(key()))
+        self.assertFalse(store.stats()['enabled'])
+        self.assertTrue(mock_log.called)
+
+
+class RestoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @mock.patch('coala_langserver.langserver.analysis_key')
+    def test_restore_unchanged_files(self, mock_key):
+        from coala_langserver.langserver import LangServer
+
+        server = LangServer(io.BytesIO(), io.BytesIO(),
+                            cache_dir=self.directory)
+        server.m_initialize(rootUri='file:///project')
+        server._store.put(key(), DIAGNOSTICS)
+        server._store.put(key('/project/changed.py'), DIAGNOSTICS)
+        server._store.put(key('/project/deleted.py'), DIAGNOSTICS)
+        mock_key.side_effect = {
+            '/project/a.py': key(),
+            '/project/changed.py': key('/project/changed.py', 'changed'),
+            '/project/deleted.py': None,
+        }.get
+
+        with mock.patch.object(server, 'send_diagnostics') as mock_send:
+            server._restore()
+
+        mock_send.assert_called_once_with('/project/a.py', DIAGNOSTICS)
+        self.assertEqual(sorted(server._store.paths()),
+                         ['/project/a.py', '/project/changed.py'])
+        server.close()
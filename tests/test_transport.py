@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from coala_langserver.transport import (
+    AsyncStreamFile, read_message, serve_stream)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def stream_of(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+class ReadMessageTestCase(unittest.TestCase):
+
+    def read_all(self, data):
+        async def read():
+            reader = stream_of(data)
+            bodies = []
+            while True:
+                body = await read_message(reader)
+                if body is None:
+                    return bodies
+                bodies.append(body)
+        return run(read())
+
+    def test_messages(self):
+        data = (b'Content-Length: 2\r\n\r\n{}'
+                b'Content-Type: application/vscode-jsonrpc\r\n'
+                b'content-length: 7\r\n\r\n{"a":1}')
+        self.assertEqual([b'{}', b'{"a":1}'], self.read_all(data))
+
+    def test_truncated_body(self):
+        self.assertEqual([], self.read_all(b'Content-Length: 9\r\n\r\n{}'))
+
+
+class AsyncStreamFileTestCase(unittest.TestCase):
+
+    def test_writes_are_coalesced(self):
+        async def write():
+            writer = mock.Mock()
+            writer.transport.is_closing.return_value = False
+            wfile = AsyncStreamFile(writer, asyncio.get_event_loop())
+            for data in (b'a', b'b', b'c'):
+                wfile.write(data)
+                wfile.flush()
+            await asyncio.sleep(0)
+            return writer
+
+        writer = run(write())
+
+        writer.write.assert_called_once_with(b'abc')
+
+    def test_serve_stream(self):
+        server = mock.Mock()
+        data = b'Content-Length: 2\r\n\r\n{}Content-Length: 1\r\n\r\n{'
+
+        async def serve():
+            writer = mock.Mock()
+            writer.transport.is_closing.return_value = False
+            await serve_stream(lambda rx, tx: server, stream_of(data),
+                               writer)
+
+        with mock.patch('coala_langserver.transport.log'):
+            run(serve())
+
+        # invalid messages are skipped and the session is closed at the end
+        server.consume.assert_called_once_with({})
+        self.assertTrue(server.close.called)